@@ -4,15 +4,22 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from sqlalchemy.orm import DeclarativeBase
 from datetime import timedelta
+from observability import instrument, configure_logging
+from api.encoding import init_encoding
+from group_commit import GroupCommitWriter
+from db_routing import replica_binds, init_routing
+from api.sharding import ShardedSession, shard_binds
+import sqlite_profile
 import os
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': ShardedSession})
 jwt = JWTManager()
 
 def create_app():
+    configure_logging()
     app = Flask(__name__)
     
     session_secret = os.environ.get("SESSION_SECRET")
@@ -25,6 +32,9 @@ def create_app():
         "pool_recycle": 300,
         "pool_pre_ping": True,
     }
+    # Optional read replica for listings and progress (DATABASE_REPLICA_URL) and
+    # patient-keyed shards for session data (SHARD_URLS)
+    app.config["SQLALCHEMY_BINDS"] = {**replica_binds(), **shard_binds()}
     
     jwt_secret = os.environ.get("JWT_SECRET_KEY")
     if not jwt_secret:
@@ -34,6 +44,21 @@ def create_app():
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
     app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=30)
     
+    # Session metrics retention: per-minute rollups after N days, archive files after M months
+    app.config["RETENTION_ROLLUP_DAYS"] = int(os.environ.get("RETENTION_ROLLUP_DAYS", 30))
+    app.config["RETENTION_ARCHIVE_MONTHS"] = int(os.environ.get("RETENTION_ARCHIVE_MONTHS", 6))
+    app.config["RETENTION_BATCH_SIZE"] = int(os.environ.get("RETENTION_BATCH_SIZE", 200))
+    app.config["RETENTION_VACUUM_PAGES"] = int(os.environ.get("RETENTION_VACUUM_PAGES", 2000))
+    app.config["METRICS_ARCHIVE_DIR"] = os.environ.get("METRICS_ARCHIVE_DIR", "metrics_archive")
+    
+    # Responses of at least this many bytes are gzipped for clients that accept it
+    app.config["GZIP_MIN_BYTES"] = int(os.environ.get("GZIP_MIN_BYTES", 1024))
+    app.config["GZIP_LEVEL"] = int(os.environ.get("GZIP_LEVEL", 5))
+    
+    # Every row is a scrypt hash (~125 ms of CPU) on the request: keep an upload
+    # well inside the worker timeout; `flask import-patients` handles larger files
+    app.config["PATIENT_IMPORT_MAX_ROWS"] = int(os.environ.get("PATIENT_IMPORT_MAX_ROWS", 100))
+    
     repl_slug = os.environ.get("REPL_SLUG", "")
     repl_owner = os.environ.get("REPL_OWNER", "")
     
@@ -54,24 +79,48 @@ def create_app():
     CORS(app, 
          resources={r"/api/*": {"origins": allowed_origins}},
          supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization"],
+         allow_headers=["Content-Type", "Authorization", "If-None-Match", "If-Modified-Since", "X-Last-Write"],
+         expose_headers=["ETag", "Last-Modified", "X-Request-ID", "X-Last-Write"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
     
+    sqlite_profile.install()
     db.init_app(app)
     jwt.init_app(app)
+    instrument(app, 'api')
+    init_encoding(app)
+    # Token clients have no cookie: the last write travels in the X-Last-Write header
+    init_routing(app, sticky='header')
     
     with app.app_context():
-        from api import models
-        db.create_all()
+        from api import models, sharding
+        # Production schemas are created by the explicit migrate step (migrate_db.py)
+        if os.environ.get("APP_ENV", "development") != "production":
+            db.create_all()
+            for shard in sharding.SHARDS:
+                sharding.create_shard_tables(db.engines[sharding.bind_key(shard)])
+        
+        if sharding.SHARDING_ENABLED:
+            # Session and assessment ids must stay unique across shards
+            sharding.install_id_allocation()
+        
+        # Live-session metric rows are committed in batches by one writer per process
+        app.extensions['metric_writer'] = GroupCommitWriter(db.engine, models.SessionMetrics.__table__)
     
+    from api.health import health_bp
     from api.auth import auth_bp
     from api.patients import patients_bp
     from api.sessions import sessions_bp
     from api.assessments import assessments_bp
+    from api.sync import sync_bp
     
+    app.register_blueprint(health_bp, url_prefix='/api/health')
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(patients_bp, url_prefix='/api/patients')
     app.register_blueprint(sessions_bp, url_prefix='/api/sessions')
     app.register_blueprint(assessments_bp, url_prefix='/api/assessments')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    
+    from api.commands import register_commands
+    register_commands(app)
     
     return app
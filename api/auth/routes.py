@@ -3,6 +3,9 @@ from flask_jwt_extended import create_access_token, create_refresh_token, jwt_re
 from api.auth import auth_bp
 from api import db
 from api.models import User, PatientProfile, ClinicianProfile
+from api.conditional import conditional, current_user_version
+from api.identity import current_identity, identity_claims, token_identity
+from password_hashing import HashingBusy
 import logging
 
 @auth_bp.route('/register', methods=['POST'])
@@ -52,8 +55,8 @@ def register():
         
         db.session.commit()
         
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
+        access_token = create_access_token(identity=token_identity(user), additional_claims=identity_claims(user))
+        refresh_token = create_refresh_token(identity=token_identity(user))
         
         return jsonify({
             'message': 'User registered successfully',
@@ -62,6 +65,9 @@ def register():
             'refresh_token': refresh_token
         }), 201
         
+    except HashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         logging.error(f"Registration error: {str(e)}")
@@ -82,8 +88,16 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid username or password'}), 401
         
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
+        if user.password_needs_rehash():
+            # Hash parameters changed since this password was stored
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashingBusy:
+                db.session.rollback()
+        
+        access_token = create_access_token(identity=token_identity(user), additional_claims=identity_claims(user))
+        refresh_token = create_refresh_token(identity=token_identity(user))
         
         profile = None
         if user.user_type == 'patient' and user.patient_profile:
@@ -99,6 +113,8 @@ def login():
             'refresh_token': refresh_token
         }), 200
         
+    except HashingBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logging.error(f"Login error: {str(e)}")
         return jsonify({'error': 'Login failed'}), 500
@@ -106,16 +122,20 @@ def login():
 @auth_bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
-    current_user_id = get_jwt_identity()
-    access_token = create_access_token(identity=current_user_id)
+    user = User.query.get(int(get_jwt_identity()))
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    access_token = create_access_token(identity=token_identity(user), additional_claims=identity_claims(user))
     return jsonify({'access_token': access_token}), 200
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@conditional(current_user_version)
 def get_current_user():
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = User.query.get(current_identity().user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -0,0 +1,145 @@
+import click
+from api import db
+
+
+def register_commands(app):
+    @app.cli.command('retention')
+    @click.option('--max-batches', type=int, default=None, help='Stop each tier after this many batches.')
+    @click.option('--enable-incremental-vacuum', is_flag=True,
+                  help='Convert the SQLite file to auto_vacuum=INCREMENTAL first (one full VACUUM).')
+    def retention_command(max_batches, enable_incremental_vacuum):
+        """Downsample old session metrics and archive cold sessions."""
+        from api.retention import run_retention, enable_incremental_vacuum as enable_vacuum
+        from api.sharding import each_shard, use_shard
+        
+        if enable_incremental_vacuum:
+            for shard in each_shard():
+                with use_shard(shard):
+                    enable_vacuum()
+        
+        totals = run_retention(max_batches=max_batches)
+        click.echo(f"Archived {totals['archive']} sessions, rolled up {totals['rollup']} sessions")
+    
+    @app.cli.command('import-patients')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--clinician', 'clinician_username', required=True, help='Username of the clinician to assign.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), default=None,
+                  help='Input format (default: from the file extension).')
+    @click.option('--batch-size', type=int, default=500, help='Rows inserted per transaction.')
+    @click.option('--workers', type=int, default=None, help='Hashing processes (default: all cores).')
+    @click.option('--report', type=click.Path(dir_okay=False), default=None,
+                  help='Write created rows (with generated passwords) and errors as JSON.')
+    def import_patients_command(path, clinician_username, fmt, batch_size, workers, report):
+        """Bulk-create patient accounts from a CSV or JSON file."""
+        from api.models import User
+        from api.patients.importer import parse_rows, import_patients
+        from password_hashing import HashingService, password_hasher
+        import json
+        import os
+        
+        clinician = User.query.filter_by(username=clinician_username, user_type='clinician').first()
+        if clinician is None:
+            raise click.ClickException(f"No clinician named {clinician_username}")
+        
+        fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'json')
+        with open(path, 'rb') as f:
+            rows = parse_rows(f.read(), fmt)
+        
+        # Offline: use every core rather than the web process's share
+        hasher = HashingService(
+            method=password_hasher.method,
+            workers=workers or os.cpu_count() or 1,
+            queue_depth=0,
+            timeout=password_hasher.timeout
+        )
+        try:
+            created, errors = import_patients(rows, clinician.id, batch_size=batch_size, hasher=hasher)
+        finally:
+            hasher.shutdown()
+        
+        if report:
+            with open(report, 'w') as f:
+                json.dump({'created': created, 'errors': errors}, f, indent=2)
+        else:
+            for entry in created:
+                if 'password' in entry:
+                    click.echo(f"row {entry['row']}: {entry['username']} password {entry['password']}")
+        for error in errors:
+            click.echo(f"row {error['row']}: {error['error']}", err=True)
+        click.echo(f"Imported {len(created)} patients, {len(errors)} rows rejected")
+    
+    @app.cli.command('trend-backfill')
+    @click.option('--patient', 'patient_ids', type=int, multiple=True, help='Only this patient (repeatable).')
+    def trend_backfill_command(patient_ids):
+        """Rebuild patient trend statistics from their completed sessions."""
+        from api.models import PatientProfile
+        from api.patients.trends import rebuild_trend_stats
+        
+        if not patient_ids:
+            patient_ids = db.session.execute(db.select(PatientProfile.id).order_by(PatientProfile.id)).scalars().all()
+        
+        replayed = 0
+        for patient_id in patient_ids:
+            replayed += rebuild_trend_stats(patient_id)
+            db.session.commit()
+        click.echo(f"Rebuilt trends of {len(patient_ids)} patients from {replayed} sessions")
+    
+    @app.cli.command('session-features-backfill')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: all cores).')
+    @click.option('--batch-size', type=int, default=200, help='Sessions per query and transaction.')
+    @click.option('--force', is_flag=True, help='Also recompute sessions that already have features.')
+    def session_features_backfill_command(workers, batch_size, force):
+        """Compute summary features of sessions completed before they were stored."""
+        from api.sessions.series import backfill_features
+        import os
+        
+        updated = backfill_features(workers=workers or os.cpu_count() or 1, batch_size=batch_size, force=force)
+        click.echo(f"Stored features of {updated} sessions")
+    
+    @app.cli.command('shard-status')
+    def shard_status_command():
+        """Show how many patients each shard holds and how many the ring would move."""
+        from api.models import ShardAssignment
+        from api.sharding import SHARDS, SHARDING_ENABLED, planned_moves
+        
+        if not SHARDING_ENABLED:
+            raise click.ClickException("Sharding is off (SHARD_URLS is not set)")
+        
+        counts = dict(db.session.execute(
+            db.select(ShardAssignment.shard, db.func.count()).group_by(ShardAssignment.shard)
+        ).all())
+        for shard in sorted(set(SHARDS) | set(counts)):
+            note = '' if shard in SHARDS else '  (not in SHARD_URLS)'
+            click.echo(f"{shard}: {counts.get(shard, 0)} patients{note}")
+        click.echo(f"{len(planned_moves())} patients to move")
+    
+    @app.cli.command('shard-rebalance')
+    @click.option('--unassigned-on', 'unassigned_on', default=None,
+                  help='First record patients without a directory entry as living on this shard.')
+    @click.option('--limit', type=int, default=None, help='Move at most this many patients.')
+    @click.option('--force', is_flag=True, help='Also move patients with a session in progress.')
+    @click.option('--dry-run', is_flag=True, help='Only list the moves.')
+    def shard_rebalance_command(unassigned_on, limit, force, dry_run):
+        """Move patients' session data to the shards the hash ring assigns them."""
+        from api.sharding import SHARDS, SHARDING_ENABLED, adopt_unassigned, planned_moves, rebalance
+        
+        if not SHARDING_ENABLED:
+            raise click.ClickException("Sharding is off (SHARD_URLS is not set)")
+        
+        if unassigned_on:
+            if unassigned_on not in SHARDS:
+                raise click.ClickException(f"No shard named {unassigned_on}")
+            click.echo(f"Recorded {adopt_unassigned(unassigned_on)} patients on {unassigned_on}")
+        
+        moves = planned_moves()[:limit]
+        unknown = {source for _, source, _ in moves} - set(SHARDS)
+        if unknown:
+            raise click.ClickException(f"Directory references shards missing from SHARD_URLS: {', '.join(sorted(unknown))}")
+        if dry_run:
+            for patient_id, source, target in moves:
+                click.echo(f"patient {patient_id}: {source} -> {target}")
+            click.echo(f"{len(moves)} patients to move")
+            return
+        
+        moved = rebalance(moves, force=force, log=click.echo)
+        click.echo(f"Moved {len(moved)} of {len(moves)} patients")
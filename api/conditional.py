@@ -0,0 +1,160 @@
+from flask import request, make_response
+from functools import wraps
+from datetime import datetime, timedelta
+from api import db
+from api.models import User, PatientProfile, ClinicianProfile, TherapySession, BaselineAssessment
+from api.identity import current_identity
+from api.sharding import SHARDING_ENABLED, patient_shard
+import hashlib
+import logging
+
+
+def conditional(version_func):
+    """Answer conditional GETs from a cheap version lookup.
+
+    version_func receives the view arguments and returns (tag_parts,
+    last_modified), or None when the caller may not see the resource.
+    last_modified may be None when the version is not purely time-based; the
+    response then carries no Last-Modified and If-Modified-Since is ignored.
+    The view only runs when the client's copy is stale; on None it runs as usual
+    and produces its own error response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = version_func(**kwargs)
+            except Exception as e:
+                logging.error(f"Version lookup error: {str(e)}")
+                version = None
+
+            if version is None:
+                return view(*args, **kwargs)
+
+            tag_parts, last_modified = version
+            etag = hashlib.sha1(repr(tag_parts).encode()).hexdigest()[:20]
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+
+            if response.status_code in (200, 304):
+                response.set_etag(etag, weak=True)
+                if last_modified:
+                    response.last_modified = last_modified
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def _latest(*timestamps):
+    present = [t for t in timestamps if t is not None]
+    return max(present) if present else None
+
+def _patient_version_row(patient_id, *columns):
+    identity = current_identity()
+    if identity.role == 'patient' and patient_id != identity.patient_id:
+        return None
+
+    # Session data on a shard cannot join the profile: read it separately
+    row = db.session.execute(
+        db.select(
+            PatientProfile.id,
+            PatientProfile.user_id,
+            PatientProfile.assigned_clinician_id,
+            PatientProfile.updated_at,
+            *([] if SHARDING_ENABLED else columns)
+        ).where(PatientProfile.id == patient_id)
+    ).first()
+
+    if row is None:
+        return None
+    if identity.role == 'clinician' and row.assigned_clinician_id != identity.user_id:
+        return None
+    if identity.role not in ('patient', 'clinician'):
+        return None
+    if SHARDING_ENABLED and columns:
+        with patient_shard(patient_id):
+            row = (*row, *db.session.execute(db.select(*columns)).first())
+    return row
+
+def _completed_session_stats(patient_id, *conditions):
+    """Scalar subqueries for the count and latest end time of completed sessions"""
+    where = (TherapySession.patient_id == patient_id, TherapySession.completed == True, *conditions)
+    return (
+        db.select(db.func.count(TherapySession.id)).where(*where).scalar_subquery(),
+        db.select(db.func.max(TherapySession.end_time)).where(*where).scalar_subquery()
+    )
+
+def patient_detail_version(patient_id):
+    """Version of GET /api/patients/<id>: profile edits and completed sessions"""
+    row = _patient_version_row(patient_id, *_completed_session_stats(patient_id))
+    if row is None:
+        return None
+
+    updated_at, session_count, last_completed = row[3], row[4], row[5]
+    return ('patient', patient_id, updated_at, session_count, last_completed), _latest(updated_at, last_completed)
+
+def assessments_version(patient_id):
+    """Version of GET /api/assessments/patient/<id>: assessments are append-only"""
+    row = _patient_version_row(
+        patient_id,
+        db.select(db.func.count(BaselineAssessment.id)).where(
+            BaselineAssessment.patient_id == patient_id
+        ).scalar_subquery(),
+        db.select(db.func.max(BaselineAssessment.created_at)).where(
+            BaselineAssessment.patient_id == patient_id
+        ).scalar_subquery()
+    )
+    if row is None:
+        return None
+
+    assessment_count, last_created = row[4], row[5]
+    return ('assessments', patient_id, assessment_count, last_created), last_created
+
+def progress_version(patient_id):
+    """Version of GET /api/assessments/progress/<id>.
+
+    The chart covers a rolling 30-day window, so the number of completed
+    sessions inside the window is part of the tag and sessions ageing out of
+    it change the version too. No timestamp moves when a session ages out,
+    so there is no Last-Modified and only If-None-Match is answered.
+    """
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    window_count, _ = _completed_session_stats(patient_id, TherapySession.start_time >= thirty_days_ago)
+    _, last_completed = _completed_session_stats(patient_id)
+    row = _patient_version_row(patient_id, window_count, last_completed)
+    if row is None:
+        return None
+
+    updated_at, window_count, last_completed = row[3], row[4], row[5]
+    return ('progress', patient_id, updated_at, window_count, last_completed), None
+
+def current_user_version():
+    """Version of GET /api/auth/me: the user row plus any profile edits"""
+    current_user_id = current_identity().user_id
+    row = db.session.execute(
+        db.select(
+            User.user_type,
+            User.created_at,
+            PatientProfile.id,
+            PatientProfile.updated_at,
+            ClinicianProfile.id
+        ).outerjoin(
+            PatientProfile, PatientProfile.user_id == User.id
+        ).outerjoin(
+            ClinicianProfile, ClinicianProfile.user_id == User.id
+        ).where(User.id == current_user_id)
+    ).first()
+    if row is None:
+        return None
+
+    return ('me', current_user_id, *row), _latest(row[1], row[3])
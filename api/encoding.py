@@ -0,0 +1,64 @@
+"""Response encoding: a faster JSON provider and gzip for large bodies.
+
+orjson is used when installed (it is optional); otherwise the stdlib
+encoder runs without key sorting or ASCII escaping, which is most of the
+cost of Flask's default provider. Bodies of at least GZIP_MIN_BYTES are
+gzipped for clients that accept it.
+"""
+from flask import request, current_app
+from flask.json.provider import DefaultJSONProvider
+import gzip
+import json
+
+try:
+    import orjson
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            body = orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        else:
+            body = self.dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _gzip_response(response):
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or 'Content-Encoding' in response.headers
+        or 'gzip' not in request.headers.get('Accept-Encoding', '')
+    ):
+        return response
+
+    config = current_app.config
+    body = response.get_data()
+    if len(body) < config['GZIP_MIN_BYTES']:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=config['GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def init_encoding(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(_gzip_response)
@@ -0,0 +1,14 @@
+from flask import jsonify
+from api.health import health_bp
+from api import db
+import logging
+
+@health_bp.route('', methods=['GET'])
+def health():
+    """Liveness plus one database round-trip; also used to warm new workers"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return jsonify({'status': 'ok'}), 200
+    except Exception as e:
+        logging.error(f"Health check error: {str(e)}")
+        return jsonify({'status': 'unavailable'}), 503
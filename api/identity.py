@@ -0,0 +1,113 @@
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from collections import namedtuple
+from api import db
+from api.models import User, PatientProfile, ClinicianProfile, TherapySession
+from api.sharding import SHARDING_ENABLED, locate_sessions
+
+Identity = namedtuple('Identity', ['user_id', 'role', 'patient_id', 'clinician_id'])
+
+
+def identity_claims(user):
+    """Claims embedded in access tokens so handlers can authorize without loading the user"""
+    return {
+        'role': user.user_type,
+        'patient_id': user.patient_profile.id if user.patient_profile else None,
+        'clinician_id': user.clinician_profile.id if user.clinician_profile else None
+    }
+
+def token_identity(user):
+    return str(user.id)
+
+def current_identity():
+    """Identity of the authenticated caller, decoded once per request from the token claims"""
+    if 'identity' not in g:
+        user_id = int(get_jwt_identity())
+        claims = get_jwt()
+
+        if 'role' in claims:
+            g.identity = Identity(user_id, claims['role'], claims.get('patient_id'), claims.get('clinician_id'))
+        else:
+            # Tokens issued before claims were embedded: one lookup
+            row = db.session.execute(
+                db.select(User.user_type, PatientProfile.id, ClinicianProfile.id).outerjoin(
+                    PatientProfile, PatientProfile.user_id == User.id
+                ).outerjoin(
+                    ClinicianProfile, ClinicianProfile.user_id == User.id
+                ).where(User.id == user_id)
+            ).first()
+            g.identity = Identity(user_id, *row) if row else Identity(user_id, None, None, None)
+    return g.identity
+
+def can_view_patient(patient_profile):
+    """Authorization check against an already loaded PatientProfile, no query"""
+    identity = current_identity()
+    if identity.role == 'patient':
+        return patient_profile.id == identity.patient_id
+    if identity.role == 'clinician':
+        return patient_profile.assigned_clinician_id == identity.user_id
+    return False
+
+def authorize_patient(patient_id):
+    """Return an error response if the caller may not touch patient X, else None.
+
+    Patients are answered from their token claims; clinicians need one
+    primary-key lookup of the assignment.
+    """
+    identity = current_identity()
+    if identity.role == 'patient':
+        if patient_id != identity.patient_id:
+            return jsonify({'error': 'Access denied'}), 403
+        return None
+
+    row = db.session.execute(
+        db.select(PatientProfile.assigned_clinician_id).where(PatientProfile.id == patient_id)
+    ).first()
+    if row is None:
+        return jsonify({'error': 'Patient not found'}), 404
+    if identity.role != 'clinician' or row.assigned_clinician_id != identity.user_id:
+        return jsonify({'error': 'Access denied'}), 403
+    return None
+
+def session_owners(session_ids):
+    """(session_id, patient_id, assigned_clinician_id) for each existing session.
+
+    One join query, or with sharding a lookup on the shards and one on the
+    primary's profiles.
+    """
+    if not SHARDING_ENABLED:
+        return db.session.execute(
+            db.select(TherapySession.id, TherapySession.patient_id, PatientProfile.assigned_clinician_id).join(
+                PatientProfile, TherapySession.patient_id == PatientProfile.id
+            ).where(TherapySession.id.in_(session_ids))
+        ).all()
+
+    located = locate_sessions(session_ids)
+    if not located:
+        return []
+    clinicians = dict(db.session.execute(
+        db.select(PatientProfile.id, PatientProfile.assigned_clinician_id).where(
+            PatientProfile.id.in_(set(located.values()))
+        )
+    ).all())
+    return [
+        (session_id, patient_id, clinicians[patient_id])
+        for session_id, patient_id in located.items() if patient_id in clinicians
+    ]
+
+def authorize_session(session_id, patient_only=False):
+    """Return an error response if the caller may not touch session Y, else None"""
+    identity = current_identity()
+    if patient_only and identity.role != 'patient':
+        return jsonify({'error': 'Only patients can modify sessions'}), 403
+
+    owners = session_owners([session_id])
+    if not owners:
+        return jsonify({'error': 'Session not found'}), 404
+    _, patient_id, clinician_id = owners[0]
+
+    if identity.role == 'patient' and patient_id == identity.patient_id:
+        return None
+    if identity.role == 'clinician' and clinician_id == identity.user_id:
+        return None
+    return jsonify({'error': 'Access denied'}), 403
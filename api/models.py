@@ -1,7 +1,8 @@
 from datetime import datetime
 from api import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import password_hasher
 import json
+import trend_stats
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -19,10 +20,13 @@ class User(db.Model):
     clinician_profile = db.relationship('ClinicianProfile', backref='user', uselist=False)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -60,6 +64,8 @@ class PatientProfile(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by ChangeLog.record on any write to the patient's data; keys cached page fragments
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     sessions = db.relationship('TherapySession', backref='patient', lazy=True)
     
@@ -104,6 +110,9 @@ class ClinicianProfile(db.Model):
 
 class TherapySession(db.Model):
     __tablename__ = 'therapy_sessions'
+    __table_args__ = (
+        db.Index('ix_therapy_sessions_patient_start', 'patient_id', 'start_time', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_profiles.id'), nullable=False)
@@ -123,6 +132,16 @@ class TherapySession(db.Model):
     cognitive_load_level = db.Column(db.Integer)
     emotional_response = db.Column(db.String(20))
     generated_beat_url = db.Column(db.String(500))
+    metrics_tier = db.Column(db.String(10))
+    
+    # Summary of the metric samples, computed when the session completes (session_features.py)
+    sample_count = db.Column(db.Integer)
+    active_seconds = db.Column(db.Float)
+    mean_sync_accuracy = db.Column(db.Float)  # time-weighted
+    time_in_sync_seconds = db.Column(db.Float)
+    adjustment_count = db.Column(db.Integer)
+    tempo_stddev = db.Column(db.Float)  # tempo stability, lower is steadier
+    time_to_target_seconds = db.Column(db.Float)
     
     metrics_data = db.Column(db.Text)
     
@@ -134,6 +153,10 @@ class TherapySession(db.Model):
             return json.loads(self.metrics_data)
         return {}
     
+    def set_features(self, features):
+        for column, value in features.items():
+            setattr(self, column, value)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -152,11 +175,22 @@ class TherapySession(db.Model):
             'speech_clarity_score': self.speech_clarity_score,
             'cognitive_load_level': self.cognitive_load_level,
             'emotional_response': self.emotional_response,
-            'generated_beat_url': self.generated_beat_url
+            'generated_beat_url': self.generated_beat_url,
+            'metrics_tier': self.metrics_tier,
+            'sample_count': self.sample_count,
+            'active_seconds': self.active_seconds,
+            'mean_sync_accuracy': self.mean_sync_accuracy,
+            'time_in_sync_seconds': self.time_in_sync_seconds,
+            'adjustment_count': self.adjustment_count,
+            'tempo_stddev': self.tempo_stddev,
+            'time_to_target_seconds': self.time_to_target_seconds
         }
 
 class SessionMetrics(db.Model):
     __tablename__ = 'session_metrics'
+    __table_args__ = (
+        db.Index('ix_session_metrics_session_ts', 'session_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), nullable=False)
@@ -177,6 +211,22 @@ class SessionMetrics(db.Model):
             'adjustment_made': self.adjustment_made
         }
 
+class SessionMetricsRollup(db.Model):
+    __tablename__ = 'session_metrics_rollup'
+    __table_args__ = (
+        db.Index('ix_session_metrics_rollup_session_minute', 'session_id', 'minute'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), nullable=False)
+    minute = db.Column(db.DateTime, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    avg_bpm = db.Column(db.Float, nullable=False)
+    min_bpm = db.Column(db.Float)
+    max_bpm = db.Column(db.Float)
+    avg_accuracy = db.Column(db.Float)
+    adjustments = db.Column(db.Integer)
+
 class BaselineAssessment(db.Model):
     __tablename__ = 'baseline_assessments'
     
@@ -201,3 +251,118 @@ class BaselineAssessment(db.Model):
             'assessed_by': self.assessed_by,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_clinician_seq', 'clinician_id', 'seq'),
+        db.Index('ix_change_log_patient_seq', 'patient_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    seq = db.Column(db.Integer, primary_key=True)  # monotonic change sequence number
+    entity_type = db.Column(db.String(20), nullable=False)  # 'patient', 'session', 'assessment'
+    entity_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    clinician_id = db.Column(db.Integer)  # caseload the change belongs to, None for unassigned patients
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def record(cls, entity_type, entity_id, patient_id, clinician_id):
+        """Log a write in the current transaction so delta-sync clients pick it up"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # Serialize writers until commit so sequence numbers become visible in order
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(290417)'))
+        entry = cls(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            patient_id=patient_id,
+            clinician_id=clinician_id
+        )
+        db.session.add(entry)
+        # Invalidates the patient's cached page fragments; updated_at keeps the last profile edit
+        db.session.execute(
+            db.update(PatientProfile).where(PatientProfile.id == patient_id).values(
+                data_version=PatientProfile.data_version + 1,
+                updated_at=PatientProfile.updated_at
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        return entry
+    
+    @classmethod
+    def record_many(cls, entity_type, entities, clinician_id):
+        """Log several (entity_id, patient_id) writes in one insert, see record()"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(290417)'))
+        db.session.execute(db.insert(cls), [
+            {'entity_type': entity_type, 'entity_id': entity_id, 'patient_id': patient_id, 'clinician_id': clinician_id}
+            for entity_id, patient_id in entities
+        ])
+
+def _insert_ignoring_conflicts(table, bind):
+    """INSERT that skips rows whose primary key already exists (SQLite and PostgreSQL)"""
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+class PatientTrendStats(db.Model):
+    """Running accuracy and tempo statistics of a patient's completed sessions (see trend_stats.py)"""
+    __tablename__ = 'patient_trend_stats'
+    
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient_profiles.id'), primary_key=True, autoincrement=False)
+    session_type = db.Column(db.String(50), primary_key=True)  # a session type, or 'all'
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_session_at = db.Column(db.DateTime)
+    last_session_at = db.Column(db.DateTime)
+    
+    # Welford moments of days since the first session, and per series its mean,
+    # squared deviations, co-moment with the days and fast/slow weighted averages
+    days_mean = db.Column(db.Float, nullable=False, default=0.0)
+    days_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_mean = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_cov = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_fast = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_slow = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_mean = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_cov = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_fast = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_slow = db.Column(db.Float, nullable=False, default=0.0)
+    
+    @classmethod
+    def record(cls, patient_id, session_type, completed_at, accuracy, bpm):
+        """Fold a completed session into the patient's rows for its type and for all sessions"""
+        for key in (session_type, trend_stats.ALL):
+            stats = db.session.get(cls, (patient_id, key), with_for_update=True)
+            if stats is None:
+                # Concurrent first completions both get here: the loser's insert is a no-op
+                # and it folds its session into the winner's row
+                db.session.execute(
+                    _insert_ignoring_conflicts(cls.__table__, db.session.get_bind(mapper=cls.__mapper__)).values(
+                        patient_id=patient_id, session_type=key, **trend_stats.initial_state()
+                    )
+                )
+                stats = db.session.get(cls, (patient_id, key), with_for_update=True)
+            trend_stats.observe(stats, completed_at, accuracy, bpm)
+    
+    def to_dict(self):
+        return trend_stats.summary(self)
+
+class ShardAssignment(db.Model):
+    """Directory of which shard holds a patient's session data (see api/sharding.py)"""
+    __tablename__ = 'shard_directory'
+    
+    patient_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(50), nullable=False)
+    assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdAllocation(db.Model):
+    """Next free id of tables whose rows are spread over shards"""
+    __tablename__ = 'id_allocations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,33 @@
+from datetime import datetime
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(start_time, row_id):
+    """Encode the (start_time, id) of the last row on a page as an opaque cursor"""
+    payload = json.dumps([start_time.isoformat() if start_time else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor back into (start_time, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(start_time), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def keyset_before(time_column, id_column, cursor):
+    """Filter for rows strictly after the cursor in (time DESC, id DESC) order.
+
+    The leading `time <= ts` term keeps the predicate a plain index range scan,
+    so a deep page costs the same as the first one.
+    """
+    start_time, row_id = decode_cursor(cursor)
+    return (time_column <= start_time) & ((time_column < start_time) | (id_column < row_id))
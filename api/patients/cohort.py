@@ -0,0 +1,131 @@
+from api import db
+from api.models import TherapySession
+from api.sharding import fan_out
+from datetime import datetime, timedelta
+import numpy as np
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _load_sessions(patient_ids, since):
+    """Completed sessions of the caseload since a date as (patient_id, start_time, accuracy, bpm) rows"""
+    return fan_out(lambda ids: db.session.execute(
+        db.select(
+            TherapySession.patient_id,
+            TherapySession.start_time,
+            TherapySession.accuracy_score,
+            db.func.coalesce(TherapySession.final_bpm, TherapySession.initial_bpm)
+        ).where(
+            TherapySession.patient_id.in_(ids),
+            TherapySession.completed == True,
+            TherapySession.start_time >= since
+        )
+    ).all(), patient_ids)
+
+def _group_sums(index, values, count):
+    return np.bincount(index, weights=values, minlength=count)
+
+def _or_none(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+def cohort_analytics(profiles, days, now=None):
+    """Caseload overview from one bulk load of completed sessions.
+
+    profiles are (patient_id, baseline_cadence, target_cadence) rows. For
+    each patient over the last `days` days: session count and sessions per
+    week, mean accuracy, the least-squares accuracy trend in points per week,
+    the latest tempo and how far it has moved from baseline_cadence towards
+    target_cadence (0 at baseline, 1 on target). Every per-patient figure is
+    a grouped sum over the session arrays (np.bincount); Python only loops
+    to serialise the result.
+    """
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=days)
+    weeks = days / 7
+
+    patient_ids = np.array([p[0] for p in profiles], dtype=np.int64)
+    baseline = np.array([np.nan if p[1] is None else p[1] for p in profiles], dtype=np.float64)
+    target = np.array([np.nan if p[2] is None else p[2] for p in profiles], dtype=np.float64)
+    count = len(patient_ids)
+
+    rows = _load_sessions(patient_ids.tolist(), since) if count else []
+    if rows:
+        pid_col, start_col, acc_col, bpm_col = zip(*rows)
+        lookup = np.argsort(patient_ids)
+        index = lookup[np.searchsorted(patient_ids, pid_col, sorter=lookup)]
+        start = np.array(start_col, dtype='datetime64[us]')
+        days_in = (start - np.datetime64(since, 'us')) / np.timedelta64(1, 'D')
+        accuracy = np.array([np.nan if a is None else a for a in acc_col], dtype=np.float64)
+        bpm = np.array([np.nan if b is None else b for b in bpm_col], dtype=np.float64)
+
+        # Patient-major, oldest first: each patient's last row holds the latest tempo
+        order = np.lexsort((days_in, index))
+        index, days_in, accuracy, bpm = index[order], days_in[order], accuracy[order], bpm[order]
+    else:
+        index = np.empty(0, dtype=np.int64)
+        days_in = accuracy = bpm = np.empty(0, dtype=np.float64)
+
+    sessions = np.bincount(index, minlength=count)
+
+    # Accuracy mean and least-squares slope over the sessions that recorded one
+    scored = ~np.isnan(accuracy)
+    s_index, x, y = index[scored], days_in[scored], accuracy[scored]
+    n = np.bincount(s_index, minlength=count).astype(np.float64)
+    sum_x = _group_sums(s_index, x, count)
+    sum_y = _group_sums(s_index, y, count)
+    sum_xx = _group_sums(s_index, x * x, count)
+    sum_xy = _group_sums(s_index, x * y, count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_accuracy = sum_y / n
+        spread = n * sum_xx - sum_x * sum_x
+        slope = np.where((n >= 2) & (spread > 1e-9), (n * sum_xy - sum_x * sum_y) / spread, np.nan)
+    accuracy_trend = slope * 7
+
+    latest_bpm = np.full(count, np.nan)
+    if len(index):
+        last = np.flatnonzero(np.append(index[1:] != index[:-1], True))
+        latest_bpm[index[last]] = bpm[last]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        span = target - baseline
+        bpm_progress = np.where(np.abs(span) > 1e-9, (latest_bpm - baseline) / span, np.nan)
+
+    sessions_per_week = sessions / weeks
+
+    metrics = {
+        'sessions_per_week': sessions_per_week,
+        'avg_accuracy': avg_accuracy,
+        'accuracy_trend': accuracy_trend,
+        'bpm_progress': bpm_progress
+    }
+    distribution = {}
+    for name, values in metrics.items():
+        present = values[~np.isnan(values)]
+        distribution[name] = {
+            f'p{q}': _or_none(v) for q, v in zip(PERCENTILES, np.percentile(present, PERCENTILES))
+        } if len(present) else None
+
+    patients = [
+        {
+            'patient_id': int(patient_ids[i]),
+            'sessions': int(sessions[i]),
+            'sessions_per_week': _or_none(sessions_per_week[i]),
+            'avg_accuracy': _or_none(avg_accuracy[i]),
+            'accuracy_trend': _or_none(accuracy_trend[i]),
+            'latest_bpm': _or_none(latest_bpm[i]),
+            'baseline_cadence': _or_none(baseline[i]),
+            'target_cadence': _or_none(target[i]),
+            'bpm_progress': _or_none(bpm_progress[i])
+        }
+        for i in range(count)
+    ]
+
+    return {
+        'window_days': days,
+        'patients': patients,
+        'caseload': {
+            'patients': count,
+            'active_patients': int(np.count_nonzero(sessions)),
+            'sessions': int(sessions.sum()),
+            'percentiles': distribution
+        }
+    }
@@ -0,0 +1,198 @@
+"""Bulk patient import for onboarding a clinic.
+
+Rows are validated up front, username and email collisions are found with
+set-based queries, passwords are hashed across the hashing pool, and users,
+profiles and change-log entries are inserted in batches. Problems are
+reported per row without aborting the rest of the import.
+"""
+from sqlalchemy.exc import IntegrityError
+from api import db
+from api.models import User, PatientProfile, ChangeLog
+from password_hashing import password_hasher
+import csv
+import io
+import json
+import secrets
+
+REQUIRED_FIELDS = ['username', 'email', 'first_name', 'last_name', 'condition']
+STROKE_FIELDS = [
+    'stroke_affected_side', 'stroke_severity', 'aphasia_type', 'dysarthria_severity',
+    'motor_impairment_level', 'cognitive_status', 'emotional_status', 'preferred_music_genre'
+]
+BASELINE_FIELDS = [
+    'baseline_cadence', 'target_cadence', 'baseline_tapping_speed', 'baseline_speech_rate', 'target_speech_rate'
+]
+DEFAULT_BATCH_SIZE = 500
+LOOKUP_CHUNK = 500
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_rows(payload, fmt):
+    """Parse a CSV (header row) or JSON (list, or {"patients": [...]}) upload into row dicts"""
+    if isinstance(payload, bytes):
+        try:
+            payload = payload.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFormatError('File must be UTF-8 encoded')
+
+    if fmt == 'csv':
+        return [dict(row) for row in csv.DictReader(io.StringIO(payload))]
+
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid JSON: {str(e)}")
+    if isinstance(data, dict):
+        data = data.get('patients')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ImportFormatError('Expected a list of patients or {"patients": [...]}')
+    return data
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def _number(row, field, default):
+    value = _clean(row.get(field))
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+
+def _build(row):
+    """Validate one row into (user values, profile values, generated password or None)"""
+    missing = [field for field in REQUIRED_FIELDS if not _clean(row.get(field))]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+    user = {field: _clean(row[field]) for field in ['username', 'email', 'first_name', 'last_name']}
+    user['user_type'] = 'patient'
+    password = _clean(row.get('password'))
+    generated = None
+    if password is None:
+        password = generated = secrets.token_urlsafe(9)
+    user['password'] = str(password)
+
+    # Every profile carries the same keys so the batch inserts as one executemany
+    profile = {'condition': _clean(row['condition']), 'preferred_beat_sound': 'metronome'}
+    profile.update({field: None for field in STROKE_FIELDS})
+    if profile['condition'] == 'stroke':
+        for field in STROKE_FIELDS:
+            profile[field] = _clean(row.get(field))
+        profile['preferred_beat_sound'] = _clean(row.get('preferred_beat_sound')) or 'metronome'
+        profile['baseline_cadence'] = _number(row, 'baseline_cadence', 120)
+        profile['target_cadence'] = _number(row, 'target_cadence', profile['baseline_cadence'] * 1.1)
+        profile['baseline_tapping_speed'] = _number(row, 'baseline_tapping_speed', 5)
+        profile['baseline_speech_rate'] = _number(row, 'baseline_speech_rate', 150)
+        profile['target_speech_rate'] = _number(row, 'target_speech_rate', profile['baseline_speech_rate'] * 1.15)
+    else:
+        for field in BASELINE_FIELDS:
+            profile[field] = _number(row, field, None)
+
+    return user, profile, generated
+
+def _existing(column, values):
+    """Which of the values are already taken, in a few IN queries"""
+    values = list(values)
+    taken = set()
+    for i in range(0, len(values), LOOKUP_CHUNK):
+        taken.update(db.session.execute(
+            db.select(column).where(column.in_(values[i:i + LOOKUP_CHUNK]))
+        ).scalars())
+    return taken
+
+def _insert_batch(batch, clinician_id):
+    user_ids = db.session.execute(
+        db.insert(User).returning(User.id, sort_by_parameter_order=True),
+        [user for _, user, _, _ in batch]
+    ).scalars().all()
+
+    profile_ids = db.session.execute(
+        db.insert(PatientProfile).returning(PatientProfile.id, sort_by_parameter_order=True),
+        [
+            {**profile, 'user_id': user_id, 'assigned_clinician_id': clinician_id}
+            for (_, _, profile, _), user_id in zip(batch, user_ids)
+        ]
+    ).scalars().all()
+
+    ChangeLog.record_many('patient', [(pid, pid) for pid in profile_ids], clinician_id)
+
+    created = []
+    for (index, user, _, generated), user_id, patient_id in zip(batch, user_ids, profile_ids):
+        entry = {'row': index, 'username': user['username'], 'user_id': user_id, 'patient_id': patient_id}
+        if generated:
+            entry['password'] = generated
+        created.append(entry)
+    return created
+
+def import_patients(rows, clinician_id, batch_size=DEFAULT_BATCH_SIZE, hasher=password_hasher):
+    """Create patient accounts assigned to clinician_id.
+
+    Returns (created, errors): created rows carry the new user and patient ids
+    (and the password when one was generated), errors carry the 1-based row
+    number and reason. Raises HashingBusy if the hashing pool is saturated.
+    """
+    errors = []
+    candidates = []
+    seen_usernames, seen_emails = set(), set()
+    for index, row in enumerate(rows, start=1):
+        try:
+            user, profile, generated = _build(row)
+        except ValueError as e:
+            errors.append({'row': index, 'error': str(e)})
+            continue
+        if user['username'] in seen_usernames:
+            errors.append({'row': index, 'error': 'Duplicate username in file'})
+            continue
+        if user['email'] in seen_emails:
+            errors.append({'row': index, 'error': 'Duplicate email in file'})
+            continue
+        seen_usernames.add(user['username'])
+        seen_emails.add(user['email'])
+        candidates.append((index, user, profile, generated))
+
+    taken_usernames = _existing(User.username, seen_usernames)
+    taken_emails = _existing(User.email, seen_emails)
+    valid = []
+    for candidate in candidates:
+        index, user = candidate[0], candidate[1]
+        if user['username'] in taken_usernames:
+            errors.append({'row': index, 'error': 'Username already exists'})
+        elif user['email'] in taken_emails:
+            errors.append({'row': index, 'error': 'Email already exists'})
+        else:
+            valid.append(candidate)
+
+    hashes = hasher.hash_many([user['password'] for _, user, _, _ in valid])
+    for (_, user, _, _), password_hash in zip(valid, hashes):
+        del user['password']
+        user['password_hash'] = password_hash
+
+    created = []
+    for i in range(0, len(valid), batch_size):
+        batch = valid[i:i + batch_size]
+        try:
+            batch_created = _insert_batch(batch, clinician_id)
+            db.session.commit()
+            created.extend(batch_created)
+        except IntegrityError:
+            # Someone registered a colliding account since the pre-check: retry row by row
+            db.session.rollback()
+            for candidate in batch:
+                try:
+                    row_created = _insert_batch([candidate], clinician_id)
+                    db.session.commit()
+                    created.extend(row_created)
+                except IntegrityError:
+                    db.session.rollback()
+                    errors.append({'row': candidate[0], 'error': 'Username or email already exists'})
+
+    errors.sort(key=lambda e: e['row'])
+    return created, errors
@@ -1,18 +1,35 @@
-from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import request, jsonify, Response, stream_with_context, current_app
+from flask_jwt_extended import jwt_required
 from api.patients import patients_bp
 from api import db
-from api.models import User, PatientProfile, ClinicianProfile, TherapySession
+from api.models import User, PatientProfile, ClinicianProfile, TherapySession, ChangeLog, PatientTrendStats
+from api.conditional import conditional, patient_detail_version
+from api.identity import current_identity, can_view_patient, authorize_patient
+from api.pagination import encode_cursor, keyset_before, InvalidCursor
+from api.patients.importer import parse_rows, import_patients, ImportFormatError
+from api.serializers import serializer, parse_fields, column_options, InvalidFields
+from password_hashing import HashingBusy
+from singleflight import SingleFlight
+from api.sharding import patient_sharded, patient_shard, fan_out
+from db_routing import replica_read
+from datetime import datetime
 import logging
 
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+HISTORY_STREAM_BATCH = 500
+COHORT_DEFAULT_DAYS = 90
+COHORT_MAX_DAYS = 365
+
+stats_flights = SingleFlight('patient_stats')
+
 @patients_bp.route('', methods=['POST'])
 @jwt_required()
 def create_patient():
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        identity = current_identity()
         
-        if not current_user or current_user.user_type != 'clinician':
+        if identity.role != 'clinician':
             return jsonify({'error': 'Only clinicians can create patient accounts'}), 403
         
         data = request.get_json()
@@ -47,7 +64,7 @@ def create_patient():
         patient_profile = PatientProfile(
             user_id=user.id,
             condition=condition,
-            assigned_clinician_id=current_user_id
+            assigned_clinician_id=identity.user_id
         )
         
         if condition == 'stroke':
@@ -66,6 +83,8 @@ def create_patient():
             patient_profile.baseline_speech_rate = float(data.get('baseline_speech_rate', 150))
         
         db.session.add(patient_profile)
+        db.session.flush()
+        ChangeLog.record('patient', patient_profile.id, patient_profile.id, identity.user_id)
         db.session.commit()
         
         return jsonify({
@@ -78,32 +97,116 @@ def create_patient():
             }
         }), 201
         
+    except HashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         logging.error(f"Create patient error: {str(e)}")
         return jsonify({'error': 'Failed to create patient'}), 500
 
+@patients_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_patients_route():
+    """Create many patients from a CSV or JSON upload (multipart 'file' or raw body)"""
+    try:
+        identity = current_identity()
+        
+        if identity.role != 'clinician':
+            return jsonify({'error': 'Only clinicians can create patient accounts'}), 403
+        
+        upload = request.files.get('file')
+        if upload:
+            fmt = 'csv' if upload.filename.lower().endswith('.csv') or upload.mimetype == 'text/csv' else 'json'
+            rows = parse_rows(upload.read(), fmt)
+        else:
+            rows = parse_rows(request.get_data(), 'csv' if request.mimetype == 'text/csv' else 'json')
+        
+        max_rows = current_app.config['PATIENT_IMPORT_MAX_ROWS']
+        if len(rows) > max_rows:
+            return jsonify({'error': f'At most {max_rows} patients per upload; larger imports use flask import-patients'}), 413
+        
+        created, errors = import_patients(rows, identity.user_id)
+        
+        return jsonify({
+            'created': created,
+            'errors': errors,
+            'created_count': len(created),
+            'error_count': len(errors)
+        }), 201 if created else 400
+        
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    except HashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Import patients error: {str(e)}")
+        return jsonify({'error': 'Failed to import patients'}), 500
+
+def _caseload_session_stats(patient_ids):
+    """{patient_id: completed session count and last end time}, fanned out over the shards"""
+    if not patient_ids:
+        return {}
+    rows = fan_out(lambda ids: db.session.execute(
+        db.select(
+            TherapySession.patient_id,
+            db.func.count(TherapySession.id),
+            db.func.max(TherapySession.end_time)
+        ).where(
+            TherapySession.patient_id.in_(ids),
+            TherapySession.completed == True
+        ).group_by(TherapySession.patient_id)
+    ).all(), patient_ids)
+    return {
+        patient_id: {'total_sessions': count, 'last_session': last.isoformat() if last else None}
+        for patient_id, count, last in rows
+    }
+
 @patients_bp.route('', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_patients():
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
+        identity = current_identity()
         
-        if current_user.user_type == 'clinician':
-            assigned_patients = PatientProfile.query.filter_by(assigned_clinician_id=current_user_id).all()
-            unassigned_patients = PatientProfile.query.filter_by(assigned_clinician_id=None).all()
+        if identity.role == 'clinician':
+            try:
+                fields = parse_fields(PatientProfile, request.args.get('fields'))
+            except InvalidFields as e:
+                return jsonify({'error': str(e)}), 400
+            
+            options = column_options(PatientProfile, fields, extra=('user_id',))
+            assigned_patients = PatientProfile.query.options(*options).filter_by(
+                assigned_clinician_id=identity.user_id
+            ).all()
+            unassigned_patients = PatientProfile.query.options(*options).filter_by(
+                assigned_clinician_id=None
+            ).all()
+            
+            user_ids = {p.user_id for p in assigned_patients} | {p.user_id for p in unassigned_patients}
+            users = {}
+            if user_ids:
+                users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+            
+            serialize_profile = serializer(PatientProfile, fields)
+            serialize_user = serializer(User)
+            
+            assigned = [
+                {**serialize_profile(p), 'user': serialize_user(users[p.user_id])}
+                for p in assigned_patients
+            ]
+            # ?include=stats adds session counts for the caseload, one query per shard
+            if 'stats' in request.args.get('include', '').split(','):
+                stats = _caseload_session_stats([p.id for p in assigned_patients])
+                for entry in assigned:
+                    entry['stats'] = stats.get(entry['id'], {'total_sessions': 0, 'last_session': None})
             
             return jsonify({
-                'assigned_patients': [
-                    {**p.to_dict(), 'user': User.query.get(p.user_id).to_dict()} 
-                    for p in assigned_patients
-                ],
+                'assigned_patients': assigned,
                 'unassigned_patients': [
-                    {**p.to_dict(), 'user': User.query.get(p.user_id).to_dict()} 
+                    {**serialize_profile(p), 'user': serialize_user(users[p.user_id])}
                     for p in unassigned_patients
                 ]
             }), 200
@@ -114,47 +217,189 @@ def get_patients():
         logging.error(f"Get patients error: {str(e)}")
         return jsonify({'error': 'Failed to get patients'}), 500
 
+@patients_bp.route('/cohort', methods=['GET'])
+@jwt_required()
+@replica_read
+def get_cohort():
+    try:
+        identity = current_identity()
+        
+        if identity.role != 'clinician':
+            return jsonify({'error': 'Access denied'}), 403
+        
+        try:
+            days = int(request.args.get('days', COHORT_DEFAULT_DAYS))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not 1 <= days <= COHORT_MAX_DAYS:
+            return jsonify({'error': f'days must be between 1 and {COHORT_MAX_DAYS}'}), 400
+        
+        profiles = db.session.execute(
+            db.select(
+                PatientProfile.id,
+                PatientProfile.baseline_cadence,
+                PatientProfile.target_cadence
+            ).where(
+                PatientProfile.assigned_clinician_id == identity.user_id
+            ).order_by(PatientProfile.id)
+        ).all()
+        
+        from api.patients.cohort import cohort_analytics  # NumPy: imported on first use
+        return jsonify(cohort_analytics(profiles, days)), 200
+        
+    except Exception as e:
+        logging.error(f"Get cohort error: {str(e)}")
+        return jsonify({'error': 'Failed to get cohort analytics'}), 500
+
+def _patient_stats(patient_id):
+    """Recent sessions and session stats of a patient, as plain data concurrent requests can share"""
+    recent_sessions = TherapySession.query.filter_by(
+        patient_id=patient_id,
+        completed=True
+    ).order_by(TherapySession.start_time.desc()).limit(5).all()
+    
+    total_sessions = TherapySession.query.filter_by(
+        patient_id=patient_id,
+        completed=True
+    ).count()
+    
+    avg_accuracy = db.session.query(db.func.avg(TherapySession.accuracy_score)).filter_by(
+        patient_id=patient_id,
+        completed=True
+    ).scalar() or 0
+    
+    return {
+        'recent_sessions': [s.to_dict() for s in recent_sessions],
+        'stats': {
+            'total_sessions': total_sessions,
+            'avg_accuracy': round(avg_accuracy, 1)
+        }
+    }
+
 @patients_bp.route('/<int:patient_id>', methods=['GET'])
 @jwt_required()
+@replica_read
+@patient_sharded
+@conditional(patient_detail_version)
 def get_patient(patient_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
         patient_profile = PatientProfile.query.get_or_404(patient_id)
         
-        if current_user.user_type == 'patient' and patient_profile.user_id != current_user_id:
-            return jsonify({'error': 'Access denied'}), 403
-        elif current_user.user_type == 'clinician' and patient_profile.assigned_clinician_id != current_user_id:
+        if not can_view_patient(patient_profile):
             return jsonify({'error': 'Access denied'}), 403
         
         user = User.query.get(patient_profile.user_id)
         
-        recent_sessions = TherapySession.query.filter_by(
-            patient_id=patient_id,
-            completed=True
-        ).order_by(TherapySession.start_time.desc()).limit(5).all()
-        
-        total_sessions = TherapySession.query.filter_by(
-            patient_id=patient_id,
-            completed=True
-        ).count()
-        
-        avg_accuracy = db.session.query(db.func.avg(TherapySession.accuracy_score)).filter_by(
-            patient_id=patient_id,
-            completed=True
-        ).scalar() or 0
+        # Tabs refreshed together compute the stats once per data version
+        summary = stats_flights.do((patient_id, patient_profile.data_version), _patient_stats, patient_id)
         
         return jsonify({
             'user': user.to_dict(),
             'profile': patient_profile.to_dict(),
-            'recent_sessions': [s.to_dict() for s in recent_sessions],
-            'stats': {
-                'total_sessions': total_sessions,
-                'avg_accuracy': round(avg_accuracy, 1)
-            }
+            **summary
         }), 200
         
     except Exception as e:
         logging.error(f"Get patient error: {str(e)}")
         return jsonify({'error': 'Failed to get patient'}), 500
+
+@patients_bp.route('/<int:patient_id>/trends', methods=['GET'])
+@jwt_required()
+@replica_read
+def get_patient_trends(patient_id):
+    try:
+        denied = authorize_patient(patient_id)
+        if denied:
+            return denied
+        
+        # One row per session type plus 'all', kept current by complete_session
+        rows = PatientTrendStats.query.filter_by(patient_id=patient_id).all()
+        
+        return jsonify({
+            'patient_id': patient_id,
+            'trends': {row.session_type: row.to_dict() for row in rows}
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Get patient trends error: {str(e)}")
+        return jsonify({'error': 'Failed to get patient trends'}), 500
+
+def _parse_history_filters(patient_id, args):
+    filters = [TherapySession.patient_id == patient_id]
+    
+    session_type = args.get('session_type')
+    if session_type:
+        filters.append(TherapySession.session_type == session_type)
+    
+    completed = args.get('completed')
+    if completed is not None:
+        if completed.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('completed must be true or false')
+        filters.append(TherapySession.completed == (completed.lower() in ('true', '1')))
+    
+    since = args.get('since')
+    if since:
+        filters.append(TherapySession.start_time >= datetime.fromisoformat(since))
+    
+    until = args.get('until')
+    if until:
+        filters.append(TherapySession.start_time < datetime.fromisoformat(until))
+    
+    cursor = args.get('cursor')
+    if cursor:
+        filters.append(keyset_before(TherapySession.start_time, TherapySession.id, cursor))
+    
+    return filters
+
+@patients_bp.route('/<int:patient_id>/sessions', methods=['GET'])
+@jwt_required()
+@patient_sharded
+def get_session_history(patient_id):
+    try:
+        denied = authorize_patient(patient_id)
+        if denied:
+            return denied
+        
+        try:
+            filters = _parse_history_filters(patient_id, request.args)
+            limit = min(max(int(request.args.get('limit', HISTORY_DEFAULT_LIMIT)), 1), HISTORY_MAX_LIMIT)
+            fields = parse_fields(TherapySession, request.args.get('fields'))
+        except (ValueError, InvalidCursor) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # start_time and id are always loaded for the next cursor
+        query = db.select(TherapySession).options(
+            *column_options(TherapySession, fields, extra=('start_time', 'id'))
+        ).where(*filters).order_by(
+            TherapySession.start_time.desc(), TherapySession.id.desc()
+        )
+        serialize = serializer(TherapySession, fields)
+        
+        if request.args.get('format') == 'jsonl':
+            def generate():
+                # Runs after the view returns, outside @patient_sharded
+                with patient_shard(patient_id):
+                    rows = db.session.execute(
+                        query.execution_options(yield_per=HISTORY_STREAM_BATCH)
+                    ).scalars()
+                    for therapy_session in rows:
+                        yield current_app.json.dumps(serialize(therapy_session)) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        sessions = db.session.execute(query.limit(limit + 1)).scalars().all()
+        
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            last = sessions[-1]
+            next_cursor = encode_cursor(last.start_time, last.id)
+        
+        return jsonify({
+            'sessions': [serialize(s) for s in sessions],
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Get session history error: {str(e)}")
+        return jsonify({'error': 'Failed to get session history'}), 500
@@ -0,0 +1,37 @@
+from api import db
+from api.models import TherapySession, PatientTrendStats
+from api.sharding import patient_shard
+import trend_stats
+
+
+def rebuild_trend_stats(patient_id):
+    """Replace a patient's trend rows by a replay of all their completed sessions.
+
+    complete_session maintains the rows incrementally; this is for sessions
+    completed before the rows existed. Returns the number of sessions replayed.
+    """
+    with patient_shard(patient_id):
+        sessions = db.session.execute(
+            db.select(
+                TherapySession.session_type,
+                TherapySession.end_time,
+                TherapySession.accuracy_score,
+                db.func.coalesce(TherapySession.final_bpm, TherapySession.initial_bpm)
+            ).where(
+                TherapySession.patient_id == patient_id,
+                TherapySession.completed == True,
+                TherapySession.end_time.isnot(None),
+                TherapySession.accuracy_score.isnot(None)
+            ).order_by(TherapySession.end_time, TherapySession.id)
+        ).all()
+    
+    db.session.execute(db.delete(PatientTrendStats).where(PatientTrendStats.patient_id == patient_id))
+    rows = {}
+    for session_type, end_time, accuracy, bpm in sessions:
+        for key in (session_type, trend_stats.ALL):
+            stats = rows.get(key)
+            if stats is None:
+                stats = rows[key] = PatientTrendStats(patient_id=patient_id, session_type=key, **trend_stats.initial_state())
+            trend_stats.observe(stats, end_time, accuracy, bpm)
+    db.session.add_all(rows.values())
+    return len(sessions)
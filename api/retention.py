@@ -0,0 +1,223 @@
+"""Tiered retention for session_metrics.
+
+Tier 1: samples of sessions started more than RETENTION_ROLLUP_DAYS ago are
+aggregated into per-minute rows in session_metrics_rollup and the raw rows
+are deleted.
+Tier 2: sessions started more than RETENTION_ARCHIVE_MONTHS ago have their
+remaining series (raw or rollup) written to a gzip file under
+METRICS_ARCHIVE_DIR and removed from the database.
+
+Only completed sessions move down a tier: a session still being recorded
+keeps its raw samples, which completion summarises.
+
+TherapySession.metrics_tier records where a session's series lives, and
+read_archived_series() lets readers fall through to the archive files.
+With sharding each shard is processed in turn.
+"""
+from flask import current_app
+from datetime import datetime, timedelta
+from api import db
+from api.models import TherapySession, SessionMetrics, SessionMetricsRollup
+from api.sharding import current_engine, each_shard, use_shard
+import gzip
+import json
+import logging
+import os
+
+ARCHIVE_FORMAT_VERSION = 1
+
+
+def archive_dir():
+    path = current_app.config['METRICS_ARCHIVE_DIR']
+    if not os.path.isabs(path):
+        path = os.path.join(current_app.instance_path, path)
+    return path
+
+def archive_path(patient_id, session_id):
+    return os.path.join(archive_dir(), str(patient_id), f"{session_id}.json.gz")
+
+def _minute_bucket(column):
+    if current_engine().dialect.name == 'postgresql':
+        return db.func.date_trunc('minute', column)
+    return db.func.strftime('%Y-%m-%d %H:%M:00', column)
+
+def _sessions_due(cutoff, include_rollup, batch_size):
+    tier_filter = TherapySession.metrics_tier.is_(None)
+    if include_rollup:
+        tier_filter = db.or_(tier_filter, TherapySession.metrics_tier == 'rollup')
+
+    return db.session.execute(
+        db.select(TherapySession.id, TherapySession.patient_id, TherapySession.metrics_tier).where(
+            TherapySession.start_time < cutoff,
+            TherapySession.completed == True,
+            tier_filter
+        ).order_by(TherapySession.start_time).limit(batch_size)
+    ).all()
+
+def rollup_batch(cutoff, batch_size):
+    """Downsample one batch of raw sessions to per-minute aggregates. Returns the batch size."""
+    sessions = _sessions_due(cutoff, False, batch_size)
+    if not sessions:
+        return 0
+
+    session_ids = [s.id for s in sessions]
+    minute = _minute_bucket(SessionMetrics.timestamp)
+
+    aggregate = db.select(
+        SessionMetrics.session_id,
+        minute,
+        db.func.count(SessionMetrics.id),
+        db.func.avg(SessionMetrics.current_bpm),
+        db.func.min(SessionMetrics.current_bpm),
+        db.func.max(SessionMetrics.current_bpm),
+        db.func.avg(SessionMetrics.sync_accuracy),
+        db.func.sum(db.case((SessionMetrics.adjustment_made == True, 1), else_=0))
+    ).where(
+        SessionMetrics.session_id.in_(session_ids)
+    ).group_by(SessionMetrics.session_id, minute)
+
+    db.session.execute(
+        db.insert(SessionMetricsRollup).from_select(
+            ['session_id', 'minute', 'samples', 'avg_bpm', 'min_bpm', 'max_bpm', 'avg_accuracy', 'adjustments'],
+            aggregate
+        )
+    )
+    db.session.execute(db.delete(SessionMetrics).where(SessionMetrics.session_id.in_(session_ids)))
+    db.session.execute(
+        db.update(TherapySession).where(TherapySession.id.in_(session_ids)).values(metrics_tier='rollup')
+    )
+    db.session.commit()
+    return len(session_ids)
+
+def _series_rows(session_id, tier):
+    if tier == 'rollup':
+        rows = db.session.execute(
+            db.select(
+                SessionMetricsRollup.minute,
+                SessionMetricsRollup.avg_bpm,
+                SessionMetricsRollup.avg_accuracy,
+                SessionMetricsRollup.adjustments,
+                SessionMetricsRollup.samples
+            ).where(SessionMetricsRollup.session_id == session_id).order_by(SessionMetricsRollup.minute)
+        ).all()
+        columns = ['timestamp', 'current_bpm', 'sync_accuracy', 'adjustments', 'samples']
+    else:
+        rows = db.session.execute(
+            db.select(
+                SessionMetrics.timestamp,
+                SessionMetrics.current_bpm,
+                SessionMetrics.sync_accuracy,
+                SessionMetrics.adjustment_made
+            ).where(SessionMetrics.session_id == session_id).order_by(SessionMetrics.timestamp, SessionMetrics.id)
+        ).all()
+        columns = ['timestamp', 'current_bpm', 'sync_accuracy', 'adjustment_made']
+
+    return columns, [[r[0].isoformat(), *r[1:]] for r in rows]
+
+def _write_archive(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(payload, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def archive_batch(cutoff, batch_size):
+    """Move the series of one batch of cold sessions into archive files. Returns how many moved."""
+    sessions = _sessions_due(cutoff, True, batch_size)
+    if not sessions:
+        return 0
+
+    archived = {'raw': [], 'rollup': []}
+    for session_id, patient_id, tier in sessions:
+        source = tier or 'raw'
+        columns, rows = _series_rows(session_id, source)
+        try:
+            _write_archive(archive_path(patient_id, session_id), {
+                'version': ARCHIVE_FORMAT_VERSION,
+                'session_id': session_id,
+                'source': source,
+                'columns': columns,
+                'rows': rows
+            })
+        except OSError as e:
+            logging.error(f"Archiving session {session_id} failed: {str(e)}")
+            continue
+        archived[source].append(session_id)
+
+    if archived['raw']:
+        db.session.execute(db.delete(SessionMetrics).where(SessionMetrics.session_id.in_(archived['raw'])))
+    if archived['rollup']:
+        db.session.execute(db.delete(SessionMetricsRollup).where(SessionMetricsRollup.session_id.in_(archived['rollup'])))
+
+    session_ids = archived['raw'] + archived['rollup']
+    if session_ids:
+        db.session.execute(
+            db.update(TherapySession).where(TherapySession.id.in_(session_ids)).values(metrics_tier='archive')
+        )
+    db.session.commit()
+    return len(session_ids)
+
+def incremental_vacuum(pages):
+    """Return freed pages to the filesystem a few at a time (SQLite auto_vacuum=INCREMENTAL only)"""
+    engine = current_engine()
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            return False
+        # sqlite3's execute() steps this pragma once, freeing a single page;
+        # executescript() runs it to completion
+        conn.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+    return True
+
+def enable_incremental_vacuum():
+    """One-off conversion of an existing SQLite file to auto_vacuum=INCREMENTAL (rewrites the file)"""
+    with current_engine().connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
+
+def run_retention(max_batches=None, now=None):
+    """Run both tiers in bounded batches, vacuuming incrementally after each batch"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    batch_size = config['RETENTION_BATCH_SIZE']
+    vacuum_pages = config['RETENTION_VACUUM_PAGES']
+    stages = [
+        ('archive', archive_batch, now - timedelta(days=30 * config['RETENTION_ARCHIVE_MONTHS'])),
+        ('rollup', rollup_batch, now - timedelta(days=config['RETENTION_ROLLUP_DAYS']))
+    ]
+
+    totals = {name: 0 for name, _, _ in stages}
+    for shard in each_shard():
+        with use_shard(shard):
+            for name, run_batch, cutoff in stages:
+                batches = 0
+                while max_batches is None or batches < max_batches:
+                    processed = run_batch(cutoff, batch_size)
+                    if not processed:
+                        break
+                    totals[name] += processed
+                    batches += 1
+                    incremental_vacuum(vacuum_pages)
+    for name in totals:
+        logging.info(f"Retention {name}: {totals[name]} sessions")
+    return totals
+
+def read_archived_series(patient_id, session_id):
+    """Read an archived series back as (timestamps, bpm, sync_accuracy) lists"""
+    path = archive_path(patient_id, session_id)
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        logging.error(f"Metrics archive missing for session {session_id}: {path}")
+        return [], [], []
+
+    columns = payload['columns']
+    ts_i, bpm_i, acc_i = columns.index('timestamp'), columns.index('current_bpm'), columns.index('sync_accuracy')
+    rows = payload['rows']
+    return (
+        [datetime.fromisoformat(r[ts_i]) for r in rows],
+        [r[bpm_i] for r in rows],
+        [r[acc_i] for r in rows]
+    )
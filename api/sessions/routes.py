@@ -1,23 +1,34 @@
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from api.sessions import sessions_bp
 from api import db
-from api.models import User, TherapySession, SessionMetrics
-from beat_generator import BeatGenerator
+from api.models import PatientProfile, TherapySession, ChangeLog, PatientTrendStats
+from api.identity import current_identity, authorize_session, session_owners
+from api.sharding import patient_shard, session_sharded, metric_writer, fan_out
+from observability import span, sampled_logger
 from datetime import datetime
 import logging
+import os
+
+TIMESERIES_DEFAULT_POINTS = 300
+TIMESERIES_MAX_POINTS = 2000
+TIMESERIES_MAX_SESSIONS = 10
+
+update_log = sampled_logger('neurobeat.session_updates', float(os.environ.get('LOG_SAMPLE_SESSION_UPDATES', 0.01)))
 
 @sessions_bp.route('/start', methods=['POST'])
 @jwt_required()
 def start_session():
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        from beat_generator import BeatGenerator
+        
+        identity = current_identity()
         
-        if not user or user.user_type != 'patient':
+        if identity.role != 'patient':
             return jsonify({'error': 'Only patients can start sessions'}), 403
         
-        patient_profile = user.patient_profile
+        with span('session.load_profile'):
+            patient_profile = PatientProfile.query.get(identity.patient_id)
         
         data = request.get_json()
         session_type = data.get('session_type', 'gait_trainer')
@@ -46,24 +57,28 @@ def start_session():
             if abs(initial_bpm - optimal_bpm) > 10:
                 initial_bpm = optimal_bpm
         
-        therapy_session = TherapySession(
-            patient_id=patient_profile.id,
-            session_type=session_type,
-            initial_bpm=initial_bpm,
-            target_bpm=target_bpm,
-            start_time=datetime.utcnow(),
-            generated_beat_url=beat_url,
-            affected_limb=data.get('affected_limb'),
-            cognitive_load_level=int(data.get('cognitive_load_level', 1))
-        )
-        
-        db.session.add(therapy_session)
-        db.session.commit()
-        
-        return jsonify({
-            'session': therapy_session.to_dict(),
-            'stroke_specific': patient_profile.condition == 'stroke'
-        }), 201
+        with patient_shard(patient_profile.id, assign=True):
+            therapy_session = TherapySession(
+                patient_id=patient_profile.id,
+                session_type=session_type,
+                initial_bpm=initial_bpm,
+                target_bpm=target_bpm,
+                start_time=datetime.utcnow(),
+                generated_beat_url=beat_url,
+                affected_limb=data.get('affected_limb'),
+                cognitive_load_level=int(data.get('cognitive_load_level', 1))
+            )
+            
+            db.session.add(therapy_session)
+            db.session.flush()
+            ChangeLog.record('session', therapy_session.id, patient_profile.id, patient_profile.assigned_clinician_id)
+            with span('db.commit'):
+                db.session.commit()
+            
+            return jsonify({
+                'session': therapy_session.to_dict(),
+                'stroke_specific': patient_profile.condition == 'stroke'
+            }), 201
         
     except Exception as e:
         db.session.rollback()
@@ -72,15 +87,14 @@ def start_session():
 
 @sessions_bp.route('/<int:session_id>', methods=['GET'])
 @jwt_required()
+@session_sharded
 def get_session(session_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        therapy_session = TherapySession.query.get_or_404(session_id)
+        denied = authorize_session(session_id)
+        if denied:
+            return denied
         
-        if user.user_type == 'patient' and therapy_session.patient.user_id != current_user_id:
-            return jsonify({'error': 'Access denied'}), 403
+        therapy_session = TherapySession.query.get(session_id)
         
         return jsonify({'session': therapy_session.to_dict()}), 200
         
@@ -90,41 +104,32 @@ def get_session(session_id):
 
 @sessions_bp.route('/<int:session_id>/update', methods=['POST'])
 @jwt_required()
+@session_sharded
 def update_session(session_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if user.user_type != 'patient':
-            return jsonify({'error': 'Only patients can update sessions'}), 403
-        
-        therapy_session = TherapySession.query.get_or_404(session_id)
-        
-        if therapy_session.patient.user_id != current_user_id:
-            return jsonify({'error': 'Access denied'}), 403
+        denied = authorize_session(session_id, patient_only=True)
+        if denied:
+            return denied
         
         data = request.get_json()
         current_bpm = float(data.get('current_bpm'))
         sync_accuracy = float(data.get('sync_accuracy', 0))
         
-        metric = SessionMetrics(
-            session_id=session_id,
-            current_bpm=current_bpm,
-            sync_accuracy=sync_accuracy,
-            timestamp=datetime.utcnow()
-        )
-        
         adjustment_bpm = current_bpm
         if sync_accuracy < 70:
             adjustment_bpm = max(current_bpm - 2, 40)
         elif sync_accuracy > 90:
             adjustment_bpm = min(current_bpm + 1, 120)
         
-        if adjustment_bpm != current_bpm:
-            metric.adjustment_made = True
-        
-        db.session.add(metric)
-        db.session.commit()
+        metric_writer().insert({
+            'session_id': session_id,
+            'current_bpm': current_bpm,
+            'sync_accuracy': sync_accuracy,
+            'timestamp': datetime.utcnow(),
+            'adjustment_made': adjustment_bpm != current_bpm
+        })
+        update_log.info("Session %s update: bpm=%s accuracy=%s adjusted=%s",
+                        session_id, current_bpm, sync_accuracy, adjustment_bpm)
         
         return jsonify({
             'adjusted_bpm': adjustment_bpm,
@@ -138,28 +143,42 @@ def update_session(session_id):
 
 @sessions_bp.route('/<int:session_id>/complete', methods=['POST'])
 @jwt_required()
+@session_sharded
 def complete_session(session_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        identity = current_identity()
         
-        if user.user_type != 'patient':
+        if identity.role != 'patient':
             return jsonify({'error': 'Only patients can complete sessions'}), 403
         
         therapy_session = TherapySession.query.get_or_404(session_id)
         
-        if therapy_session.patient.user_id != current_user_id:
+        if therapy_session.patient_id != identity.patient_id:
             return jsonify({'error': 'Access denied'}), 403
         
         data = request.get_json()
         
+        first_completion = not therapy_session.completed
         therapy_session.end_time = datetime.utcnow()
         therapy_session.completed = True
         therapy_session.duration_seconds = int(data.get('duration', 0))
         therapy_session.final_bpm = float(data.get('final_bpm', therapy_session.initial_bpm))
         therapy_session.accuracy_score = float(data.get('accuracy_score', 0))
         therapy_session.notes = data.get('notes', '')
-        
+        # Server-side summary of the recorded samples, next to the figures the client reported
+        from api.sessions.series import session_features
+        therapy_session.set_features(session_features([(therapy_session.id, therapy_session.target_bpm)])[therapy_session.id])
+        
+        patient_profile = therapy_session.patient
+        if first_completion:
+            PatientTrendStats.record(
+                patient_profile.id,
+                therapy_session.session_type,
+                therapy_session.end_time,
+                therapy_session.accuracy_score,
+                therapy_session.final_bpm
+            )
+        ChangeLog.record('session', therapy_session.id, patient_profile.id, patient_profile.assigned_clinician_id)
         db.session.commit()
         
         return jsonify({
@@ -171,3 +190,66 @@ def complete_session(session_id):
         db.session.rollback()
         logging.error(f"Complete session error: {str(e)}")
         return jsonify({'error': 'Failed to complete session'}), 500
+
+def _timeseries_response(session_ids):
+    identity = current_identity()
+    
+    try:
+        points = min(max(int(request.args.get('points', TIMESERIES_DEFAULT_POINTS)), 3), TIMESERIES_MAX_POINTS)
+    except ValueError:
+        return jsonify({'error': 'points must be an integer'}), 400
+    
+    owners = session_owners(session_ids)
+    
+    if len(owners) != len(set(session_ids)):
+        return jsonify({'error': 'Session not found'}), 404
+    
+    for _, patient_id, clinician_id in owners:
+        if identity.role == 'patient' and patient_id != identity.patient_id:
+            return jsonify({'error': 'Access denied'}), 403
+        elif identity.role == 'clinician' and clinician_id != identity.user_id:
+            return jsonify({'error': 'Access denied'}), 403
+    
+    from api.sessions.series import session_timeseries
+    
+    # Each shard loads the series of its own patients' sessions
+    patient_of = {session_id: patient_id for session_id, patient_id, _ in owners}
+    series = {item['session_id']: item for item in fan_out(
+        lambda patient_ids: session_timeseries([s for s in session_ids if patient_of[s] in patient_ids], points),
+        list(set(patient_of.values()))
+    )}
+    
+    return jsonify({
+        'points': points,
+        'series': [series[session_id] for session_id in session_ids]
+    }), 200
+
+@sessions_bp.route('/<int:session_id>/timeseries', methods=['GET'])
+@jwt_required()
+def get_session_timeseries(session_id):
+    try:
+        return _timeseries_response([session_id])
+        
+    except Exception as e:
+        logging.error(f"Get session timeseries error: {str(e)}")
+        return jsonify({'error': 'Failed to get session timeseries'}), 500
+
+@sessions_bp.route('/timeseries', methods=['GET'])
+@jwt_required()
+def get_sessions_timeseries():
+    try:
+        try:
+            session_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of session ids'}), 400
+        
+        if not session_ids:
+            return jsonify({'error': 'No session ids given'}), 400
+        if len(session_ids) > TIMESERIES_MAX_SESSIONS:
+            return jsonify({'error': f'At most {TIMESERIES_MAX_SESSIONS} sessions per request'}), 400
+        
+        return _timeseries_response(list(dict.fromkeys(session_ids)))
+        
+    except Exception as e:
+        logging.error(f"Get sessions timeseries error: {str(e)}")
+        return jsonify({'error': 'Failed to get sessions timeseries'}), 500
@@ -0,0 +1,192 @@
+from api import db
+from api.models import TherapySession, SessionMetrics, SessionMetricsRollup
+from api.downsample import downsample_series
+from api.retention import read_archived_series
+from api.sharding import each_shard, use_shard
+from session_features import summarize
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+
+
+def _to_arrays(timestamps, bpm, accuracy):
+    timestamps = np.array(timestamps, dtype='datetime64[us]')
+    seconds = (timestamps - timestamps[0]) / np.timedelta64(1, 's')
+    bpm = np.array(bpm, dtype=np.float64)
+    accuracy = np.array([np.nan if a is None else a for a in accuracy], dtype=np.float64)
+    return seconds, bpm, accuracy
+
+def _group_rows(rows):
+    """Split (session_id, timestamp, bpm, accuracy) rows ordered by session into per-session arrays"""
+    series = {}
+    if not rows:
+        return series
+
+    session_col, ts_col, bpm_col, acc_col = zip(*rows)
+    session_col = np.array(session_col, dtype=np.int64)
+    boundaries = np.flatnonzero(np.diff(session_col)) + 1
+    for lo, hi in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(rows)]))):
+        series[int(session_col[lo])] = _to_arrays(ts_col[lo:hi], bpm_col[lo:hi], acc_col[lo:hi])
+    return series
+
+def load_session_series(session_ids):
+    """Load the SessionMetrics curves for several sessions.
+
+    Returns {session_id: (seconds_since_first_sample, bpm, sync_accuracy)} as
+    NumPy arrays. Raw samples are read in one query; sessions compacted by the
+    retention engine are read through from the per-minute rollups or their
+    archive files. Sessions without samples are omitted.
+    """
+    series = _group_rows(db.session.execute(
+        db.select(
+            SessionMetrics.session_id,
+            SessionMetrics.timestamp,
+            SessionMetrics.current_bpm,
+            SessionMetrics.sync_accuracy
+        ).where(
+            SessionMetrics.session_id.in_(session_ids)
+        ).order_by(SessionMetrics.session_id, SessionMetrics.timestamp, SessionMetrics.id)
+    ).all())
+
+    missing = [sid for sid in session_ids if sid not in series]
+    if not missing:
+        return series
+
+    tiers = db.session.execute(
+        db.select(TherapySession.id, TherapySession.patient_id, TherapySession.metrics_tier).where(
+            TherapySession.id.in_(missing),
+            TherapySession.metrics_tier.isnot(None)
+        )
+    ).all()
+
+    rollup_ids = [t.id for t in tiers if t.metrics_tier == 'rollup']
+    if rollup_ids:
+        series.update(_group_rows(db.session.execute(
+            db.select(
+                SessionMetricsRollup.session_id,
+                SessionMetricsRollup.minute,
+                SessionMetricsRollup.avg_bpm,
+                SessionMetricsRollup.avg_accuracy
+            ).where(
+                SessionMetricsRollup.session_id.in_(rollup_ids)
+            ).order_by(SessionMetricsRollup.session_id, SessionMetricsRollup.minute)
+        ).all()))
+
+    for session_id, patient_id, tier in tiers:
+        if tier == 'archive':
+            timestamps, bpm, accuracy = read_archived_series(patient_id, session_id)
+            if timestamps:
+                series[session_id] = _to_arrays(timestamps, bpm, accuracy)
+
+    return series
+
+def _adjustment_counts(session_ids):
+    """{session_id: tempo adjustments} from raw samples, or from the rollups of compacted sessions"""
+    counts = dict(db.session.execute(
+        db.select(
+            SessionMetrics.session_id,
+            db.func.sum(db.case((SessionMetrics.adjustment_made == True, 1), else_=0))
+        ).where(
+            SessionMetrics.session_id.in_(session_ids)
+        ).group_by(SessionMetrics.session_id)
+    ).all())
+
+    missing = [sid for sid in session_ids if sid not in counts]
+    if missing:
+        counts.update(db.session.execute(
+            db.select(
+                SessionMetricsRollup.session_id,
+                db.func.sum(SessionMetricsRollup.adjustments)
+            ).where(
+                SessionMetricsRollup.session_id.in_(missing)
+            ).group_by(SessionMetricsRollup.session_id)
+        ).all())
+    return counts
+
+def session_features(sessions):
+    """Summary features of sessions given as (session_id, target_bpm) pairs.
+
+    Returns {session_id: {column: value}} for TherapySession.set_features().
+    Adjustments come from one aggregate query, everything else from a
+    vectorized pass over each session's samples (session_features.py).
+    Archived sessions keep no adjustment flags, so their count is None.
+    """
+    session_ids = [session_id for session_id, _ in sessions]
+    adjustments = _adjustment_counts(session_ids)
+    series = load_session_series(session_ids)
+    empty = np.empty(0, dtype=np.float64)
+
+    features = {}
+    for session_id, target_bpm in sessions:
+        seconds, bpm, accuracy = series.get(session_id, (empty, empty, empty))
+        summary = summarize(seconds, bpm, accuracy, target_bpm)
+        count = adjustments.get(session_id)
+        summary['adjustment_count'] = int(count) if count is not None else (0 if summary['sample_count'] == 0 else None)
+        features[session_id] = summary
+    return features
+
+_worker_app = None
+
+
+def _init_backfill_worker():
+    global _worker_app
+    from api import create_app
+    _worker_app = create_app()
+
+def _store_features(shard, sessions):
+    with use_shard(shard):
+        features = session_features(sessions)
+        db.session.execute(db.update(TherapySession), [
+            {'id': session_id, **values} for session_id, values in features.items()
+        ])
+        db.session.commit()
+    return len(features)
+
+def _backfill_batch(batch):
+    with _worker_app.app_context():
+        return _store_features(*batch)
+
+def backfill_features(workers=4, batch_size=200, force=False):
+    """Store features of completed sessions that lack them (all of them with force).
+
+    The summaries are CPU-bound Python and NumPy, so batches are spread over
+    worker processes, each with its own app and database connections. A
+    batch reads its samples in one query and writes its rows in one
+    executemany on the shard that holds it. Returns the number of sessions
+    updated.
+    """
+    batches = []
+    for shard in each_shard():
+        with use_shard(shard):
+            query = db.select(TherapySession.id, TherapySession.target_bpm).where(TherapySession.completed == True)
+            if not force:
+                query = query.where(TherapySession.sample_count.is_(None))
+            sessions = [tuple(row) for row in db.session.execute(query.order_by(TherapySession.id)).all()]
+        batches.extend((shard, sessions[i:i + batch_size]) for i in range(0, len(sessions), batch_size))
+
+    if workers <= 1 or len(batches) <= 1:
+        return sum(_store_features(*batch) for batch in batches)
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_backfill_worker) as pool:
+        return sum(pool.map(_backfill_batch, batches))
+
+def session_timeseries(session_ids, points):
+    """Downsampled BPM and sync accuracy curves for each requested session"""
+    series = load_session_series(session_ids)
+
+    result = []
+    for session_id in session_ids:
+        if session_id not in series:
+            result.append({'session_id': session_id, 'samples': 0, 'bpm': None, 'sync_accuracy': None})
+            continue
+
+        seconds, bpm, accuracy = series[session_id]
+        result.append({
+            'session_id': session_id,
+            'samples': len(seconds),
+            'bpm': downsample_series(seconds, bpm, points),
+            'sync_accuracy': downsample_series(seconds, accuracy, points)
+        })
+    return result
@@ -0,0 +1,589 @@
+"""Patient-keyed sharding of session data.
+
+With SHARD_URLS set (e.g. "s0=sqlite:////data/s0.db,s1=sqlite:////data/s1.db")
+therapy_sessions, session_metrics, session_metrics_rollup and
+baseline_assessments live on one of several databases chosen by patient.
+Users, profiles, the change log and the shard directory stay on the primary
+(DATABASE_URL). Without SHARD_URLS everything stays on the primary and none
+of this is active.
+
+A patient's shard is recorded in the shard_directory table the first time
+it is needed. New patients are placed by a consistent-hash ring, so adding
+a shard moves only about 1/N of patients when `flask shard-rebalance` runs.
+Session and assessment ids come from a global allocator (id_allocations,
+handed out in blocks) so they stay unique across shards.
+
+Handlers select a shard before touching sharded tables: @patient_sharded and
+@session_sharded for views, patient_shard() as a context manager, and
+fan_out() for reads that span patients. Queries on sharded tables without a
+selected shard, or that join sharded and unsharded tables, raise
+ShardingError rather than reading the wrong database.
+
+Writes to the primary and to a shard in one request commit one after the
+other, not atomically.
+"""
+from bisect import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, jsonify
+from sqlalchemy.sql.util import find_tables
+
+from db_routing import RoutingSession
+
+SHARDED_TABLES = frozenset(['therapy_sessions', 'session_metrics', 'session_metrics_rollup', 'baseline_assessments'])
+RING_POINTS_PER_SHARD = 64
+ID_BLOCK_SIZE = int(os.environ.get('SHARD_ID_BLOCK', 100))
+DIRECTORY_TTL = float(os.environ.get('SHARD_DIRECTORY_TTL', 30))
+ACTIVE_SESSION_HOURS = 12
+# Samples are stamped when the request builds them and may commit a little later
+LATE_WRITE_MARGIN = timedelta(minutes=5)
+
+
+class ShardingError(RuntimeError):
+    pass
+
+
+def shard_urls():
+    """{shard name: database URL} from SHARD_URLS, in the order given"""
+    urls = {}
+    for entry in os.environ.get('SHARD_URLS', '').split(','):
+        if entry.strip():
+            name, _, url = entry.strip().partition('=')
+            if not url:
+                raise ShardingError(f"SHARD_URLS entry {entry!r} must be name=url")
+            urls[name.strip()] = url.strip()
+    return urls
+
+SHARDS = list(shard_urls())
+SHARDING_ENABLED = bool(SHARDS)
+
+def bind_key(shard):
+    return f'shard_{shard}'
+
+def shard_binds():
+    """SQLALCHEMY_BINDS entries for the configured shards"""
+    return {bind_key(name): url for name, url in shard_urls().items()}
+
+
+class HashRing:
+    """Consistent hashing of patient ids onto shard names"""
+
+    def __init__(self, shards, points=RING_POINTS_PER_SHARD):
+        ring = sorted(
+            (self._hash(f'{shard}#{i}'), shard) for shard in shards for i in range(points)
+        )
+        self._keys = [key for key, _ in ring]
+        self._shards = [shard for _, shard in ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def lookup(self, patient_id):
+        index = bisect(self._keys, self._hash(patient_id)) % len(self._keys)
+        return self._shards[index]
+
+ring = HashRing(SHARDS) if SHARDING_ENABLED else None
+
+
+_current_shard = ContextVar('current_shard', default=None)
+_directory_cache = {}
+_lock = threading.Lock()
+
+
+def _touched_tables(mapper, clause):
+    names = set()
+    if mapper is not None:
+        names.add(mapper.local_table.name if hasattr(mapper, 'local_table') else mapper.__table__.name)
+    if clause is not None:
+        names.update(table.name for table in find_tables(clause, include_crud=True))
+    return names
+
+
+class ShardedSession(RoutingSession):
+    """Sends statements on sharded tables to the shard selected for the current patient"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and SHARDING_ENABLED:
+            tables = _touched_tables(mapper, clause)
+            sharded = tables & SHARDED_TABLES
+            if sharded:
+                if tables - SHARDED_TABLES:
+                    raise ShardingError(f"Query joins sharded {sorted(sharded)} with {sorted(tables - SHARDED_TABLES)}")
+                shard = _current_shard.get()
+                if shard is None:
+                    raise ShardingError(f"No shard selected for a query on {sorted(sharded)}")
+                return self._db.engines[bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def shard_for(patient_id, assign=False):
+    """Shard holding the patient's session data.
+
+    Patients without a directory entry have no session data yet: reads get
+    the ring's choice, writes (assign=True) record it first.
+    """
+    from api import db
+    from api.models import ShardAssignment
+
+    cached = _directory_cache.get(patient_id)
+    if cached is not None and cached[1] > time.monotonic() and (cached[2] or not assign):
+        return cached[0]
+
+    table = ShardAssignment.__table__
+    lookup = db.select(table.c.shard).where(table.c.patient_id == patient_id)
+    with db.engine.connect() as connection:
+        shard = connection.execute(lookup).scalar()
+        assigned = shard is not None
+        if not assigned:
+            shard = ring.lookup(patient_id)
+        if not assigned and assign:
+            try:
+                connection.execute(table.insert().values(patient_id=patient_id, shard=shard))
+                connection.commit()
+            except db.exc.IntegrityError:
+                # Another worker assigned the patient first
+                connection.rollback()
+                shard = connection.execute(lookup).scalar()
+            assigned = True
+
+    _directory_cache[patient_id] = (shard, time.monotonic() + DIRECTORY_TTL, assigned)
+    return shard
+
+def forget(patient_id):
+    _directory_cache.pop(patient_id, None)
+
+def current_shard():
+    return _current_shard.get()
+
+@contextmanager
+def use_shard(shard):
+    token = _current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        _current_shard.reset(token)
+
+@contextmanager
+def patient_shard(patient_id, assign=False):
+    """Route sharded tables to the patient's shard inside the block (assign=True before writes)"""
+    if not SHARDING_ENABLED:
+        yield None
+        return
+    with use_shard(shard_for(patient_id, assign=assign)) as shard:
+        yield shard
+
+def shards_of(patient_ids):
+    """{shard: [patient ids]} for the given patients, with one directory query for the uncached ones"""
+    from api import db
+    from api.models import ShardAssignment
+
+    now = time.monotonic()
+    grouped, missing = {}, []
+    for patient_id in patient_ids:
+        cached = _directory_cache.get(patient_id)
+        if cached is not None and cached[1] > now:
+            grouped.setdefault(cached[0], []).append(patient_id)
+        else:
+            missing.append(patient_id)
+
+    if missing:
+        table = ShardAssignment.__table__
+        with db.engine.connect() as connection:
+            found = dict(connection.execute(
+                db.select(table.c.patient_id, table.c.shard).where(table.c.patient_id.in_(missing))
+            ).all())
+        for patient_id in missing:
+            shard = found.get(patient_id) or ring.lookup(patient_id)
+            _directory_cache[patient_id] = (shard, now + DIRECTORY_TTL, patient_id in found)
+            grouped.setdefault(shard, []).append(patient_id)
+    return grouped
+
+def fan_out(query, patient_ids=None):
+    """Run query(patient_ids_on_shard) on every shard involved and concatenate the results.
+
+    With patient_ids=None the query runs on every shard with None. Without
+    sharding it runs once on the primary with the ids as given.
+    """
+    if not SHARDING_ENABLED:
+        return list(query(patient_ids))
+    if patient_ids is None:
+        groups = {shard: None for shard in SHARDS}
+    else:
+        groups = shards_of(patient_ids)
+    results = []
+    for shard, ids in groups.items():
+        with use_shard(shard):
+            results.extend(query(ids))
+    return results
+
+def each_shard():
+    """Shard names to iterate with use_shard() (a single None without sharding)"""
+    return SHARDS if SHARDING_ENABLED else [None]
+
+def current_engine():
+    """Engine of the selected shard, or the primary"""
+    from api import db
+
+    shard = _current_shard.get()
+    return db.engines[bind_key(shard)] if shard else db.engine
+
+def locate_sessions(session_ids):
+    """{session_id: patient_id} for the sessions that exist, on the selected shard or else on every shard"""
+    from api import db
+    from api.models import TherapySession
+
+    def query(_):
+        return db.session.execute(
+            db.select(TherapySession.id, TherapySession.patient_id).where(TherapySession.id.in_(session_ids))
+        ).all()
+
+    if _current_shard.get() is not None:
+        return dict(query(None))
+    return dict(fan_out(query))
+
+
+def patient_sharded(view):
+    """Select the shard of the view's patient_id argument"""
+    if not SHARDING_ENABLED:
+        return view
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with patient_shard(kwargs['patient_id']):
+            return view(*args, **kwargs)
+    return wrapper
+
+def session_sharded(view):
+    """Select the shard of the view's session_id argument (404 if no shard has it)"""
+    if not SHARDING_ENABLED:
+        return view
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from api.identity import current_identity
+
+        identity = current_identity()
+        if identity.role == 'patient':
+            shard = shard_for(identity.patient_id)
+        else:
+            patient_id = locate_sessions([kwargs['session_id']]).get(kwargs['session_id'])
+            if patient_id is None:
+                return jsonify({'error': 'Session not found'}), 404
+            shard = shard_for(patient_id)
+        with use_shard(shard):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+_id_blocks = {}
+_id_pid = None
+
+
+def allocate_id(table_name):
+    """Next globally unique id for a sharded table, reserved in blocks from id_allocations"""
+    global _id_pid
+    with _lock:
+        if _id_pid != os.getpid():
+            _id_blocks.clear()
+            _id_pid = os.getpid()
+        block = _id_blocks.get(table_name)
+        if block is None or block[0] >= block[1]:
+            start = _reserve_ids(table_name, ID_BLOCK_SIZE)
+            block = _id_blocks[table_name] = [start, start + ID_BLOCK_SIZE]
+        block[0] += 1
+        return block[0] - 1
+
+def _reserve_ids(table_name, count):
+    from api import db
+    from api.models import IdAllocation
+
+    allocations = IdAllocation.__table__
+    for attempt in range(2):
+        try:
+            with db.engine.begin() as connection:
+                updated = connection.execute(
+                    allocations.update().where(allocations.c.name == table_name).values(
+                        next_id=allocations.c.next_id + count
+                    )
+                ).rowcount
+                if updated:
+                    return connection.execute(
+                        db.select(allocations.c.next_id).where(allocations.c.name == table_name)
+                    ).scalar() - count
+
+                # First allocation: start above every id already present anywhere
+                start = 1 + max(
+                    [connection.execute(db.text(f'SELECT MAX(id) FROM {table_name}')).scalar() or 0]
+                    + [_max_id_on_shard(shard, table_name) for shard in SHARDS]
+                )
+                connection.execute(allocations.insert().values(name=table_name, next_id=start + count))
+                return start
+        except db.exc.IntegrityError:
+            # Another process created the sequence row first: take the update path
+            if attempt:
+                raise
+
+def _max_id_on_shard(shard, table_name):
+    from api import db
+
+    with db.engines[bind_key(shard)].connect() as connection:
+        return connection.execute(db.text(f'SELECT MAX(id) FROM {table_name}')).scalar() or 0
+
+def _assign_global_ids(session, flush_context, instances):
+    # Before the flush writes anything: the allocator's own transaction must
+    # not wait on this session's lock (SQLite has a single writer)
+    from api.models import TherapySession, BaselineAssessment
+
+    for obj in session.new:
+        if isinstance(obj, (TherapySession, BaselineAssessment)) and obj.id is None:
+            obj.id = allocate_id(obj.__table__.name)
+
+def install_id_allocation():
+    from sqlalchemy import event
+
+    if not event.contains(ShardedSession, 'before_flush', _assign_global_ids):
+        event.listen(ShardedSession, 'before_flush', _assign_global_ids)
+
+
+def metric_writer():
+    """Group-commit writer for session_metrics on the selected shard"""
+    from group_commit import GroupCommitWriter
+    from api.models import SessionMetrics
+
+    shard = _current_shard.get()
+    if shard is None:
+        return current_app.extensions['metric_writer']
+    writers = current_app.extensions.setdefault('shard_metric_writers', {})
+    with _lock:
+        if shard not in writers:
+            writers[shard] = GroupCommitWriter(current_engine(), SessionMetrics.__table__)
+        return writers[shard]
+
+def create_shard_tables(engine):
+    """Create missing sharded tables on a shard database.
+
+    Foreign keys to users and patient_profiles are left out: those rows live
+    on the primary.
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from api import db
+
+    existing = set(inspect(engine).get_table_names())
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name in SHARDED_TABLES and table.name not in existing:
+                connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index))
+
+
+def adopt_unassigned(shard):
+    """Record every patient without a directory entry as living on `shard`.
+
+    Used when turning sharding on for an existing database: list that
+    database as a shard, adopt its patients onto it, then rebalance.
+    """
+    from api import db
+    from api.models import PatientProfile, ShardAssignment
+
+    directory = ShardAssignment.__table__
+    with db.engine.begin() as connection:
+        patient_ids = connection.execute(
+            db.select(PatientProfile.id).where(
+                PatientProfile.id.not_in(db.select(directory.c.patient_id))
+            )
+        ).scalars().all()
+        if patient_ids:
+            connection.execute(directory.insert(), [
+                {'patient_id': patient_id, 'shard': shard} for patient_id in patient_ids
+            ])
+    _directory_cache.clear()
+    return len(patient_ids)
+
+def planned_moves():
+    """[(patient_id, from_shard, to_shard)] for patients the ring now places elsewhere"""
+    from api import db
+    from api.models import ShardAssignment
+
+    directory = ShardAssignment.__table__
+    with db.engine.connect() as connection:
+        assignments = connection.execute(db.select(directory.c.patient_id, directory.c.shard)).all()
+    return [
+        (patient_id, shard, ring.lookup(patient_id))
+        for patient_id, shard in assignments
+        if shard != ring.lookup(patient_id)
+    ]
+
+def _has_active_session(engine, patient_id):
+    from api import db
+    from api.models import TherapySession
+
+    sessions = TherapySession.__table__
+    since = datetime.utcnow() - timedelta(hours=ACTIVE_SESSION_HOURS)
+    with engine.connect() as connection:
+        return connection.execute(
+            db.select(sessions.c.id).where(
+                sessions.c.patient_id == patient_id,
+                sessions.c.end_time.is_(None),
+                sessions.c.start_time >= since
+            ).limit(1)
+        ).first() is not None
+
+def _copy_missing(patient_id, source, target):
+    """Copy the patient's sessions (with their series) and assessments not yet on target"""
+    from api import db
+    from api.models import TherapySession, SessionMetrics, SessionMetricsRollup, BaselineAssessment
+
+    copied = 0
+    with source.connect() as src, target.begin() as dst:
+        new_session_ids = []
+        for table in (TherapySession.__table__, BaselineAssessment.__table__):
+            present = set(dst.execute(db.select(table.c.id).where(table.c.patient_id == patient_id)).scalars())
+            rows = [
+                row._asdict() for row in src.execute(db.select(table).where(table.c.patient_id == patient_id))
+                if row.id not in present
+            ]
+            if rows:
+                dst.execute(table.insert(), rows)
+                copied += len(rows)
+            if table.name == 'therapy_sessions':
+                new_session_ids = [row['id'] for row in rows]
+
+        for table in (SessionMetrics.__table__, SessionMetricsRollup.__table__):
+            columns = [c for c in table.c if c.name != 'id']
+            for start in range(0, len(new_session_ids), 500):
+                rows = [row._asdict() for row in src.execute(
+                    db.select(*columns).where(table.c.session_id.in_(new_session_ids[start:start + 500]))
+                )]
+                if rows:
+                    dst.execute(table.insert(), rows)
+                    copied += len(rows)
+    return copied
+
+def _session_rows(engine, patient_id):
+    from api import db
+    from api.models import TherapySession
+
+    sessions = TherapySession.__table__
+    with engine.connect() as connection:
+        return {
+            row.id: row._asdict()
+            for row in connection.execute(db.select(sessions).where(sessions.c.patient_id == patient_id))
+        }
+
+def _resync_sessions(patient_id, source, target, first_copy):
+    """Update target's copies of sessions changed on source since first_copy (e.g. completed there)"""
+    from api.models import TherapySession
+
+    sessions = TherapySession.__table__
+    on_source = _session_rows(source, patient_id)
+    on_target = _session_rows(target, patient_id)
+    updated = 0
+    with target.begin() as dst:
+        for session_id, row in on_source.items():
+            copy = on_target.get(session_id)
+            before = first_copy.get(session_id)
+            if copy is None or copy == row or row == before:
+                continue
+            # Also changed on target after the switch: keep that newer write unless it missed a completion
+            if copy != before and (copy['completed'] or not row['completed']):
+                logging.warning(f"Patient {patient_id}: session {session_id} changed on both shards, kept the new copy")
+                continue
+            dst.execute(sessions.update().where(sessions.c.id == session_id).values(row))
+            updated += 1
+    return updated
+
+def _copy_late_metrics(patient_id, source, target, since):
+    """Copy samples stamped since `since` that source has and target lacks"""
+    from api import db
+    from api.models import TherapySession, SessionMetrics
+
+    sessions, metrics = TherapySession.__table__, SessionMetrics.__table__
+    columns = [c for c in metrics.c if c.name != 'id']
+    where = (
+        metrics.c.session_id.in_(db.select(sessions.c.id).where(sessions.c.patient_id == patient_id)),
+        metrics.c.timestamp >= since
+    )
+    with source.connect() as src, target.begin() as dst:
+        present = set(dst.execute(db.select(metrics.c.session_id, metrics.c.timestamp).where(*where)).all())
+        rows = [
+            row._asdict() for row in src.execute(db.select(*columns).where(*where))
+            if (row.session_id, row.timestamp) not in present
+        ]
+        if rows:
+            dst.execute(metrics.insert(), rows)
+    return len(rows)
+
+def _delete_patient_rows(patient_id, engine):
+    from api import db
+    from api.models import TherapySession, SessionMetrics, SessionMetricsRollup, BaselineAssessment
+
+    sessions = TherapySession.__table__
+    with engine.begin() as connection:
+        session_ids = db.select(sessions.c.id).where(sessions.c.patient_id == patient_id).scalar_subquery()
+        connection.execute(SessionMetrics.__table__.delete().where(SessionMetrics.session_id.in_(session_ids)))
+        connection.execute(
+            SessionMetricsRollup.__table__.delete().where(SessionMetricsRollup.session_id.in_(session_ids))
+        )
+        connection.execute(sessions.delete().where(sessions.c.patient_id == patient_id))
+        connection.execute(
+            BaselineAssessment.__table__.delete().where(BaselineAssessment.patient_id == patient_id)
+        )
+
+def rebalance(moves, force=False, wait=None, log=logging.info):
+    """Move patients' session data to the shards the ring assigns them.
+
+    Copies each patient's rows, points the directory at the new shard, waits
+    for every worker's directory cache to expire, then brings over whatever
+    was written to the old shard meanwhile (new sessions and assessments,
+    samples of already copied sessions, session updates such as completion)
+    and deletes the old copy. Patients
+    with a session in progress are skipped unless force=True (a sample
+    committed to the old shard after the final copy would then be lost).
+    Returns the moved patient ids.
+    """
+    from api import db
+    from api.models import ShardAssignment
+
+    directory = ShardAssignment.__table__
+    switched = []
+    for patient_id, source, target in moves:
+        source_engine, target_engine = db.engines[bind_key(source)], db.engines[bind_key(target)]
+        if source_engine.url == target_engine.url:
+            continue
+        if not force and _has_active_session(source_engine, patient_id):
+            log(f"Patient {patient_id}: session in progress, left on {source}")
+            continue
+        copy_started = datetime.utcnow()
+        first_copy = _session_rows(source_engine, patient_id)
+        copied = _copy_missing(patient_id, source_engine, target_engine)
+        with db.engine.begin() as connection:
+            connection.execute(
+                directory.update().where(directory.c.patient_id == patient_id).values(
+                    shard=target, assigned_at=datetime.utcnow()
+                )
+            )
+        forget(patient_id)
+        switched.append((patient_id, source, target, copy_started, first_copy))
+        log(f"Patient {patient_id}: copied {copied} rows {source} -> {target}")
+
+    if switched:
+        time.sleep(DIRECTORY_TTL + 1 if wait is None else wait)
+    for patient_id, source, target, copy_started, first_copy in switched:
+        source_engine, target_engine = db.engines[bind_key(source)], db.engines[bind_key(target)]
+        late = _copy_missing(patient_id, source_engine, target_engine)
+        late += _resync_sessions(patient_id, source_engine, target_engine, first_copy)
+        late += _copy_late_metrics(patient_id, source_engine, target_engine, copy_started - LATE_WRITE_MARGIN)
+        _delete_patient_rows(patient_id, source_engine)
+        log(f"Patient {patient_id}: moved to {target} ({late} rows written during the switch)")
+    return [patient_id for patient_id, *_ in switched]
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+sync_bp = Blueprint('sync', __name__)
+
+from api.sync import routes
@@ -0,0 +1,114 @@
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required
+from api.sync import sync_bp
+from api import db
+from api.models import User, PatientProfile, TherapySession, BaselineAssessment, ChangeLog
+from api.identity import current_identity, can_view_patient
+from api.serializers import serializer, serialize_all
+from api.sharding import fan_out
+import logging
+
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 2000
+
+@sync_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_changes():
+    """Delta feed of patients, sessions and assessments changed after a cursor.
+
+    Without a cursor only the current cursor is returned with reset=true: the
+    client does a full load through the regular endpoints and then polls
+    with that cursor. Changes are idempotent, so overlap is harmless.
+    """
+    try:
+        identity = current_identity()
+        
+        if identity.role == 'patient':
+            scope = ChangeLog.patient_id == identity.patient_id
+        else:
+            scope = db.or_(ChangeLog.clinician_id == identity.user_id, ChangeLog.clinician_id.is_(None))
+        
+        cursor = request.args.get('cursor')
+        if cursor is None:
+            latest = db.session.execute(db.select(db.func.max(ChangeLog.seq)).where(scope)).scalar()
+            return jsonify({'cursor': latest or 0, 'reset': True}), 200
+        
+        try:
+            cursor = int(cursor)
+            limit = min(max(int(request.args.get('limit', CHANGES_DEFAULT_LIMIT)), 1), CHANGES_MAX_LIMIT)
+        except ValueError:
+            return jsonify({'error': 'cursor and limit must be integers'}), 400
+        
+        entries = db.session.execute(
+            db.select(ChangeLog.seq, ChangeLog.entity_type, ChangeLog.entity_id, ChangeLog.patient_id).where(
+                scope, ChangeLog.seq > cursor
+            ).order_by(ChangeLog.seq).limit(limit)
+        ).all()
+        
+        if not entries:
+            return jsonify({
+                'cursor': cursor,
+                'has_more': False,
+                'patients': [],
+                'sessions': [],
+                'assessments': [],
+                'removed_patients': []
+            }), 200
+        
+        changed = {'patient': set(), 'session': set(), 'assessment': set()}
+        owners = {'patient': set(), 'session': set(), 'assessment': set()}
+        patient_ids = set()
+        for _, entity_type, entity_id, patient_id in entries:
+            changed[entity_type].add(entity_id)
+            owners[entity_type].add(patient_id)
+            patient_ids.add(patient_id)
+        
+        # A change may reference a patient that has since left this caseload
+        profiles = {
+            p.id: p for p in PatientProfile.query.filter(PatientProfile.id.in_(patient_ids)).all()
+        }
+        visible = {
+            pid for pid, p in profiles.items()
+            if can_view_patient(p) or (identity.role == 'clinician' and p.assigned_clinician_id is None)
+        }
+        removed = sorted(patient_ids - visible)
+        
+        users = {}
+        changed_patients = [profiles[pid] for pid in sorted(changed['patient'] & visible)]
+        if changed_patients:
+            users = {
+                u.id: u for u in User.query.filter(User.id.in_([p.user_id for p in changed_patients])).all()
+            }
+        
+        # Sessions and assessments are read from each owning patient's shard
+        sessions = []
+        if owners['session'] & visible:
+            sessions = fan_out(lambda ids: TherapySession.query.filter(
+                TherapySession.id.in_(changed['session']),
+                TherapySession.patient_id.in_(ids)
+            ).all(), list(owners['session'] & visible))
+        
+        assessments = []
+        if owners['assessment'] & visible:
+            assessments = fan_out(lambda ids: BaselineAssessment.query.filter(
+                BaselineAssessment.id.in_(changed['assessment']),
+                BaselineAssessment.patient_id.in_(ids)
+            ).all(), list(owners['assessment'] & visible))
+        
+        serialize_profile = serializer(PatientProfile)
+        serialize_user = serializer(User)
+        
+        return jsonify({
+            'cursor': entries[-1].seq,
+            'has_more': len(entries) == limit,
+            'patients': [
+                {**serialize_profile(p), 'user': serialize_user(users[p.user_id])} for p in changed_patients
+            ],
+            'sessions': serialize_all(TherapySession, sessions),
+            'assessments': serialize_all(BaselineAssessment, assessments),
+            'removed_patients': removed
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Get changes error: {str(e)}")
+        return jsonify({'error': 'Failed to get changes'}), 500
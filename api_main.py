@@ -1,7 +1,10 @@
 from api import create_app
 import os
 
-app = create_app()
+# Hashing pool processes (forkserver/spawn) re-run this script as __mp_main__;
+# they only hash passwords and must not build a second app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))  # Render uses PORT
@@ -4,14 +4,22 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from observability import instrument, configure_logging
+from group_commit import GroupCommitWriter
+from db_routing import RoutingSession, replica_binds, init_routing
+from fragment_cache import init_fragment_cache
+import sqlite_profile
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# 'production' skips schema creation at import; run migrate_db.py on deploy instead
+APP_ENV = os.environ.get("APP_ENV", "development")
+
+# Configure logging (level from LOG_LEVEL / APP_ENV, formatted off the request thread)
+configure_logging()
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 # Create the app
 app = Flask(__name__)
@@ -21,18 +29,41 @@ if not session_secret:
 app.secret_key = session_secret
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Session data lives on the API's shards when SHARD_URLS is set; this app would
+# write sessions, samples and assessments to the primary where the API never reads them
+if os.environ.get("SHARD_URLS", "").strip():
+    raise ValueError("The template app does not support SHARD_URLS; serve sharded deployments through the API only")
+
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///instance/neurobeat.db")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+# Optional read replica for dashboards and progress pages (DATABASE_REPLICA_URL)
+app.config["SQLALCHEMY_BINDS"] = replica_binds()
+
+# WAL, busy timeout and cache pragmas on every SQLite connection
+sqlite_profile.install()
 
 # Initialize the app with the extension
 db.init_app(app)
 
+# Per-endpoint latency, status and SQL metrics at /metrics
+instrument(app, 'html')
+
+# Read-your-writes: remember the last write in the session cookie
+init_routing(app)
+
+# {% cache %} for dashboard and progress fragments, keyed by PatientProfile.data_version
+init_fragment_cache(app)
+
 with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
-    db.create_all()
-    logging.info("Database tables created successfully")
+    if APP_ENV != "production":
+        db.create_all()
+        logging.info("Database tables created successfully")
+
+    # Live-session metric rows are committed in batches by one writer per process
+    metric_writer = GroupCommitWriter(db.engine, models.SessionMetrics.__table__)
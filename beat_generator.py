@@ -1,9 +1,12 @@
 
-import requests
 import json
 import logging
 from typing import Dict, Optional
 import random
+from observability import span, traced
+from singleflight import SingleFlight
+
+beat_flights = SingleFlight('beat')
 
 class BeatGenerator:
     def __init__(self):
@@ -39,29 +42,34 @@ class BeatGenerator:
             }
         }
         
+    @traced('beat.generate')
     def generate_stroke_therapy_beat(self, session_type: str, bpm: int, patient_condition: Dict) -> Optional[str]:
         """
         Generate therapeutic beats for stroke patients based on session type and patient condition
         """
         try:
-            # Determine the appropriate sound and parameters based on session type
-            if session_type == "gait_trainer":
-                return self._generate_gait_beat(bpm, patient_condition)
-            elif session_type == "upper_limb_motor":
-                return self._generate_motor_beat(bpm, patient_condition)
-            elif session_type == "melodic_intonation":
-                return self._generate_melodic_beat(bpm, patient_condition)
-            elif session_type == "speech_rhythm":
-                return self._generate_speech_beat(bpm, patient_condition)
-            elif session_type == "cognitive_rhythm":
-                return self._generate_cognitive_beat(bpm, patient_condition)
-            else:
-                return self._generate_basic_beat(bpm)
-                
+            # Tablets starting the same protocol at the same tempo share one render
+            key = (session_type, bpm, tuple(sorted(patient_condition.items())))
+            return beat_flights.do(key, self._generate_beat, session_type, bpm, patient_condition)
         except Exception as e:
             logging.error(f"Beat generation error: {str(e)}")
             return None
     
+    def _generate_beat(self, session_type: str, bpm: int, patient_condition: Dict) -> Optional[str]:
+        # Determine the appropriate sound and parameters based on session type
+        if session_type == "gait_trainer":
+            return self._generate_gait_beat(bpm, patient_condition)
+        elif session_type == "upper_limb_motor":
+            return self._generate_motor_beat(bpm, patient_condition)
+        elif session_type == "melodic_intonation":
+            return self._generate_melodic_beat(bpm, patient_condition)
+        elif session_type == "speech_rhythm":
+            return self._generate_speech_beat(bpm, patient_condition)
+        elif session_type == "cognitive_rhythm":
+            return self._generate_cognitive_beat(bpm, patient_condition)
+        else:
+            return self._generate_basic_beat(bpm)
+    
     def _generate_gait_beat(self, bpm: int, patient_condition: Dict) -> Optional[str]:
         """Generate rhythmic beats for gait training (40-60 BPM start range)"""
         preferred_sound = patient_condition.get('preferred_sound', 'metronome')
@@ -170,18 +178,23 @@ class BeatGenerator:
                 }
             }
             
-            response = requests.post(model_url, headers=headers, json=payload, timeout=30)
+            import requests
+            
+            with span('beat.remote_call', **{'http.url': model_url}) as call:
+                response = requests.post(model_url, headers=headers, json=payload, timeout=30)
+                if call is not None:
+                    call.set_attribute('http.status_code', response.status_code)
             
             if response.status_code == 200:
                 logging.info("Successfully generated audio via API")
                 return f"api_audio:{sound_type}:{bpm}"
             else:
-                logging.warning(f"API request failed: {response.status_code} - {response.text}")
+                logging.warning("API request failed: %s - %s", response.status_code, response.text)
                 # Return local audio generation instead
                 return self._generate_local_audio_url(bpm, sound_type)
                 
         except Exception as e:
-            logging.warning(f"Audio API unavailable, using local generation: {str(e)}")
+            logging.warning("Audio API unavailable, using local generation: %s", e)
             # Fallback to local audio generation
             return self._generate_local_audio_url(bpm, sound_type)
     
@@ -189,6 +202,7 @@ class BeatGenerator:
         """Generate local audio configuration for client-side generation"""
         return f"local_audio:{sound_type}:{bpm}"
     
+    @traced('beat.optimal_bpm')
     def get_optimal_bpm_for_stroke_therapy(self, session_type: str, patient_condition: Dict) -> int:
         """Get optimal BPM based on stroke therapy guidelines"""
         severity = patient_condition.get('severity', 'moderate')
@@ -0,0 +1,244 @@
+"""Time the hot request paths of both apps at realistic clinic sizes.
+
+For each scale a synthetic cohort (benchmarks/cohort.py) is generated into
+a fresh SQLite file, then a separate interpreter imports both apps against
+it and times each case through the test clients: wall time per call and SQL
+statements per call. Results are written as JSON and, when a baseline file
+exists, compared against it case by case.
+
+    python benchmarks/bench_hot_paths.py --scales small,medium --output results.json
+    python benchmarks/bench_hot_paths.py --save-baseline        # store benchmarks/baseline.json
+    python benchmarks/bench_hot_paths.py --baseline benchmarks/baseline.json --tolerance 0.2
+
+The exit status is 1 when any case's median is more than --tolerance (and
+--min-delta-ms) slower than the baseline. beat.generate calls the remote audio API and only runs
+with --network.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# (name, client, method, path, json body); clients are logged in as clinician0 or patient0
+CASES = [
+    ('html.clinician_dashboard', 'html_clinician', 'GET', '/clinician/dashboard', None),
+    ('html.patient_dashboard', 'html_patient', 'GET', '/patient/dashboard', None),
+    ('html.progress_view', 'html_clinician', 'GET', '/progress/1', None),
+    ('html.progress_data', 'html_clinician', 'GET', '/api/progress/1', None),
+    ('html.update_session', 'html_patient', 'POST', '/session/update',
+     {'session_id': 1, 'current_bpm': 60, 'sync_accuracy': 82}),
+    ('api.patients', 'api_clinician', 'GET', '/api/patients', None),
+    ('api.cohort', 'api_clinician', 'GET', '/api/patients/cohort', None),
+    ('api.patient_detail', 'api_clinician', 'GET', '/api/patients/1', None),
+    ('api.progress', 'api_clinician', 'GET', '/api/assessments/progress/1', None),
+    ('api.session_history', 'api_clinician', 'GET', '/api/patients/1/sessions', None),
+    ('api.update_session', 'api_patient', 'POST', '/api/sessions/1/update',
+     {'current_bpm': 60, 'sync_accuracy': 82}),
+]
+
+WORKER_ENV = {
+    'SESSION_SECRET': 'benchmark',
+    'JWT_SECRET_KEY': 'benchmark-jwt-secret-key-of-sufficient-length',
+    'LOG_LEVEL': 'WARNING',
+    'NPLUSONE_MODE': 'off',
+    'TRACE_SAMPLE_RATE': '0',
+    'SLOW_QUERY_MS': '100000',
+}
+
+
+def _summary(samples, queries):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'median_ms': round(statistics.median(ordered) * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'queries': queries,
+    }
+
+def _timed(call, repeat, warmup, query_count):
+    for _ in range(warmup):
+        call()
+    samples = []
+    queries = 0
+    for _ in range(repeat):
+        before = query_count[0]
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+        queries = query_count[0] - before
+    return _summary(samples, queries)
+
+def run_worker(repeat, warmup, network):
+    """Runs in a fresh interpreter with DATABASE_URL pointing at a generated cohort"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app as html_app
+    import routes  # noqa: F401
+    from api import create_app
+    from beat_generator import BeatGenerator
+    from benchmarks.cohort import COHORT_PASSWORD
+
+    query_count = [0]
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count(*args):
+        query_count[0] += 1
+
+    api_app = create_app()
+    clients = {}
+    for name, user_id, user_type in [('html_clinician', 1, 'clinician'), ('html_patient', 2, 'patient')]:
+        client = html_app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['user_id'] = user_id
+            flask_session['user_type'] = user_type
+        clients[name] = client
+    for name, username in [('api_clinician', 'clinician0'), ('api_patient', 'patient0')]:
+        client = api_app.test_client()
+        token = client.post('/api/auth/login', json={'username': username, 'password': COHORT_PASSWORD}).json['access_token']
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        clients[name] = client
+
+    results = {}
+    for name, client_name, method, path, body in CASES:
+        client = clients[client_name]
+
+        def call(client=client, method=method, path=path, body=body):
+            response = client.open(path, method=method, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f'{method} {path} returned {response.status_code}')
+
+        results[name] = _timed(call, repeat, warmup, query_count)
+
+    generator = BeatGenerator()
+    condition = {'severity': 'moderate', 'affected_side': 'left', 'preferred_sound': 'metronome'}
+    results['beat.optimal_bpm'] = _timed(
+        lambda: generator.get_optimal_bpm_for_stroke_therapy('gait_trainer', condition), repeat, warmup, query_count
+    )
+    if network:
+        results['beat.generate'] = _timed(
+            lambda: generator.generate_stroke_therapy_beat('gait_trainer', 50, condition), repeat, warmup, query_count
+        )
+    return results
+
+def run_scale(scale, repeat, warmup, network, seed):
+    from benchmarks.cohort import build_database
+
+    with tempfile.TemporaryDirectory(prefix='neurobeat-bench-') as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'cohort.db')
+        started = time.perf_counter()
+        counts = build_database(url, scale, seed=seed)
+        print(f"{scale}: generated {counts} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        env = {**os.environ, **WORKER_ENV, 'DATABASE_URL': url}
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--repeat', str(repeat), '--warmup', str(warmup)]
+        if network:
+            command.append('--network')
+        out = subprocess.run(command, capture_output=True, text=True, cwd=ROOT, env=env)
+        if out.returncode != 0:
+            raise RuntimeError(f'{scale} worker failed:\n{out.stderr}')
+        return counts, json.loads(out.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print median changes against the baseline; returns the regressed (scale, case) pairs"""
+    regressions = []
+    for scale, cases in results['results'].items():
+        base_cases = baseline.get('results', {}).get(scale, {})
+        for name, stats in cases.items():
+            base = base_cases.get(name)
+            if not base or not base['median_ms']:
+                print(f"{scale:7s} {name:26s} {stats['median_ms']:9.3f} ms  (no baseline)", file=sys.stderr)
+                continue
+            change = stats['median_ms'] / base['median_ms'] - 1
+            flag = ''
+            if change > tolerance and stats['median_ms'] - base['median_ms'] > min_delta_ms:
+                flag = '  REGRESSION'
+                regressions.append((scale, name))
+            print(f"{scale:7s} {name:26s} {stats['median_ms']:9.3f} ms  baseline {base['median_ms']:9.3f} ms "
+                  f"{change:+7.1%}  queries {stats['queries']} (was {base['queries']}){flag}", file=sys.stderr)
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ROOT, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='small,medium', help='comma-separated scales from benchmarks/cohort.py')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--network', action='store_true', help='also time beat generation through the remote API')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed median slowdown (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                        help='ignore slowdowns smaller than this in absolute terms')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.repeat, args.warmup, args.network)))
+        return
+
+    from benchmarks.cohort import SCALES, scale_dimensions
+
+    scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scales: {', '.join(unknown)}")
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'scales': {},
+        'results': {},
+    }
+    for scale in scales:
+        counts, cases = run_scale(scale, args.repeat, args.warmup, args.network, args.seed)
+        results['scales'][scale] = {**scale_dimensions(scale), 'rows': counts}
+        results['results'][scale] = cases
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    elif not args.save_baseline:
+        print(output)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(output + '\n')
+        print(f'Baseline written to {args.baseline}', file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Measure password verification throughput through the hashing service.
+
+Runs concurrent verifications against a stored hash and reports logins/sec
+overall and per core, plus how many attempts were shed with HashingBusy.
+
+    python benchmarks/bench_password_hashing.py --method scrypt --threads 8 --seconds 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from password_hashing import HashingService, HashingBusy
+
+
+def run(service, password_hash, threads, seconds):
+    counts = {'ok': 0, 'busy': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        while time.perf_counter() < deadline:
+            try:
+                service.verify(password_hash, 'correct horse battery staple')
+                outcome = 'ok'
+            except HashingBusy:
+                outcome = 'busy'
+                time.sleep(0.01)
+            with lock:
+                counts[outcome] += 1
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return counts, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    service = HashingService(method=args.method, workers=args.workers, queue_depth=args.queue, timeout=30)
+    password_hash = service.hash('correct horse battery staple')
+    counts, elapsed = run(service, password_hash, args.threads, args.seconds)
+    service.shutdown()
+
+    cores = max(args.workers, 1)
+    rate = counts['ok'] / elapsed
+    print(f"method={service.method_prefix} workers={args.workers} queue={args.queue} threads={args.threads}")
+    print(f"logins: {counts['ok']} in {elapsed:.1f}s, rejected busy: {counts['busy']}")
+    print(f"logins/sec: {rate:.2f}  per core: {rate / cores:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Measure metric-row writes/sec on SQLite with several writer processes.
+
+Simulates gunicorn workers committing SessionMetrics rows concurrently and
+compares three setups, each on a fresh database file:
+
+  default   the previous configuration: rollback journal, one commit per row
+  profile   sqlite_profile pragmas (WAL, synchronous=NORMAL, busy_timeout, ...)
+  group     the pragmas plus group_commit.GroupCommitWriter batching
+
+    python benchmarks/bench_sqlite_writes.py --processes 4 --threads 8 --seconds 10
+
+Reports rows/sec, insert latency percentiles and how many inserts failed
+with "database is locked".
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SETUPS = {
+    'default': {'profile': False, 'group': False},
+    'profile': {'profile': True, 'group': False},
+    'group': {'profile': True, 'group': True},
+}
+SESSIONS = 200
+
+
+def _writer_process(url, setup, threads, seconds, results):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    import sqlite_profile
+    from group_commit import GroupCommitWriter
+    from api.models import SessionMetrics
+
+    if SETUPS[setup]['profile']:
+        sqlite_profile.install()
+    engine = create_engine(url)
+    writer = GroupCommitWriter(engine, SessionMetrics.__table__, enabled=SETUPS[setup]['group'])
+
+    lock = threading.Lock()
+    latencies, counts = [], {'ok': 0, 'locked': 0}
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        local, ok, locked = [], 0, 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                writer.insert({
+                    'session_id': n % SESSIONS + 1, 'timestamp': datetime.utcnow(),
+                    'current_bpm': 60.0, 'sync_accuracy': 80.0, 'adjustment_made': False,
+                })
+                ok += 1
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            counts['ok'] += ok
+            counts['locked'] += locked
+
+    pool = [threading.Thread(target=worker, args=(os.getpid() * 1000 + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    results.put((counts, latencies))
+
+def _prepare(url):
+    from sqlalchemy import create_engine
+    from api import db
+    from api.models import PatientProfile, TherapySession, User
+
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [{
+            'id': 1, 'username': 'bench', 'email': 'bench@example.test', 'password_hash': '-',
+            'user_type': 'patient', 'first_name': 'B', 'last_name': 'W',
+        }])
+        connection.execute(PatientProfile.__table__.insert(), [{'id': 1, 'user_id': 1, 'condition': 'stroke'}])
+        connection.execute(TherapySession.__table__.insert(), [
+            {'id': i, 'patient_id': 1, 'session_type': 'gait_trainer', 'initial_bpm': 60, 'target_bpm': 70}
+            for i in range(1, SESSIONS + 1)
+        ])
+    engine.dispose()
+
+def run(setup, processes, threads, seconds):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='neurobeat-writes-') as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'writes.db')
+        _prepare(url)
+        results = context.Queue()
+        workers = [
+            context.Process(target=_writer_process, args=(url, setup, threads, seconds, results))
+            for _ in range(processes)
+        ]
+        for p in workers:
+            p.start()
+        collected = [results.get() for _ in workers]
+        for p in workers:
+            p.join()
+
+    ok = sum(counts['ok'] for counts, _ in collected)
+    locked = sum(counts['locked'] for counts, _ in collected)
+    latencies = sorted(latency for _, samples in collected for latency in samples)
+
+    def pct(fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000 if latencies else 0
+
+    print(f"{setup:8s} {ok / seconds:9.0f} rows/s  locked {locked:6d}  "
+          f"p50 {pct(0.5):7.2f} ms  p99 {pct(0.99):8.2f} ms  max {pct(1):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help='writer processes (gunicorn workers)')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent requests per process')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--setups', default=','.join(SETUPS), help='comma-separated subset of: ' + ', '.join(SETUPS))
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:g}s each")
+    for setup in args.setups.split(','):
+        run(setup.strip(), args.processes, args.threads, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Measure cold-start cost of the deploy entry points.
+
+Each run starts a fresh interpreter (as a serverless cold start or a new
+worker would), imports the entry point and serves one request through the
+test client, reporting import time and first-request time.
+
+    APP_ENV=production python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    'api_main': ('api_main', 'app', '/api/health'),
+    # Vercel loads the function file directly, not as part of the api package
+    'vercel': ('api/index.py', 'application', '/'),
+}
+
+PROBE = """
+import sys, time, json, importlib, importlib.util
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+if {module!r}.endswith('.py'):
+    spec = importlib.util.spec_from_file_location('entry', {module!r})
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+else:
+    module = importlib.import_module({module!r})
+imported = time.perf_counter()
+response = getattr(module, {attr!r}).test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'first_request': served - imported, 'status': response.status_code}}))
+"""
+
+
+def measure(name, runs):
+    module, attr, path = ENTRY_POINTS[name]
+    code = PROBE.format(root=ROOT, module=module, attr=attr, path=path)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--entry', choices=sorted(ENTRY_POINTS), action='append')
+    args = parser.parse_args()
+
+    print(f"APP_ENV={os.environ.get('APP_ENV', 'development')}")
+    for name in args.entry or sorted(ENTRY_POINTS):
+        samples = measure(name, args.runs)
+        imports = statistics.median(s['import'] for s in samples) * 1000
+        first = statistics.median(s['first_request'] for s in samples) * 1000
+        statuses = sorted({s['status'] for s in samples})
+        print(f"{name:10s} import {imports:7.1f} ms  first request {first:7.1f} ms  total {imports + first:7.1f} ms  status {statuses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Deterministic synthetic clinic data for benchmarks.
+
+Populates clinicians, their stroke and Parkinson's patients, completed
+therapy sessions with a metric row every 5 seconds, and baseline
+assessments. The same seed, scale and anchor date always produce the same
+rows (apart from the password salt), so timings at a scale are comparable
+between runs.
+
+    python benchmarks/cohort.py --scale medium --db /tmp/cohort.db
+
+Every generated account has the password COHORT_PASSWORD; the first
+clinician is clinician0 and the first patient patient0.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COHORT_PASSWORD = 'cohort-password'
+UPDATE_INTERVAL_SECONDS = 5
+HISTORY_DAYS = 90
+INSERT_CHUNK = 5000
+
+# clinicians, patients per clinician, sessions per patient, metric rows per session
+SCALES = {
+    'small': (2, 10, 20, 36),
+    'medium': (5, 30, 60, 36),
+    'large': (10, 60, 120, 36),
+}
+
+SESSION_TYPES = {
+    'stroke': ['gait_trainer', 'upper_limb_motor', 'melodic_intonation', 'speech_rhythm', 'cognitive_rhythm'],
+    'parkinsons': ['gait_trainer', 'upper_limb_motor'],
+}
+ASSESSMENTS = {
+    'stroke': [('gait', 70, 110), ('tapping', 2, 5), ('speech', 90, 150), ('balance', 20, 50),
+               ('coordination', 2, 8), ('cognitive', 15, 28)],
+    'parkinsons': [('gait', 80, 115), ('tapping', 3, 6), ('speech', 110, 160)],
+}
+SEVERITIES = ['mild', 'moderate', 'severe']
+
+
+def scale_dimensions(scale):
+    clinicians, patients, sessions, metrics = SCALES[scale]
+    return {
+        'clinicians': clinicians,
+        'patients_per_clinician': patients,
+        'sessions_per_patient': sessions,
+        'metrics_per_session': metrics,
+    }
+
+def _insert(connection, table, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        connection.execute(table.insert(), rows[i:i + INSERT_CHUNK])
+
+def populate(connection, clinicians, patients_per_clinician, sessions_per_patient, metrics_per_session,
+             seed=0, anchor=None, password_hash=None):
+    """Insert a synthetic cohort through a Core connection into an empty schema.
+
+    Sessions start within the HISTORY_DAYS before anchor (default: today's
+    midnight UTC). Returns the number of rows per table.
+    """
+    from api.models import User, PatientProfile, ClinicianProfile, TherapySession, SessionMetrics, BaselineAssessment
+    from password_hashing import password_hasher
+
+    rng = random.Random(seed)
+    anchor = anchor or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    password_hash = password_hash or password_hasher.hash(COHORT_PASSWORD)
+    created_at = anchor - timedelta(days=HISTORY_DAYS + 1)
+
+    users, clinician_profiles, patient_profiles = [], [], []
+    sessions, metrics, assessments = [], [], []
+    user_id = patient_id = session_id = metric_id = 0
+
+    for c in range(clinicians):
+        user_id += 1
+        clinician_user_id = user_id
+        users.append({
+            'id': user_id, 'username': f'clinician{c}', 'email': f'clinician{c}@cohort.test',
+            'password_hash': password_hash, 'user_type': 'clinician',
+            'first_name': 'Clinician', 'last_name': str(c), 'created_at': created_at,
+        })
+        clinician_profiles.append({
+            'id': c + 1, 'user_id': user_id, 'license_number': f'LIC-{c:05d}',
+            'specialization': rng.choice(['neurology', 'physiotherapy', 'speech therapy']),
+        })
+
+        for _ in range(patients_per_clinician):
+            user_id += 1
+            patient_id += 1
+            n = patient_id - 1
+            condition = 'stroke' if rng.random() < 0.6 else 'parkinsons'
+            severity = rng.choice(SEVERITIES)
+            cadence = round(rng.uniform(70, 115), 1)
+            speech_rate = round(rng.uniform(90, 160), 1)
+            users.append({
+                'id': user_id, 'username': f'patient{n}', 'email': f'patient{n}@cohort.test',
+                'password_hash': password_hash, 'user_type': 'patient',
+                'first_name': 'Patient', 'last_name': str(n), 'created_at': created_at,
+            })
+            profile = {
+                'id': patient_id, 'user_id': user_id, 'condition': condition,
+                'baseline_cadence': cadence, 'target_cadence': round(cadence * 1.1, 1),
+                'baseline_tapping_speed': round(rng.uniform(2, 6), 2),
+                'baseline_speech_rate': speech_rate, 'target_speech_rate': round(speech_rate * 1.15, 1),
+                'assigned_clinician_id': clinician_user_id,
+                'stroke_affected_side': None, 'stroke_severity': None, 'aphasia_type': None,
+                'dysarthria_severity': None, 'motor_impairment_level': None, 'cognitive_status': None,
+                'emotional_status': None, 'preferred_music_genre': None, 'preferred_beat_sound': 'metronome',
+            }
+            if condition == 'stroke':
+                profile.update({
+                    'stroke_affected_side': rng.choice(['left', 'right', 'bilateral']),
+                    'stroke_severity': severity,
+                    'aphasia_type': rng.choice(['none', 'broca', 'wernicke', 'global']),
+                    'dysarthria_severity': rng.choice(['none'] + SEVERITIES),
+                    'motor_impairment_level': rng.choice(SEVERITIES),
+                    'cognitive_status': rng.choice(['normal', 'mild_impairment', 'moderate_impairment']),
+                    'emotional_status': rng.choice(['stable', 'depression', 'anxiety']),
+                    'preferred_music_genre': rng.choice(['classical', 'jazz', 'pop', 'folk']),
+                    'preferred_beat_sound': rng.choice(['metronome', 'drum', 'soft_bell', 'wooden_block', 'piano']),
+                })
+            patient_profiles.append(profile)
+
+            for assessment_type, low, high in ASSESSMENTS[condition]:
+                assessments.append({
+                    'patient_id': patient_id, 'assessment_type': assessment_type,
+                    'measured_value': round(rng.uniform(low, high), 1), 'notes': None,
+                    'assessed_by': clinician_user_id,
+                    'created_at': created_at + timedelta(hours=rng.uniform(0, 24)),
+                })
+
+            # Patients improve over their history: accuracy drifts up from a per-patient start
+            accuracy = rng.uniform(45, 75)
+            bpm = {'mild': 60.0, 'moderate': 50.0, 'severe': 40.0}[severity]
+            for s in range(sessions_per_patient):
+                session_id += 1
+                day = HISTORY_DAYS * (s + rng.random()) / sessions_per_patient
+                start = anchor - timedelta(days=HISTORY_DAYS) + timedelta(days=day)
+                accuracy = min(accuracy + rng.uniform(-1.5, 2.5), 98)
+                duration = metrics_per_session * UPDATE_INTERVAL_SECONDS
+                current_bpm = bpm
+                session_accuracy = []
+                for m in range(metrics_per_session):
+                    metric_id += 1
+                    sample = min(max(rng.gauss(accuracy, 8), 0), 100)
+                    adjusted = current_bpm
+                    if sample < 70:
+                        adjusted = max(current_bpm - 2, 40)
+                    elif sample > 90:
+                        adjusted = min(current_bpm + 1, 120)
+                    metrics.append({
+                        'id': metric_id, 'session_id': session_id,
+                        'timestamp': start + timedelta(seconds=m * UPDATE_INTERVAL_SECONDS),
+                        'current_bpm': current_bpm, 'sync_accuracy': round(sample, 1),
+                        'adjustment_made': adjusted != current_bpm,
+                    })
+                    session_accuracy.append(sample)
+                    current_bpm = adjusted
+                sessions.append({
+                    'id': session_id, 'patient_id': patient_id,
+                    'session_type': rng.choice(SESSION_TYPES[condition]),
+                    'start_time': start, 'end_time': start + timedelta(seconds=duration),
+                    'initial_bpm': bpm, 'final_bpm': current_bpm, 'target_bpm': bpm + 10,
+                    'duration_seconds': duration,
+                    'accuracy_score': round(sum(session_accuracy) / len(session_accuracy), 1) if session_accuracy else None,
+                    'completed': True, 'notes': '',
+                    'affected_limb': profile['stroke_affected_side'],
+                    'cognitive_load_level': rng.randint(1, 3),
+                    'generated_beat_url': f"local_audio:{profile['preferred_beat_sound']}:{int(bpm)}",
+                })
+                bpm = min(bpm + rng.choice([0, 0, 1]), 120)
+
+    for model, rows in [
+        (User, users), (ClinicianProfile, clinician_profiles), (PatientProfile, patient_profiles),
+        (TherapySession, sessions), (SessionMetrics, metrics), (BaselineAssessment, assessments),
+    ]:
+        _insert(connection, model.__table__, rows)
+
+    return {
+        'users': len(users), 'patients': len(patient_profiles), 'sessions': len(sessions),
+        'metrics': len(metrics), 'assessments': len(assessments),
+    }
+
+def build_database(url, scale, seed=0, anchor=None):
+    """Create the schema at url and populate it at a named scale"""
+    from sqlalchemy import create_engine
+    from api import db
+    import api.models  # noqa: F401
+
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        counts = populate(connection, seed=seed, anchor=anchor, **scale_dimensions(scale))
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--db', required=True, help='SQLite file to create (must not exist)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        parser.error(f'{args.db} already exists')
+
+    started = time.perf_counter()
+    counts = build_database('sqlite:///' + os.path.abspath(args.db), args.scale, seed=args.seed)
+    print(f"{args.scale}: " + ', '.join(f'{n} {table}' for table, n in counts.items())
+          + f" in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""Load-test live therapy sessions against a locally started gunicorn.
+
+Each simulated patient follows the static/js/session.js lifecycle: log in,
+POST /session/start, POST /session/update every --interval seconds, then
+complete the session. Starts are spread over --ramp seconds. Patients come
+from a synthetic cohort (benchmarks/cohort.py) in a fresh SQLite file, so
+runs are repeatable.
+
+    python benchmarks/load_sessions.py --patients 200 --duration 60 --workers 1 --worker-class sync
+    python benchmarks/load_sessions.py --patients 500 --worker-class gthread --threads 8 --output load.json
+    python benchmarks/load_sessions.py --target api --patients 200
+
+--target api drives the JWT API (/api/auth/login, /api/sessions/...) with
+the production gunicorn.conf.py instead of the HTML app. The report gives
+throughput, p50/p95/p99 latency per endpoint, error rates, and how many
+server errors were SQLite "database is locked" failures (counted from the
+server log). Stroke patients' /session/start includes the remote beat
+generation call, as in production.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVER_ENV = {
+    'SESSION_SECRET': 'load-test',
+    'JWT_SECRET_KEY': 'load-test-jwt-secret-key-of-sufficient-length',
+    'APP_ENV': 'production',
+    'LOG_FORMAT': 'text',
+    'LOG_LEVEL': 'WARNING',
+}
+LOCK_MARKER = 'database is locked'
+
+
+class Recorder:
+    """Latency samples and failures per endpoint, shared by all patient threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.failures = {}
+
+    def record(self, endpoint, seconds, ok, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                failures = self.failures.setdefault(endpoint, {})
+                failures[status] = failures.get(status, 0) + 1
+
+
+class HtmlPatient:
+    """The browser session: form login with a cookie, JSON posts to /session/*"""
+
+    def __init__(self, base, username, password):
+        self.base, self.username, self.password = base, username, password
+        self.http = requests.Session()
+        self.session_id = None
+
+    def login(self):
+        response = self.http.post(f'{self.base}/login', allow_redirects=False,
+                                  data={'username': self.username, 'password': self.password})
+        return response, response.status_code == 302 and 'dashboard' in response.headers.get('Location', '')
+
+    def start(self, bpm):
+        response = self.http.post(f'{self.base}/session/start',
+                                  json={'session_type': 'gait_trainer', 'initial_bpm': bpm, 'target_bpm': bpm + 10})
+        if response.status_code == 200:
+            self.session_id = response.json()['session_id']
+        return response, response.status_code == 200
+
+    def update(self, bpm, accuracy):
+        response = self.http.post(f'{self.base}/session/update',
+                                  json={'session_id': self.session_id, 'current_bpm': bpm, 'sync_accuracy': accuracy})
+        return response, response.status_code == 200
+
+    def complete(self, duration, bpm, accuracy):
+        response = self.http.post(f'{self.base}/session/{self.session_id}/complete',
+                                  json={'duration': duration, 'final_bpm': bpm, 'accuracy_score': accuracy, 'notes': ''})
+        return response, response.status_code == 200
+
+
+class ApiPatient(HtmlPatient):
+    """The same lifecycle through the JWT API"""
+
+    def login(self):
+        response = self.http.post(f'{self.base}/api/auth/login',
+                                  json={'username': self.username, 'password': self.password})
+        if response.status_code == 200:
+            self.http.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+        return response, response.status_code == 200
+
+    def start(self, bpm):
+        response = self.http.post(f'{self.base}/api/sessions/start',
+                                  json={'session_type': 'gait_trainer', 'initial_bpm': bpm, 'target_bpm': bpm + 10})
+        if response.status_code == 201:
+            self.session_id = response.json()['session']['id']
+        return response, response.status_code == 201
+
+    def update(self, bpm, accuracy):
+        response = self.http.post(f'{self.base}/api/sessions/{self.session_id}/update',
+                                  json={'current_bpm': bpm, 'sync_accuracy': accuracy})
+        return response, response.status_code == 200
+
+    def complete(self, duration, bpm, accuracy):
+        response = self.http.post(f'{self.base}/api/sessions/{self.session_id}/complete',
+                                  json={'duration': duration, 'final_bpm': bpm, 'accuracy_score': accuracy, 'notes': ''})
+        return response, response.status_code == 200
+
+
+def _call(recorder, endpoint, action, *args):
+    started = time.perf_counter()
+    try:
+        response, ok = action(*args)
+        status = response.status_code
+    except requests.RequestException as e:
+        ok, status = False, type(e).__name__
+    recorder.record(endpoint, time.perf_counter() - started, ok, status)
+    return ok
+
+def run_patient(patient, recorder, delay, duration, interval, seed):
+    rng = random.Random(seed)
+    time.sleep(delay)
+    if not _call(recorder, 'login', patient.login):
+        return
+    bpm = 60.0
+    if not _call(recorder, 'start', patient.start, bpm):
+        return
+
+    started = time.monotonic()
+    accuracies = []
+    next_update = started + interval
+    while next_update - started <= duration:
+        time.sleep(max(next_update - time.monotonic(), 0))
+        accuracy = round(rng.uniform(60, 98), 1)
+        accuracies.append(accuracy)
+        _call(recorder, 'update', patient.update, bpm, accuracy)
+        next_update += interval
+
+    mean_accuracy = sum(accuracies) / len(accuracies) if accuracies else 0
+    _call(recorder, 'complete', patient.complete, int(time.monotonic() - started), bpm, mean_accuracy)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not answer at {url} within {timeout}s')
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(recorder, elapsed, log_text):
+    endpoints = {}
+    total = failed = 0
+    for endpoint, samples in recorder.samples.items():
+        ordered = sorted(samples)
+        failures = recorder.failures.get(endpoint, {})
+        errors = sum(failures.values())
+        total += len(samples)
+        failed += errors
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4),
+            'statuses': {str(status): n for status, n in failures.items()},
+            'p50_ms': round(_percentile(ordered, 0.50) * 1000, 1),
+            'p95_ms': round(_percentile(ordered, 0.95) * 1000, 1),
+            'p99_ms': round(_percentile(ordered, 0.99) * 1000, 1),
+            'max_ms': round(ordered[-1] * 1000, 1),
+        }
+    locks = log_text.count(LOCK_MARKER)
+    return {
+        'elapsed_s': round(elapsed, 1),
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0,
+        'errors': failed,
+        'error_rate': round(failed / total, 4) if total else 0,
+        'lock_errors': locks,
+        'lock_rate': round(locks / total, 4) if total else 0,
+        'endpoints': endpoints,
+    }
+
+def print_report(config, summary):
+    print(f"{config['target']} target, {config['patients']} patients, {config['workers']} x {config['worker_class']}"
+          f" (threads {config['threads']}), update every {config['interval']}s for {config['duration']}s")
+    print(f"{summary['requests']} requests in {summary['elapsed_s']}s: {summary['throughput_rps']} req/s, "
+          f"error rate {summary['error_rate']:.2%}, lock errors {summary['lock_errors']} ({summary['lock_rate']:.2%})")
+    for endpoint in ['login', 'start', 'update', 'complete']:
+        stats = summary['endpoints'].get(endpoint)
+        if stats:
+            print(f"  {endpoint:9s} n={stats['requests']:6d}  p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms"
+                  f"  p99 {stats['p99_ms']:8.1f} ms  errors {stats['errors']} {stats['statuses'] or ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['html', 'api'], default='html')
+    parser.add_argument('--patients', type=int, default=100, help='simultaneous live sessions')
+    parser.add_argument('--duration', type=float, default=60, help='seconds each session runs')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between updates (session.js: 5)')
+    parser.add_argument('--ramp', type=float, default=None, help='seconds over which sessions start (default: --interval)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class: sync, gthread, gevent, ...')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker (gthread)')
+    parser.add_argument('--database-url', help='run against this database instead of a generated cohort')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the report as JSON here')
+    args = parser.parse_args()
+
+    from benchmarks.cohort import COHORT_PASSWORD, UPDATE_INTERVAL_SECONDS
+
+    ramp = args.interval if args.ramp is None else args.ramp
+    config = {
+        'target': args.target, 'patients': args.patients, 'duration': args.duration, 'interval': args.interval,
+        'ramp': ramp, 'workers': args.workers, 'worker_class': args.worker_class, 'threads': args.threads,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='neurobeat-load-') as tmp:
+        url = args.database_url
+        if url is None:
+            url = 'sqlite:///' + os.path.join(tmp, 'cohort.db')
+            from benchmarks.cohort import populate
+            from sqlalchemy import create_engine
+            from api import db
+            import api.models  # noqa: F401
+
+            engine = create_engine(url)
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                populate(connection, clinicians=1, patients_per_clinician=args.patients, sessions_per_patient=5,
+                         metrics_per_session=int(args.duration // UPDATE_INTERVAL_SECONDS), seed=args.seed)
+            engine.dispose()
+
+        port = _free_port()
+        if args.target == 'html':
+            # gunicorn.conf.py belongs to the API deploy; the HTML app runs without it
+            config_file = os.path.join(tmp, 'gunicorn_html.conf.py')
+            open(config_file, 'w').close()
+            app_path = 'main:app'
+        else:
+            config_file = os.path.join(ROOT, 'gunicorn.conf.py')
+            app_path = 'api_main:app'
+        command = [
+            sys.executable, '-m', 'gunicorn', app_path, '--config', config_file,
+            '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+            '--worker-class', args.worker_class, '--threads', str(args.threads),
+            '--backlog', str(max(2048, args.patients * 2)),
+        ]
+        log_path = os.path.join(tmp, 'server.log')
+        with open(log_path, 'w') as log:
+            server = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                                      env={**os.environ, **SERVER_ENV, 'DATABASE_URL': url})
+        try:
+            base = f'http://127.0.0.1:{port}'
+            _wait_ready(base + ('/' if args.target == 'html' else '/api/health'))
+
+            patient_class = HtmlPatient if args.target == 'html' else ApiPatient
+            recorder = Recorder()
+            threads = [
+                threading.Thread(target=run_patient, daemon=True, args=(
+                    patient_class(base, f'patient{i}', COHORT_PASSWORD), recorder,
+                    ramp * i / max(args.patients, 1), args.duration, args.interval, args.seed * 100003 + i,
+                ))
+                for i in range(args.patients)
+            ]
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        with open(log_path) as log:
+            log_text = log.read()
+
+    summary = summarize(recorder, elapsed, log_text)
+    print_report(config, summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'summary': summary}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Read/write splitting onto an optional read replica.
+
+When DATABASE_REPLICA_URL is set, the apps register it as the 'replica'
+bind. Views decorated with @replica_read run their SELECTs there; anything
+that flushes or executes INSERT/UPDATE/DELETE switches the rest of the
+request back to the primary.
+
+A client that wrote recently reads from the primary for
+READ_YOUR_WRITES_SECONDS (default 5, comfortably above replica lag) so it
+sees its own changes. The HTML app remembers the last write in the Flask
+session cookie. The JWT API returns it in an X-Last-Write response header,
+and the frontend sends it back on later requests.
+
+Locally, point DATABASE_REPLICA_URL at a copy of the SQLite file (or a
+second Postgres) to try it out.
+"""
+from contextvars import ContextVar
+from functools import wraps
+import os
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+LAST_WRITE_HEADER = 'X-Last-Write'
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_binds():
+    """SQLALCHEMY_BINDS entries for the configured replica (empty without one)"""
+    url = os.environ.get('DATABASE_REPLICA_URL')
+    return {REPLICA_BIND: url} if url else {}
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the replica inside @replica_read views"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and _use_replica.get()
+            and not self._flushing
+            and not getattr(clause, 'is_dml', False)
+            and REPLICA_BIND in self._db.engines
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _mark_write():
+    _use_replica.set(False)
+    if has_request_context():
+        g.db_wrote = True
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    _mark_write()
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _on_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        _mark_write()
+
+def _wrote_recently():
+    last_write = session.get('last_write') or request.headers.get(LAST_WRITE_HEADER)
+    try:
+        return last_write is not None and time.time() - float(last_write) < READ_YOUR_WRITES_SECONDS
+    except ValueError:
+        return False
+
+def replica_read(view):
+    """Run the view's reads on the replica unless this client wrote recently"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if _wrote_recently():
+            return view(*args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+def init_routing(app, sticky='session'):
+    """Record writes for read-your-writes: in the session cookie ('session') or a header ('header')"""
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('db_wrote'):
+            now = f'{time.time():.3f}'
+            if sticky == 'session':
+                session['last_write'] = now
+            else:
+                response.headers[LAST_WRITE_HEADER] = now
+        return response
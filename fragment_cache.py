@@ -0,0 +1,124 @@
+"""Versioned cache for expensive template fragments.
+
+    {% cache 'patient_row', patient.id, patient.data_version %}
+        ... markup that lazy-loads the patient's sessions and assessments ...
+    {% endcache %}
+
+The rendered markup is kept per process under the template, fragment name
+and key values. PatientProfile.data_version is bumped by ChangeLog.record
+on every session, assessment or profile write, so keys built from it never
+serve stale markup and nothing has to be invalidated explicitly.
+
+Memory is bounded by FRAGMENT_CACHE_MAX_BYTES (default 32 MiB, 0 disables)
+with least-recently-used eviction. Views hand the data that only cached
+sections need to the template as a Deferred, so a hit skips those queries
+as well.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from observability.metrics import registry
+
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+fragment_lookups = registry.counter(
+    'fragment_cache_lookups_total', 'Template fragment cache lookups by result', ('result',)
+)
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments bounded by total size"""
+
+    def __init__(self, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        # str length as a size estimate: fragments are mostly ASCII markup
+        cost = len(value) + len(key)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous) + len(key)
+            self._entries[key] = value
+            self.size += cost
+            while self.size > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.size -= len(old_value) + len(old_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache name, key... %}...{% endcache %}"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), nodes.Const(lineno)]
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        args.append(nodes.List(keys))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template, lineno, keys, caller):
+        cache = self.environment.fragment_cache
+        if not cache.max_bytes:
+            return caller()
+        key = repr((template, lineno, *keys))
+        value = cache.get(key)
+        if value is None:
+            fragment_lookups.inc(('miss',))
+            value = caller()
+            cache.set(key, value)
+        else:
+            fragment_lookups.inc(('hit',))
+        return value
+
+
+class Deferred:
+    """Template values computed on first access, so a cached fragment never runs their queries"""
+
+    def __init__(self, **loaders):
+        self._loaders = loaders
+
+    def __getattr__(self, name):
+        try:
+            loader = self._loaders[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        value = loader()
+        setattr(self, name, value)
+        return value
+
+
+def init_fragment_cache(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    return app.jinja_env.fragment_cache
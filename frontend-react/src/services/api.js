@@ -27,6 +27,11 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    // Lets the server read from the primary right after our own writes
+    const lastWrite = sessionStorage.getItem('last_write');
+    if (lastWrite) {
+      config.headers['X-Last-Write'] = lastWrite;
+    }
     return config;
   },
   (error) => {
@@ -35,7 +40,13 @@ api.interceptors.request.use(
 );
 
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    const lastWrite = response.headers['x-last-write'];
+    if (lastWrite) {
+      sessionStorage.setItem('last_write', lastWrite);
+    }
+    return response;
+  },
   async (error) => {
     const originalRequest = error.config;
 
@@ -85,6 +96,13 @@ export const patientsAPI = {
     api.get('/patients'),
   getPatient: (patientId) =>
     api.get(`/patients/${patientId}`),
+  getSessionHistory: (patientId, params = {}) =>
+    api.get(`/patients/${patientId}/sessions`, { params }),
+  importPatients: (file) => {
+    const form = new FormData();
+    form.append('file', file);
+    return api.post('/patients/import', form);
+  },
 };
 
 export const sessionsAPI = {
@@ -96,6 +114,10 @@ export const sessionsAPI = {
     api.post(`/sessions/${sessionId}/update`, updateData),
   completeSession: (sessionId, completionData) =>
     api.post(`/sessions/${sessionId}/complete`, completionData),
+  getTimeseries: (sessionId, points) =>
+    api.get(`/sessions/${sessionId}/timeseries`, { params: { points } }),
+  getTimeseriesOverlay: (sessionIds, points) =>
+    api.get('/sessions/timeseries', { params: { ids: sessionIds.join(','), points } }),
 };
 
 export const assessmentsAPI = {
@@ -107,4 +129,9 @@ export const assessmentsAPI = {
     api.get(`/assessments/progress/${patientId}`),
 };
 
+export const syncAPI = {
+  getChanges: (cursor) =>
+    api.get('/sync/changes', { params: cursor === undefined ? {} : { cursor } }),
+};
+
 export default api;
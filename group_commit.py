@@ -0,0 +1,102 @@
+"""Group commit for high-frequency inserts (one metric row per patient every 5 s).
+
+Requests hand their row to a per-process writer thread and wait for it to
+be committed. The writer drains whatever has queued up and inserts it in
+one transaction, so a ward of live sessions costs one lock acquisition and
+one commit per batch instead of one per request, and each worker process
+has a single writer competing for the SQLite lock. If a batch fails, its
+rows are retried one by one so only the offending row reports an error.
+
+Configured from the environment:
+  GROUP_COMMIT           'off' commits each row on the request thread (default on)
+  GROUP_COMMIT_MAX_ROWS  rows per transaction (default 500)
+  GROUP_COMMIT_TIMEOUT   seconds a row may wait in the queue before its request
+                         withdraws it and fails (default 10)
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', 'on').lower() != 'off'
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', 500))
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 10))
+
+
+class GroupCommitWriter:
+    def __init__(self, engine, table, enabled=GROUP_COMMIT, max_rows=GROUP_COMMIT_MAX_ROWS,
+                 timeout=GROUP_COMMIT_TIMEOUT):
+        self.engine = engine
+        self.table = table
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_writer(self):
+        with self._lock:
+            # A writer thread does not survive fork (e.g. gunicorn preload): start one per process
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                threading.Thread(target=self._run, args=(self._queue,), name='group-commit', daemon=True).start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            while len(batch) < self.max_rows:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            # Rows whose request already gave up are dropped, never written
+            batch = [(values, future) for values, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._insert([values for values, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    logging.error(f"Group commit of a {self.table.name} row failed: {str(e)}")
+                    batch[0][1].set_exception(e)
+                    continue
+                # One bad row must not fail its neighbours: retry them one by one
+                logging.warning(f"Group commit of {len(batch)} {self.table.name} rows failed, retrying each: {str(e)}")
+                for values, future in batch:
+                    try:
+                        self._insert([values])
+                    except Exception as e:
+                        logging.error(f"Group commit of a {self.table.name} row failed: {str(e)}")
+                        future.set_exception(e)
+                    else:
+                        future.set_result(None)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+    def _insert(self, rows):
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(), rows)
+
+    def insert(self, values):
+        """Insert one row; returns once it is committed.
+
+        Raises TimeoutError only when the row was withdrawn from the queue
+        unwritten after GROUP_COMMIT_TIMEOUT. A row the writer has already
+        started on is waited for, so a failed request never commits later.
+        """
+        if not self.enabled:
+            self._insert([values])
+            return
+        future = Future()
+        self._ensure_writer().put((values, future))
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise
+            future.result()
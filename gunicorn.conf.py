@@ -0,0 +1,35 @@
+"""Gunicorn settings for the API (picked up automatically by render_start.sh).
+
+The app is imported once in the master (preload_app) and forked, so workers
+share its imported modules and start serving without re-importing anything.
+"""
+import os
+
+# Set before the app is preloaded so per-process pools (password_hashing) can
+# size themselves to their share of the host
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", "2"))
+# Threaded workers: requests in one process overlap, so group commit batches
+# their metric rows and single-flight shares their identical computations
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared across processes:
+    # the primary, the read replica and every shard
+    from api_main import app
+    from api import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # One internal request pays for the lazy first-request setup before real traffic arrives
+    from api_main import app
+
+    with app.test_client() as client:
+        client.get('/api/health')
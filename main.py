@@ -1,6 +1,9 @@
 
-from app import app
-import routes  # Import routes to register them
+# Hashing pool processes (forkserver/spawn) re-run this script as __mp_main__;
+# they only hash passwords and must not build a second app
+if __name__ != "__mp_main__":
+    from app import app
+    import routes  # Import routes to register them
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -1,10 +1,69 @@
 
 import sqlite3
 import os
+import sys
 
-def migrate_database():
+def app_engines():
+    """(primary engine, [shard engines]) resolved exactly as the API app resolves them.
+
+    Flask-SQLAlchemy places a relative SQLite path such as the default
+    sqlite:///instance/neurobeat.db under app.instance_path, so the URL is
+    taken from a built app rather than from DATABASE_URL directly.
+    """
+    from api import create_app, db
+    from api.sharding import SHARDS, bind_key
+    
+    app = create_app()
+    with app.app_context():
+        return db.engine, [db.engines[bind_key(shard)] for shard in SHARDS]
+
+def create_schema(engines=None):
+    """Create missing tables and their indexes (the apps only do this outside APP_ENV=production)"""
+    from api import db
+    from api.sharding import create_shard_tables
+    
+    engine, shard_engines = engines or app_engines()
+    for target in (engine, *shard_engines):
+        # SQLite creates the file but not its directory
+        if target.dialect.name == 'sqlite' and target.url.database:
+            os.makedirs(os.path.dirname(os.path.abspath(target.url.database)), exist_ok=True)
+    db.metadata.create_all(engine)
+    
+    # Session data tables on each shard (SHARD_URLS)
+    for shard_engine in shard_engines:
+        create_shard_tables(shard_engine)
+
+def verify_schema(engines=None):
+    """List tables and columns the models expect but the database lacks"""
+    from sqlalchemy import inspect
+    from api import db
+    from api.sharding import SHARDED_TABLES
+    
+    engine, shard_engines = engines or app_engines()
+    missing = []
+    for target in (engine, *shard_engines):
+        inspector = inspect(target)
+        existing_tables = set(inspector.get_table_names())
+        tables = [
+            table for table in db.metadata.sorted_tables
+            if target is engine or table.name in SHARDED_TABLES
+        ]
+        for table in tables:
+            label = table.name if target is engine else f"{target.url.database}:{table.name}"
+            if table.name not in existing_tables:
+                missing.append(label)
+                continue
+            columns = {c['name'] for c in inspector.get_columns(table.name)}
+            missing.extend(f"{label}.{c.name}" for c in table.columns if c.name not in columns)
+    return missing
+
+def migrate_database(engines=None):
     """Add stroke-specific columns to existing database"""
-    db_path = os.path.join('instance', 'neurobeat.db')
+    engine, _ = engines or app_engines()
+    if engine.dialect.name != 'sqlite':
+        print("Column migrations only apply to SQLite; other databases are created by create_schema().")
+        return
+    db_path = engine.url.database
     
     if not os.path.exists(db_path):
         print("Database doesn't exist yet. Run the app first to create it.")
@@ -23,7 +82,8 @@ def migrate_database():
         ('cognitive_status', 'VARCHAR(20)'),
         ('emotional_status', 'VARCHAR(30)'),
         ('preferred_music_genre', 'VARCHAR(50)'),
-        ('preferred_beat_sound', 'VARCHAR(20)')
+        ('preferred_beat_sound', 'VARCHAR(20)'),
+        ('data_version', 'INTEGER NOT NULL DEFAULT 0')
     ]
     
     try:
@@ -50,7 +110,15 @@ def migrate_database():
             ('speech_clarity_score', 'FLOAT'),
             ('cognitive_load_level', 'INTEGER'),
             ('emotional_response', 'VARCHAR(20)'),
-            ('generated_beat_url', 'VARCHAR(500)')
+            ('generated_beat_url', 'VARCHAR(500)'),
+            ('metrics_tier', 'VARCHAR(10)'),
+            ('sample_count', 'INTEGER'),
+            ('active_seconds', 'FLOAT'),
+            ('mean_sync_accuracy', 'FLOAT'),
+            ('time_in_sync_seconds', 'FLOAT'),
+            ('adjustment_count', 'INTEGER'),
+            ('tempo_stddev', 'FLOAT'),
+            ('time_to_target_seconds', 'FLOAT')
         ]
         
         for column_name, column_type in session_columns:
@@ -62,6 +130,18 @@ def migrate_database():
                     if "duplicate column name" not in str(e):
                         print(f"Error adding session column {column_name}: {e}")
         
+        # Composite index backing keyset pagination of session history
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_therapy_sessions_patient_start "
+            "ON therapy_sessions (patient_id, start_time, id)"
+        )
+        
+        # Per-session time-series reads scan metrics by session in time order
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_session_metrics_session_ts "
+            "ON session_metrics (session_id, timestamp)"
+        )
+        
         conn.commit()
         print("Database migration completed successfully!")
         
@@ -72,4 +152,14 @@ def migrate_database():
         conn.close()
 
 if __name__ == "__main__":
-    migrate_database()
+    # Deploy step: `python migrate_db.py`; release check: `python migrate_db.py --check`
+    engines = app_engines()
+    if '--check' in sys.argv:
+        missing = verify_schema(engines)
+        for name in missing:
+            print(f"Missing: {name}")
+        print("Schema OK" if not missing else f"{len(missing)} schema objects missing")
+        sys.exit(1 if missing else 0)
+    
+    create_schema(engines)
+    migrate_database(engines)
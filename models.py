@@ -1,7 +1,8 @@
 from datetime import datetime
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import password_hasher
 import json
+import trend_stats
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -20,10 +21,13 @@ class User(db.Model):
     clinician_profile = db.relationship('ClinicianProfile', backref='user', uselist=False)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
 class PatientProfile(db.Model):
     __tablename__ = 'patient_profiles'
@@ -51,6 +55,8 @@ class PatientProfile(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by ChangeLog.record on any write to the patient's data; keys cached page fragments
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     sessions = db.relationship('TherapySession', backref='patient', lazy=True)
@@ -68,6 +74,9 @@ class ClinicianProfile(db.Model):
 
 class TherapySession(db.Model):
     __tablename__ = 'therapy_sessions'
+    __table_args__ = (
+        db.Index('ix_therapy_sessions_patient_start', 'patient_id', 'start_time', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_profiles.id'), nullable=False)
@@ -88,6 +97,16 @@ class TherapySession(db.Model):
     cognitive_load_level = db.Column(db.Integer)  # 1-5 scale for cognitive sessions
     emotional_response = db.Column(db.String(20))  # 'positive', 'neutral', 'negative'
     generated_beat_url = db.Column(db.String(500))  # URL to generated beat audio
+    metrics_tier = db.Column(db.String(10))  # None (raw samples), 'rollup' (per-minute) or 'archive' (compressed file)
+    
+    # Summary of the metric samples, computed when the session completes (session_features.py)
+    sample_count = db.Column(db.Integer)
+    active_seconds = db.Column(db.Float)
+    mean_sync_accuracy = db.Column(db.Float)  # time-weighted
+    time_in_sync_seconds = db.Column(db.Float)
+    adjustment_count = db.Column(db.Integer)
+    tempo_stddev = db.Column(db.Float)  # tempo stability, lower is steadier
+    time_to_target_seconds = db.Column(db.Float)
     
     # JSON field to store session metrics
     metrics_data = db.Column(db.Text)  # JSON string
@@ -99,9 +118,16 @@ class TherapySession(db.Model):
         if self.metrics_data:
             return json.loads(self.metrics_data)
         return {}
+    
+    def set_features(self, features):
+        for column, value in features.items():
+            setattr(self, column, value)
 
 class SessionMetrics(db.Model):
     __tablename__ = 'session_metrics'
+    __table_args__ = (
+        db.Index('ix_session_metrics_session_ts', 'session_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), nullable=False)
@@ -127,3 +153,103 @@ class BaselineAssessment(db.Model):
     # Relationships
     patient = db.relationship('PatientProfile', backref='assessments')
     assessor = db.relationship('User', foreign_keys=[assessed_by])
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_clinician_seq', 'clinician_id', 'seq'),
+        db.Index('ix_change_log_patient_seq', 'patient_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    seq = db.Column(db.Integer, primary_key=True)  # monotonic change sequence number
+    entity_type = db.Column(db.String(20), nullable=False)  # 'patient', 'session', 'assessment'
+    entity_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    clinician_id = db.Column(db.Integer)  # caseload the change belongs to, None for unassigned patients
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def record(cls, entity_type, entity_id, patient_id, clinician_id):
+        """Log a write in the current transaction so delta-sync clients pick it up"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # Serialize writers until commit so sequence numbers become visible in order
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(290417)'))
+        entry = cls(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            patient_id=patient_id,
+            clinician_id=clinician_id
+        )
+        db.session.add(entry)
+        # Invalidates the patient's cached page fragments; updated_at keeps the last profile edit
+        db.session.execute(
+            db.update(PatientProfile).where(PatientProfile.id == patient_id).values(
+                data_version=PatientProfile.data_version + 1,
+                updated_at=PatientProfile.updated_at
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        return entry
+    
+    @classmethod
+    def record_many(cls, entity_type, entities, clinician_id):
+        """Log several (entity_id, patient_id) writes in one insert, see record()"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(290417)'))
+        db.session.execute(db.insert(cls), [
+            {'entity_type': entity_type, 'entity_id': entity_id, 'patient_id': patient_id, 'clinician_id': clinician_id}
+            for entity_id, patient_id in entities
+        ])
+
+def _insert_ignoring_conflicts(table, bind):
+    """INSERT that skips rows whose primary key already exists (SQLite and PostgreSQL)"""
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+class PatientTrendStats(db.Model):
+    """Running accuracy and tempo statistics of a patient's completed sessions (see trend_stats.py)"""
+    __tablename__ = 'patient_trend_stats'
+    
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient_profiles.id'), primary_key=True, autoincrement=False)
+    session_type = db.Column(db.String(50), primary_key=True)  # a session type, or 'all'
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_session_at = db.Column(db.DateTime)
+    last_session_at = db.Column(db.DateTime)
+    
+    # Welford moments of days since the first session, and per series its mean,
+    # squared deviations, co-moment with the days and fast/slow weighted averages
+    days_mean = db.Column(db.Float, nullable=False, default=0.0)
+    days_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_mean = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_cov = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_fast = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_slow = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_mean = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_cov = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_fast = db.Column(db.Float, nullable=False, default=0.0)
+    bpm_slow = db.Column(db.Float, nullable=False, default=0.0)
+    
+    @classmethod
+    def record(cls, patient_id, session_type, completed_at, accuracy, bpm):
+        """Fold a completed session into the patient's rows for its type and for all sessions"""
+        for key in (session_type, trend_stats.ALL):
+            stats = db.session.get(cls, (patient_id, key), with_for_update=True)
+            if stats is None:
+                # Concurrent first completions both get here: the loser's insert is a no-op
+                # and it folds its session into the winner's row
+                db.session.execute(
+                    _insert_ignoring_conflicts(cls.__table__, db.session.get_bind(mapper=cls.__mapper__)).values(
+                        patient_id=patient_id, session_type=key, **trend_stats.initial_state()
+                    )
+                )
+                stats = db.session.get(cls, (patient_id, key), with_for_update=True)
+            trend_stats.observe(stats, completed_at, accuracy, bpm)
+    
+    def to_dict(self):
+        return trend_stats.summary(self)
@@ -0,0 +1,6 @@
+"""Request instrumentation shared by the HTML app (app.py) and the JSON API (api/)"""
+from observability.metrics import registry
+from observability.middleware import instrument, current_request
+from observability.querylog import NPlusOneDetected, query_shape
+from observability.tracing import span, traced, current_request_id
+from observability.logs import configure_logging, sampled_logger
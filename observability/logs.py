@@ -0,0 +1,130 @@
+"""Non-blocking structured logging.
+
+configure_logging() replaces the root handlers with a QueueHandler. The
+request thread only interpolates the message and stamps the request id; a
+QueueListener thread does the JSON formatting and the write to stderr.
+
+Levels come from LOG_LEVEL, else from APP_ENV (production INFO, development
+DEBUG, test WARNING), and chatty libraries are held at WARNING outside
+development. LOG_FORMAT is 'json' (default in production) or 'text'.
+High-volume events go through sampled_logger(), which passes a fraction
+of records below WARNING.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from observability import tracing
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+
+ENV_LEVELS = {'production': 'INFO', 'development': 'DEBUG', 'test': 'WARNING'}
+QUIET_LOGGERS = ('sqlalchemy', 'werkzeug', 'urllib3', 'flask_cors')
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = '-'
+        return super().format(record)
+
+
+class RequestQueueHandler(QueueHandler):
+    """Hands records to the listener with only the cheap work done on the calling thread"""
+
+    def prepare(self, record):
+        record.request_id = tracing.current_request_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks pin frames; render them before leaving the thread
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def sampled_logger(name, rate):
+    """Logger whose records below WARNING pass with probability rate"""
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(rate))
+    return logger
+
+def _start_listener(*handlers):
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_in_child():
+    # The listener thread does not survive fork (gunicorn preload): give the child its own
+    if _queue_handler is None:
+        return
+    _queue_handler.queue = queue.SimpleQueue()
+    _start_listener(*_listener.handlers)
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+def configure_logging():
+    """Install the queue-based pipeline on the root logger (idempotent)"""
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    app_env = os.environ.get('APP_ENV', 'development')
+    level = os.environ.get('LOG_LEVEL', ENV_LEVELS.get(app_env, 'INFO')).upper()
+    log_format = os.environ.get('LOG_FORMAT', 'json' if app_env == 'production' else 'text')
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    _queue_handler = RequestQueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    if app_env != 'development':
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _start_listener(output)
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_in_child)
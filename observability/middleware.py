@@ -0,0 +1,120 @@
+"""Flask hooks and SQLAlchemy engine events feeding observability.metrics"""
+from contextvars import ContextVar
+from flask import request, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from observability.metrics import registry, request_duration, requests_total, request_queries, request_db_seconds
+from observability import querylog, profiling, tracing
+import hmac
+import os
+import time
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'sql_seconds', 'shapes')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.shapes = querylog.new_shape_counter()
+
+
+current_request = ContextVar('current_request', default=None)
+_engine_events_installed = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._observability_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_observability_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if stats.shapes is not None:
+            stats.shapes[querylog.query_shape(statement)] += 1
+
+    querylog.observe_slow_query(conn, cursor, statement, parameters, executemany, elapsed)
+
+    if tracing.TRACING_ENABLED:
+        ended = time.time_ns()
+        tracing.record_span(
+            'db.query', ended - int(elapsed * 1e9), ended,
+            **{'db.system': conn.dialect.name, 'db.statement': statement[:1000]}
+        )
+
+def install_engine_events():
+    """Time every cursor execution on every engine in the process (idempotent)"""
+    global _engine_events_installed
+    if not _engine_events_installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_events_installed = True
+
+def _metrics_allowed():
+    # request.remote_addr is the proxy's address behind a reverse proxy, so
+    # scrapers authenticate with a bearer token instead (Prometheus bearer_token)
+    token = os.environ.get('METRICS_TOKEN')
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(supplied.encode(), token.encode())
+
+def metrics_view():
+    if not _metrics_allowed():
+        abort(404)
+    return Response(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def instrument(app, name):
+    """Record latency, status codes and SQL usage per endpoint for app and serve them at /metrics.
+
+    name labels the series ('html' or 'api'). /metrics only answers requests
+    carrying METRICS_TOKEN as a bearer token and is a 404 while it is unset.
+    Also installs the token-gated profiling hooks (observability.profiling).
+    """
+    install_engine_events()
+    service_name = f'neurobeat-{name}'
+    trace_path = os.environ.get('TRACE_FILE') or os.path.join(app.instance_path, 'traces', 'traces.jsonl')
+
+    @app.before_request
+    def _start_request():
+        current_request.set(RequestStats())
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        tracing.begin_request(request.headers, f'{request.method} {route}', {
+            'http.method': request.method,
+            'http.route': route,
+            'flask.endpoint': request.endpoint
+        })
+
+    @app.after_request
+    def _record_request(response):
+        request_id = tracing.current_request_id()
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        tracing.end_request(response.status_code, service_name, trace_path)
+
+        stats = current_request.get()
+        endpoint = request.endpoint or '<unmatched>'
+        if stats is None or endpoint == 'metrics':
+            return response
+
+        elapsed = time.perf_counter() - stats.started
+        request_duration.observe(elapsed, (name, endpoint, request.method))
+        requests_total.inc((name, endpoint, request.method, str(response.status_code)))
+        request_queries.observe(stats.queries, (name, endpoint))
+        request_db_seconds.observe(stats.sql_seconds, (name, endpoint))
+        querylog.check_request(endpoint, stats.shapes)
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        current_request.set(None)
+        tracing.discard()
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    profiling.install(app)
@@ -0,0 +1,162 @@
+"""Opt-in request profiling and tracemalloc snapshots for live workers.
+
+Both are gated by PROFILE_TOKEN: unset disables them, otherwise callers send
+it in the X-Profile-Token header.
+
+- A request carrying the header is sampled by a background thread every
+  PROFILE_INTERVAL_MS; the collapsed stacks (flamegraph.pl / speedscope
+  input) are written to PROFILE_DIR (default <instance>/profiles) and the
+  file name is returned in X-Profile-File. Other requests pay one header
+  lookup.
+- POST /admin/tracemalloc/start, /snapshot and /stop control tracemalloc in
+  the worker that answers; /snapshot returns the allocation growth since
+  the previous snapshot.
+"""
+from collections import Counter
+from datetime import datetime
+from flask import request, g, jsonify, abort, current_app
+import hmac
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+ADMIN_ENDPOINTS = ('tracemalloc_start', 'tracemalloc_snapshot', 'tracemalloc_stop')
+
+
+def _authorized():
+    token = os.environ.get('PROFILE_TOKEN')
+    supplied = request.headers.get(PROFILE_HEADER)
+    return bool(token) and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+def _frame_label(frame):
+    code = frame.f_code
+    parts = code.co_filename.replace('\\', '/').rsplit('/', 2)
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack on a timer and counts collapsed stacks"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_samples = int(max_seconds / interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval) and self.samples < self.max_samples:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_dir():
+    path = os.environ.get('PROFILE_DIR') or os.path.join(current_app.instance_path, 'profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _start_profile():
+    if PROFILE_HEADER in request.headers and request.endpoint not in ADMIN_ENDPOINTS and _authorized():
+        g.profiler = StackSampler(threading.get_ident()).start()
+
+def _finish_profile(response):
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return response
+
+    sampler.stop()
+    endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{endpoint}-{os.getpid()}.folded"
+    try:
+        with open(os.path.join(profile_dir(), name), 'w') as f:
+            f.write(sampler.collapsed())
+        response.headers['X-Profile-File'] = name
+        response.headers['X-Profile-Samples'] = str(sampler.samples)
+    except OSError as e:
+        logging.error(f"Writing profile failed: {str(e)}")
+    return response
+
+def _require_token():
+    if not _authorized():
+        abort(404)
+
+def tracemalloc_start():
+    _require_token()
+    frames = request.args.get('frames', 10, type=int)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    current_app.extensions['tracemalloc_snapshot'] = tracemalloc.take_snapshot()
+    return jsonify({'pid': os.getpid(), 'tracing': True, 'frames': tracemalloc.get_traceback_limit()})
+
+def tracemalloc_snapshot():
+    _require_token()
+    if not tracemalloc.is_tracing():
+        return jsonify({'error': 'tracemalloc is not running in this worker', 'pid': os.getpid()}), 409
+
+    limit = request.args.get('limit', 20, type=int)
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'group_by must be lineno, filename or traceback'}), 400
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+    ])
+    previous = current_app.extensions.get('tracemalloc_snapshot')
+    current_app.extensions['tracemalloc_snapshot'] = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+
+    stats = snapshot.compare_to(previous, group_by) if previous else snapshot.statistics(group_by)
+    return jsonify({
+        'pid': os.getpid(),
+        'traced_bytes': current,
+        'peak_bytes': peak,
+        'compared_to_previous': previous is not None,
+        'top': [
+            {
+                'location': [str(frame) for frame in stat.traceback],
+                'size_bytes': stat.size,
+                'size_diff_bytes': getattr(stat, 'size_diff', stat.size),
+                'count': stat.count,
+                'count_diff': getattr(stat, 'count_diff', stat.count)
+            }
+            for stat in stats[:limit]
+        ]
+    })
+
+def tracemalloc_stop():
+    _require_token()
+    tracemalloc.stop()
+    current_app.extensions.pop('tracemalloc_snapshot', None)
+    return jsonify({'pid': os.getpid(), 'tracing': False})
+
+def install(app):
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.add_url_rule('/admin/tracemalloc/start', 'tracemalloc_start', tracemalloc_start, methods=['POST'])
+    app.add_url_rule('/admin/tracemalloc/snapshot', 'tracemalloc_snapshot', tracemalloc_snapshot, methods=['POST'])
+    app.add_url_rule('/admin/tracemalloc/stop', 'tracemalloc_stop', tracemalloc_stop, methods=['POST'])
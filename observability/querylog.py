@@ -0,0 +1,121 @@
+"""N+1 detection and the slow-query log.
+
+N+1 detector: counts normalized statement shapes per request and reports any
+shape executed NPLUSONE_THRESHOLD or more times. NPLUSONE_MODE is 'log'
+(default outside production), 'raise' (for CI) or 'off' (default in
+production).
+
+Slow-query log: statements slower than SLOW_QUERY_MS are logged with their
+query plan and the endpoint that ran them, for a SLOW_QUERY_SAMPLE fraction
+of cases and at most SLOW_QUERY_MAX_PER_MINUTE entries per process.
+"""
+from collections import Counter
+from flask import has_request_context, request
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+APP_ENV = os.environ.get('APP_ENV', 'development')
+NPLUSONE_MODE = os.environ.get('NPLUSONE_MODE', 'off' if APP_ENV == 'production' else 'log')
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_MS', 200)) / 1000
+SLOW_QUERY_SAMPLE = float(os.environ.get('SLOW_QUERY_SAMPLE', 1.0))
+SLOW_QUERY_MAX_PER_MINUTE = int(os.environ.get('SLOW_QUERY_MAX_PER_MINUTE', 10))
+
+logger = logging.getLogger('neurobeat.queries')
+
+_IN_LIST = re.compile(r'\bIN\s*\([^()]*\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneDetected(Exception):
+    pass
+
+
+def query_shape(statement):
+    """Statement with literals and IN-lists collapsed, so per-row lookups compare equal"""
+    shape = _IN_LIST.sub('IN (?)', statement)
+    shape = _NUMBER.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+def new_shape_counter():
+    return Counter() if NPLUSONE_MODE != 'off' else None
+
+def check_request(endpoint, shapes):
+    """Report repeated statement shapes seen during one request"""
+    if not shapes:
+        return
+    repeated = [(shape, count) for shape, count in shapes.items() if count >= NPLUSONE_THRESHOLD]
+    if not repeated:
+        return
+
+    for shape, count in repeated:
+        logger.warning("Possible N+1 in %s: %d x %s", endpoint, count, shape)
+    if NPLUSONE_MODE == 'raise':
+        shape, count = max(repeated, key=lambda r: r[1])
+        raise NPlusOneDetected(f"{endpoint} ran {count} x {shape}")
+
+
+class _RateLimit:
+    """Token bucket refilled to `per_minute` tokens over a minute"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+_slow_log_limit = _RateLimit(SLOW_QUERY_MAX_PER_MINUTE)
+
+
+def _explain(conn, cursor, statement, parameters):
+    """Query plan for statement, run on a fresh cursor of the same DBAPI connection"""
+    if conn.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif conn.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return []
+
+    plan_cursor = cursor.connection.cursor()
+    try:
+        plan_cursor.execute(prefix + statement, parameters)
+        rows = plan_cursor.fetchall()
+    finally:
+        plan_cursor.close()
+    # sqlite rows are (id, parent, notused, detail); postgres rows are (line,)
+    return [row[-1] for row in rows]
+
+def observe_slow_query(conn, cursor, statement, parameters, executemany, elapsed):
+    if elapsed < SLOW_QUERY_SECONDS or executemany:
+        return
+    if random.random() >= SLOW_QUERY_SAMPLE or not _slow_log_limit.allow():
+        return
+
+    endpoint = request.endpoint if has_request_context() else None
+    plan = []
+    if statement.lstrip()[:6].upper() == 'SELECT':
+        try:
+            plan = _explain(conn, cursor, statement, parameters)
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+
+    logger.warning(
+        "Slow query %.1f ms in %s: %s | plan: %s",
+        elapsed * 1000, endpoint or '<no request>', _WHITESPACE.sub(' ', statement), ' / '.join(plan)
+    )
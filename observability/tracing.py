@@ -0,0 +1,221 @@
+"""Dependency-free request tracing.
+
+Each request gets a request id (X-Request-ID, echoed back) and, while tracing
+is on, a trace of nested spans: the request itself, any span() blocks the
+code opens, and every SQL round-trip. Finished traces are kept when sampled
+(TRACE_SAMPLE_RATE) or slower than TRACE_SLOW_MS, and appended as one
+OTLP/JSON ExportTraceServiceRequest per line to TRACE_FILE (default
+<instance>/traces/traces.jsonl), rotated at TRACE_FILE_MAX_BYTES. Setting
+both TRACE_SAMPLE_RATE and TRACE_SLOW_MS to 0 turns span recording off.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+TRACE_SLOW_NS = int(float(os.environ.get('TRACE_SLOW_MS', 1000)) * 1_000_000)
+TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES', 10 * 1024 * 1024))
+TRACE_FILE_BACKUPS = int(os.environ.get('TRACE_FILE_BACKUPS', 5))
+TRACING_ENABLED = TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_NS > 0
+MAX_SPANS_PER_TRACE = 500
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'status')
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class Trace:
+    __slots__ = ('trace_id', 'request_id', 'spans', 'dropped', 'root')
+
+    def __init__(self, trace_id, request_id):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.spans = []
+        self.dropped = 0
+        self.root = None
+
+    def add(self, span):
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+_current_trace = ContextVar('current_trace', default=None)
+_current_span = ContextVar('current_span', default=None)
+_request_id = ContextVar('request_id', default=None)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def current_request_id():
+    return _request_id.get()
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the current span; a no-op outside a trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = STATUS_ERROR
+        current.attributes['exception.type'] = type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.add(current)
+
+def traced(name):
+    """Decorator form of span() for whole functions"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_span(name, start_ns, end_ns, **attributes):
+    """Add an already-timed child span (used for SQL round-trips)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    finished = Span(name, parent.span_id if parent else None, attributes)
+    finished.start_ns = start_ns
+    finished.end_ns = end_ns
+    trace.add(finished)
+
+def begin_request(headers, name, attributes):
+    """Assign the request id and, if tracing, open the root span"""
+    request_id = headers.get('X-Request-ID') or uuid.uuid4().hex
+    _request_id.set(request_id)
+    if not TRACING_ENABLED:
+        return request_id
+
+    match = _TRACEPARENT.match(headers.get('traceparent', ''))
+    trace = Trace(match.group(1) if match else os.urandom(16).hex(), request_id)
+    trace.root = Span(name, match.group(2) if match else None, attributes)
+    trace.root.attributes['http.request_id'] = request_id
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    return request_id
+
+def end_request(status_code, service_name, path):
+    """Close the root span and export the trace if it is sampled or slow"""
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    _current_span.set(None)
+    if trace is None:
+        return
+
+    root = trace.root
+    root.end_ns = time.time_ns()
+    root.attributes['http.status_code'] = status_code
+    if status_code >= 500:
+        root.status = STATUS_ERROR
+    trace.add(root)
+
+    slow = TRACE_SLOW_NS > 0 and root.end_ns - root.start_ns >= TRACE_SLOW_NS
+    if slow or random.random() < TRACE_SAMPLE_RATE:
+        _export(trace, service_name, path)
+
+def discard():
+    """Drop any trace left open by a request that never produced a response"""
+    _current_trace.set(None)
+    _current_span.set(None)
+    _request_id.set(None)
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+def to_otlp(trace, service_name):
+    spans = []
+    for s in trace.spans:
+        entry = {
+            'traceId': trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': 2 if s is trace.root else 1,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns),
+            'attributes': [_attribute(k, v) for k, v in s.attributes.items() if v is not None],
+            'status': {'code': s.status}
+        }
+        if s.parent_id:
+            entry['parentSpanId'] = s.parent_id
+        spans.append(entry)
+
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            _attribute('service.name', service_name),
+            _attribute('process.pid', os.getpid())
+        ]},
+        'scopeSpans': [{'scope': {'name': 'neurobeat.observability'}, 'spans': spans}]
+    }]}
+
+def _export(trace, service_name, path):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    handler = RotatingFileHandler(path, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS)
+                except OSError as e:
+                    logging.error(f"Trace file unavailable: {str(e)}")
+                    return
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                writer = logging.getLogger('neurobeat.traces')
+                writer.propagate = False
+                writer.setLevel(logging.INFO)
+                writer.addHandler(handler)
+                _writer = writer
+
+    _writer.info(json.dumps(to_otlp(trace, service_name), separators=(',', ':')))
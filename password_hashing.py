@@ -0,0 +1,185 @@
+"""Password hashing off the request thread with bounded concurrency.
+
+Hashes run in a small process pool so a burst of logins cannot occupy every
+core, and at most workers + queue depth hashes may be in flight per process.
+Callers beyond that get HashingBusy immediately and should answer 503.
+
+Pool processes re-run the script that started the server as __mp_main__, so
+entrypoints run directly with python (api_main.py, main.py) only build the
+app when __name__ is not "__mp_main__".
+
+Configured from the environment:
+  PASSWORD_HASH_METHOD   werkzeug method string (default 'scrypt')
+  PASSWORD_HASH_WORKERS  pool size per process, 0 hashes inline (default: half the
+                         cores shared among the WEB_CONCURRENCY server processes)
+  PASSWORD_HASH_QUEUE    extra hashes allowed to wait for a worker (default 16)
+  PASSWORD_HASH_TIMEOUT  seconds to wait for a result before giving up (default 10)
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash timed out"""
+
+
+def _hash_chunk(passwords, method):
+    return [generate_password_hash(p, method) for p in passwords]
+
+
+def normalize_method(method: str) -> str:
+    """Expand a werkzeug method to the full prefix it writes, e.g. 'scrypt' -> 'scrypt:32768:8:1'"""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = ['32768', '8', '1']
+        return ':'.join([name] + params + defaults[len(params):])
+    if name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+        return ':'.join([name] + params + defaults[len(params):])
+    return method
+
+
+class HashingService:
+    def __init__(self, method: str = 'scrypt', workers: int = 1, queue_depth: int = 16, timeout: float = 10):
+        self.method = method
+        self.method_prefix = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_depth)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid = None
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            return None
+        with self._lock:
+            # A pool inherited across fork (e.g. gunicorn preload) is unusable
+            if self._executor is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._pid = os.getpid()
+                except (OSError, NotImplementedError) as e:
+                    # Serverless runtimes without /dev/shm cannot host a pool
+                    logging.warning(f"Password hashing pool unavailable, hashing inline: {str(e)}")
+                    self.workers = 0
+                    return None
+            return self._executor
+
+    def _release_when_done(self, futures):
+        # A hash that timed out is still queued or running in the pool, so its
+        # slot is only freed once every future it submitted has finished
+        if not futures:
+            self._slots.release()
+            return
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._slots.release()
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password hashes in flight')
+        submitted = []
+        try:
+            pool = self._pool()
+            if pool is None:
+                return fn(*args)
+            try:
+                submitted.append(pool.submit(fn, *args))
+                return submitted[0].result(timeout=self.timeout)
+            except FutureTimeout:
+                raise HashingBusy('Password hash timed out')
+            except BrokenProcessPool:
+                with self._lock:
+                    self._executor = None
+                raise HashingBusy('Password hashing pool restarted')
+        finally:
+            self._release_when_done(submitted)
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash_many(self, passwords: List[str], chunk_size: int = 4) -> List[str]:
+        """Hash a batch of passwords across all workers, in input order.
+
+        The batch holds a single in-flight slot and keeps at most one chunk
+        per worker queued, so logins submitted meanwhile interleave with it
+        instead of waiting for the whole batch. After a timeout the slot stays
+        taken until the chunks already running have finished.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password hashes in flight')
+        submitted = []
+        try:
+            chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+            pool = self._pool()
+            if pool is None:
+                return [h for chunk in chunks for h in _hash_chunk(chunk, self.method)]
+
+            hashes = []
+            pending = deque()
+            try:
+                for chunk in chunks:
+                    submitted.append(pool.submit(_hash_chunk, chunk, self.method))
+                    pending.append(submitted[-1])
+                    if len(pending) >= self.workers:
+                        hashes.extend(pending.popleft().result(timeout=self.timeout * chunk_size))
+                while pending:
+                    hashes.extend(pending.popleft().result(timeout=self.timeout * chunk_size))
+            except FutureTimeout:
+                for future in pending:
+                    future.cancel()
+                raise HashingBusy('Password hash timed out')
+            except BrokenProcessPool:
+                with self._lock:
+                    self._executor = None
+                raise HashingBusy('Password hashing pool restarted')
+            return hashes
+        finally:
+            self._release_when_done(submitted)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Whether a stored hash was made with different parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != self.method_prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def _default_workers() -> int:
+    # Every gunicorn worker has its own pool: split the host's budget between them
+    processes = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+    return max(1, (os.cpu_count() or 2) // 2 // processes)
+
+
+password_hasher = HashingService(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', _default_workers())),
+    queue_depth=int(os.environ.get('PASSWORD_HASH_QUEUE', 16)),
+    timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10)),
+)
@@ -1 +1,2 @@
-gunicorn api_main:app --bind 0.0.0.0:$PORT
+export APP_ENV=${APP_ENV:-production}
+python migrate_db.py && gunicorn api_main:app --bind 0.0.0.0:$PORT
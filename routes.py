@@ -1,8 +1,62 @@
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
-from app import app, db
-from models import User, PatientProfile, ClinicianProfile, TherapySession, SessionMetrics, BaselineAssessment
+from app import app, db, metric_writer
+from models import User, PatientProfile, ClinicianProfile, TherapySession, SessionMetrics, BaselineAssessment, ChangeLog, PatientTrendStats
+from password_hashing import HashingBusy
+from db_routing import replica_read
+from fragment_cache import Deferred
+from singleflight import SingleFlight
+from observability import span, sampled_logger
 from datetime import datetime, timedelta
 import logging
+import os
+import trend_stats
+
+progress_flights = SingleFlight('progress')
+
+# One metric update per beat window per patient: keep a sample in the logs
+update_log = sampled_logger('neurobeat.session_updates', float(os.environ.get('LOG_SAMPLE_SESSION_UPDATES', 0.01)))
+
+def _current_patient_id():
+    """Patient profile id of the logged-in patient, cached in the signed session cookie"""
+    if session.get('patient_id') is None:
+        session['patient_id'] = db.session.execute(
+            db.select(PatientProfile.id).where(PatientProfile.user_id == session['user_id'])
+        ).scalar()
+    return session['patient_id']
+
+def _owns_session(session_id):
+    """Whether the logged-in patient owns the therapy session (one primary-key lookup)"""
+    patient_id = db.session.execute(
+        db.select(TherapySession.patient_id).where(TherapySession.id == session_id)
+    ).scalar()
+    return patient_id is not None and patient_id == _current_patient_id()
+
+def _completed_sessions(patient_id):
+    return TherapySession.query.filter_by(patient_id=patient_id, completed=True)
+
+def _average_accuracy(patient_id):
+    avg_accuracy = db.session.query(db.func.avg(TherapySession.accuracy_score)).filter_by(
+        patient_id=patient_id,
+        completed=True
+    ).scalar() or 0
+    return round(avg_accuracy, 1)
+
+def _session_features(therapy_session):
+    """Summary features of the session's metric samples, loaded in one query"""
+    # NumPy is only needed once a session completes: keep it out of cold starts
+    from session_features import summarize_rows
+
+    samples = db.session.execute(
+        db.select(
+            SessionMetrics.timestamp,
+            SessionMetrics.current_bpm,
+            SessionMetrics.sync_accuracy,
+            SessionMetrics.adjustment_made
+        ).where(
+            SessionMetrics.session_id == therapy_session.id
+        ).order_by(SessionMetrics.timestamp, SessionMetrics.id)
+    ).all()
+    return summarize_rows(samples, therapy_session.target_bpm)
 
 @app.route('/')
 def index():
@@ -72,6 +126,10 @@ def register():
 
             return redirect(url_for('clinician_dashboard'))
 
+        except HashingBusy:
+            db.session.rollback()
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('index.html'), 503, {'Retry-After': '1'}
         except Exception as e:
             db.session.rollback()
             logging.error(f"Registration error: {str(e)}")
@@ -88,9 +146,25 @@ def login():
 
     user = User.query.filter_by(username=username).first()
 
-    if user and user.check_password(password):
+    try:
+        valid = user is not None and user.check_password(password)
+    except HashingBusy:
+        flash('The server is busy. Please try again in a moment.', 'error')
+        return render_template('index.html'), 503, {'Retry-After': '1'}
+
+    if valid:
+        if user.password_needs_rehash():
+            # Hash parameters changed since this password was stored
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashingBusy:
+                db.session.rollback()
+
         session['user_id'] = user.id
         session['user_type'] = user.user_type
+        if user.user_type == 'patient' and user.patient_profile:
+            session['patient_id'] = user.patient_profile.id
         flash(f'Welcome back, {user.first_name}!', 'success')
 
         if user.user_type == 'patient':
@@ -109,6 +183,7 @@ def logout():
     return redirect(url_for('index'))
 
 @app.route('/patient/dashboard')
+@replica_read
 def patient_dashboard():
     """Patient dashboard - main interface for patients"""
     if 'user_id' not in session or session.get('user_type') != 'patient':
@@ -122,30 +197,22 @@ def patient_dashboard():
         flash('Patient profile not found.', 'error')
         return redirect(url_for('index'))
 
-    # Get recent sessions
-    recent_sessions = TherapySession.query.filter_by(
-        patient_id=patient_profile.id
-    ).order_by(TherapySession.start_time.desc()).limit(5).all()
-
-    # Calculate progress metrics
-    total_sessions = TherapySession.query.filter_by(
-        patient_id=patient_profile.id, 
-        completed=True
-    ).count()
-
-    avg_accuracy = db.session.query(db.func.avg(TherapySession.accuracy_score)).filter_by(
-        patient_id=patient_profile.id,
-        completed=True
-    ).scalar() or 0
+    # Loaded only by fragments missing from the fragment cache
+    summary = Deferred(
+        recent_sessions=lambda: TherapySession.query.filter_by(
+            patient_id=patient_profile.id
+        ).order_by(TherapySession.start_time.desc()).limit(5).all(),
+        total_sessions=lambda: _completed_sessions(patient_profile.id).count(),
+        avg_accuracy=lambda: _average_accuracy(patient_profile.id)
+    )
 
     return render_template('patient_dashboard.html', 
                          user=user, 
                          patient_profile=patient_profile,
-                         recent_sessions=recent_sessions,
-                         total_sessions=total_sessions,
-                         avg_accuracy=round(avg_accuracy, 1))
+                         summary=summary)
 
 @app.route('/clinician/dashboard')
+@replica_read
 def clinician_dashboard():
     """Clinician dashboard - patient management interface"""
     if 'user_id' not in session or session.get('user_type') != 'clinician':
@@ -165,11 +232,18 @@ def clinician_dashboard():
     # Get unassigned patients
     unassigned_patients = PatientProfile.query.filter_by(assigned_clinician_id=None).all()
 
+    summary = Deferred(
+        total_sessions=lambda: TherapySession.query.filter(
+            TherapySession.patient_id.in_([p.id for p in patients])
+        ).count()
+    )
+
     return render_template('clinician_dashboard.html',
                          user=user,
                          clinician_profile=clinician_profile,
                          patients=patients,
-                         unassigned_patients=unassigned_patients)
+                         unassigned_patients=unassigned_patients,
+                         summary=summary)
 
 @app.route('/session/start', methods=['POST'])
 def start_session():
@@ -180,8 +254,8 @@ def start_session():
     try:
         from beat_generator import BeatGenerator
 
-        user = User.query.get(session['user_id'])
-        patient_profile = user.patient_profile
+        with span('session.load_profile'):
+            patient_profile = PatientProfile.query.get(_current_patient_id())
 
         session_type = request.json.get('session_type', 'gait_trainer')
         initial_bpm = float(request.json.get('initial_bpm', 60))
@@ -226,7 +300,10 @@ def start_session():
         )
 
         db.session.add(therapy_session)
-        db.session.commit()
+        db.session.flush()
+        ChangeLog.record('session', therapy_session.id, patient_profile.id, patient_profile.assigned_clinician_id)
+        with span('db.commit'):
+            db.session.commit()
 
         return jsonify({
             'session_id': therapy_session.id,
@@ -249,10 +326,9 @@ def session_view(session_id):
         return redirect(url_for('index'))
 
     therapy_session = TherapySession.query.get_or_404(session_id)
-    user = User.query.get(session['user_id'])
 
     # Verify session belongs to current patient
-    if therapy_session.patient.user_id != user.id:
+    if therapy_session.patient_id != _current_patient_id():
         flash('Unauthorized access to session.', 'error')
         return redirect(url_for('patient_dashboard'))
 
@@ -269,14 +345,8 @@ def update_session():
         current_bpm = float(request.json.get('current_bpm'))
         sync_accuracy = float(request.json.get('sync_accuracy', 0))
 
-        # Add session metric
-        metric = SessionMetrics(
-            session_id=session_id,
-            current_bpm=current_bpm,
-            sync_accuracy=sync_accuracy,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(metric)
+        if not _owns_session(session_id):
+            return jsonify({'error': 'Unauthorized'}), 401
 
         # Calculate BPM adjustment based on accuracy
         adjustment_bpm = current_bpm
@@ -285,10 +355,16 @@ def update_session():
         elif sync_accuracy > 90:  # If accuracy is high, speed up slightly
             adjustment_bpm = min(current_bpm + 1, 120)
 
-        if adjustment_bpm != current_bpm:
-            metric.adjustment_made = True
-
-        db.session.commit()
+        # Add session metric (committed together with other patients' updates)
+        metric_writer.insert({
+            'session_id': session_id,
+            'current_bpm': current_bpm,
+            'sync_accuracy': sync_accuracy,
+            'timestamp': datetime.utcnow(),
+            'adjustment_made': adjustment_bpm != current_bpm
+        })
+        update_log.info("Session %s update: bpm=%s accuracy=%s adjusted=%s",
+                        session_id, current_bpm, sync_accuracy, adjustment_bpm)
 
         return jsonify({
             'adjusted_bpm': adjustment_bpm,
@@ -309,14 +385,8 @@ def update_session_legacy(session_id):
         current_bpm = float(request.json.get('current_bpm'))
         sync_accuracy = float(request.json.get('sync_accuracy', 0))
 
-        # Add session metric
-        metric = SessionMetrics(
-            session_id=session_id,
-            current_bpm=current_bpm,
-            sync_accuracy=sync_accuracy,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(metric)
+        if not _owns_session(session_id):
+            return jsonify({'error': 'Unauthorized'}), 401
 
         # Calculate BPM adjustment based on accuracy
         adjustment_bpm = current_bpm
@@ -325,10 +395,16 @@ def update_session_legacy(session_id):
         elif sync_accuracy > 90:  # If accuracy is high, speed up slightly
             adjustment_bpm = min(current_bpm + 1, 120)
 
-        if adjustment_bpm != current_bpm:
-            metric.adjustment_made = True
-
-        db.session.commit()
+        # Add session metric (committed together with other patients' updates)
+        metric_writer.insert({
+            'session_id': session_id,
+            'current_bpm': current_bpm,
+            'sync_accuracy': sync_accuracy,
+            'timestamp': datetime.utcnow(),
+            'adjustment_made': adjustment_bpm != current_bpm
+        })
+        update_log.info("Session %s update: bpm=%s accuracy=%s adjusted=%s",
+                        session_id, current_bpm, sync_accuracy, adjustment_bpm)
 
         return jsonify({
             'adjusted_bpm': adjustment_bpm,
@@ -347,20 +423,32 @@ def complete_session(session_id):
 
     try:
         therapy_session = TherapySession.query.get_or_404(session_id)
-        user = User.query.get(session['user_id'])
 
         # Verify session belongs to current patient
-        if therapy_session.patient.user_id != user.id:
+        if therapy_session.patient_id != _current_patient_id():
             return jsonify({'error': 'Unauthorized'}), 401
 
         # Update session completion data
+        first_completion = not therapy_session.completed
         therapy_session.end_time = datetime.utcnow()
         therapy_session.completed = True
         therapy_session.duration_seconds = int(request.json.get('duration', 0))
         therapy_session.final_bpm = float(request.json.get('final_bpm', therapy_session.initial_bpm))
         therapy_session.accuracy_score = float(request.json.get('accuracy_score', 0))
         therapy_session.notes = request.json.get('notes', '')
-
+        # Server-side summary of the recorded samples, next to the figures the client reported
+        therapy_session.set_features(_session_features(therapy_session))
+
+        patient_profile = therapy_session.patient
+        if first_completion:
+            PatientTrendStats.record(
+                patient_profile.id,
+                therapy_session.session_type,
+                therapy_session.end_time,
+                therapy_session.accuracy_score,
+                therapy_session.final_bpm
+            )
+        ChangeLog.record('session', therapy_session.id, patient_profile.id, patient_profile.assigned_clinician_id)
         db.session.commit()
 
         return jsonify({'success': True})
@@ -418,6 +506,9 @@ def baseline_assessment():
                 # Store cognitive score in notes for now
                 assessment.notes = f"MoCA Score: {measured_value}/30. " + (notes or "")
 
+            db.session.flush()
+            ChangeLog.record('assessment', assessment.id, patient_id, patient_profile.assigned_clinician_id)
+            ChangeLog.record('patient', patient_id, patient_id, patient_profile.assigned_clinician_id)
             db.session.commit()
             flash('Baseline assessment recorded successfully!', 'success')
 
@@ -433,6 +524,7 @@ def baseline_assessment():
     return render_template('baseline_assessment.html', patients=patients, user=user)
 
 @app.route('/progress/<int:patient_id>')
+@replica_read
 def progress_view(patient_id):
     """Progress visualization page"""
     if 'user_id' not in session:
@@ -450,18 +542,41 @@ def progress_view(patient_id):
         flash('Unauthorized access.', 'error')
         return redirect(url_for('clinician_dashboard'))
 
-    # Get session data for charts
-    sessions = TherapySession.query.filter_by(
-        patient_id=patient_id,
-        completed=True
-    ).order_by(TherapySession.start_time.asc()).all()
+    # Completed sessions and the running trend, loaded only when a fragment is not cached
+    summary = Deferred(
+        sessions=lambda: _completed_sessions(patient_id).order_by(TherapySession.start_time.asc()).all(),
+        trend=lambda: db.session.get(PatientTrendStats, (patient_id, trend_stats.ALL))
+    )
 
     return render_template('progress.html', 
                          patient_profile=patient_profile,
-                         sessions=sessions,
+                         summary=summary,
                          user=user)
 
+def _progress_series(patient_id):
+    """Chart data for the last 30 days of completed sessions"""
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    therapy_sessions = _completed_sessions(patient_id).filter(
+        TherapySession.start_time >= thirty_days_ago
+    ).order_by(TherapySession.start_time.asc()).all()
+
+    dates = []
+    accuracy_scores = []
+    bpm_values = []
+
+    for therapy_session in therapy_sessions:
+        dates.append(therapy_session.start_time.strftime('%Y-%m-%d'))
+        accuracy_scores.append(therapy_session.accuracy_score or 0)
+        bpm_values.append(therapy_session.final_bpm or therapy_session.initial_bpm)
+
+    return {
+        'dates': dates,
+        'accuracy_scores': accuracy_scores,
+        'bpm_values': bpm_values
+    }
+
 @app.route('/api/progress/<int:patient_id>')
+@replica_read
 def progress_data(patient_id):
     """API endpoint for progress chart data"""
     from flask import session as flask_session
@@ -478,28 +593,11 @@ def progress_data(patient_id):
     elif user.user_type == 'clinician' and patient_profile.assigned_clinician_id != user.id:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    # Get therapy_sessions for the last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    therapy_sessions = TherapySession.query.filter(
-        TherapySession.patient_id == patient_id,
-        TherapySession.completed == True,
-        TherapySession.start_time >= thirty_days_ago
-    ).order_by(TherapySession.start_time.asc()).all()
-
-    # Prepare chart data
-    dates = []
-    accuracy_scores = []
-    bpm_values = []
-
-    for therapy_session in therapy_sessions:
-        dates.append(therapy_session.start_time.strftime('%Y-%m-%d'))
-        accuracy_scores.append(therapy_session.accuracy_score or 0)
-        bpm_values.append(therapy_session.final_bpm or therapy_session.initial_bpm)
+    # Concurrent chart loads aggregate the 30-day window once per data version
+    series = progress_flights.do((patient_id, patient_profile.data_version), _progress_series, patient_id)
 
     return jsonify({
-        'dates': dates,
-        'accuracy_scores': accuracy_scores,
-        'bpm_values': bpm_values,
+        **series,
         'baseline_cadence': patient_profile.baseline_cadence,
         'target_cadence': patient_profile.target_cadence
     })
@@ -573,9 +671,14 @@ def create_patient():
 
 
         db.session.add(patient_profile)
+        db.session.flush()
+        ChangeLog.record('patient', patient_profile.id, patient_profile.id, session['user_id'])
         db.session.commit()
         flash(f'Patient {first_name} {last_name} created successfully and assigned to you!', 'success')
 
+    except HashingBusy:
+        db.session.rollback()
+        flash('The server is busy. Please try again in a moment.', 'error')
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error creating patient: {str(e)}")
@@ -594,8 +697,22 @@ def assign_patient():
         clinician_id = session['user_id']
 
         patient_profile = PatientProfile.query.get_or_404(patient_id)
+        previous_clinician_id = patient_profile.assigned_clinician_id
         patient_profile.assigned_clinician_id = clinician_id
 
+        # Log under both caseloads so the previous clinician's client drops the patient
+        if previous_clinician_id != clinician_id:
+            ChangeLog.record('patient', patient_id, patient_id, previous_clinician_id)
+            if previous_clinician_id is not None:
+                # The patient's history was logged under the previous caseload only:
+                # log it again so the new clinician's delta feed receives it
+                for entity_type, model in (('session', TherapySession), ('assessment', BaselineAssessment)):
+                    entity_ids = db.session.execute(
+                        db.select(model.id).where(model.patient_id == patient_id)
+                    ).scalars().all()
+                    if entity_ids:
+                        ChangeLog.record_many(entity_type, [(entity_id, patient_id) for entity_id in entity_ids], clinician_id)
+        ChangeLog.record('patient', patient_id, patient_id, clinician_id)
         db.session.commit()
 
         return jsonify({'success': True})
@@ -619,33 +736,21 @@ def patient_details(patient_id):
         flash('Unauthorized access to patient details.', 'error')
         return redirect(url_for('clinician_dashboard'))
 
-    # Get patient's recent sessions
-    recent_sessions = TherapySession.query.filter_by(
-        patient_id=patient_id
-    ).order_by(TherapySession.start_time.desc()).limit(10).all()
-
-    # Get baseline assessments
-    assessments = BaselineAssessment.query.filter_by(
-        patient_id=patient_id
-    ).order_by(BaselineAssessment.created_at.desc()).all()
-
-    # Calculate progress statistics
-    total_sessions = TherapySession.query.filter_by(
-        patient_id=patient_id, 
-        completed=True
-    ).count()
-
-    avg_accuracy = db.session.query(db.func.avg(TherapySession.accuracy_score)).filter_by(
-        patient_id=patient_id,
-        completed=True
-    ).scalar() or 0
+    # Loaded only by fragments missing from the fragment cache
+    summary = Deferred(
+        recent_sessions=lambda: TherapySession.query.filter_by(
+            patient_id=patient_id
+        ).order_by(TherapySession.start_time.desc()).limit(10).all(),
+        assessments=lambda: BaselineAssessment.query.filter_by(
+            patient_id=patient_id
+        ).order_by(BaselineAssessment.created_at.desc()).all(),
+        total_sessions=lambda: _completed_sessions(patient_id).count(),
+        avg_accuracy=lambda: _average_accuracy(patient_id)
+    )
 
     return render_template('patient_details.html',
                          patient_profile=patient_profile,
-                         recent_sessions=recent_sessions,
-                         assessments=assessments,
-                         total_sessions=total_sessions,
-                         avg_accuracy=round(avg_accuracy, 1),
+                         summary=summary,
                          user=user)
 
 @app.route('/patient/<int:patient_id>/credentials')
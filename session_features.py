@@ -0,0 +1,84 @@
+"""Summary features of a therapy session's metric samples.
+
+Computed on the server when a session completes, so reports read them
+from the session row instead of rescanning SessionMetrics, and they do
+not depend on the accuracy, tempo and duration the client reports.
+
+Samples arrive every few seconds and each one stands for the time until
+the next (the last one for the median gap), so means and "time in" figures
+are weighted by time rather than by sample count. That keeps per-minute
+rollups of compacted sessions comparable with raw samples.
+"""
+import numpy as np
+
+# update_session slows the tempo down below this accuracy
+IN_SYNC_ACCURACY = 70
+TARGET_TOLERANCE_BPM = 1.0
+
+FEATURE_COLUMNS = (
+    'sample_count',
+    'active_seconds',
+    'mean_sync_accuracy',
+    'time_in_sync_seconds',
+    'adjustment_count',
+    'tempo_stddev',
+    'time_to_target_seconds',
+)
+
+
+def _value(x):
+    return None if x is None or np.isnan(x) else round(float(x), 2)
+
+def summarize(seconds, bpm, accuracy, target_bpm):
+    """Features of one session's samples (NumPy arrays in time order) except adjustment_count.
+
+    mean_sync_accuracy is time-weighted, time_in_sync_seconds counts time at
+    IN_SYNC_ACCURACY or above, tempo_stddev is the time-weighted standard
+    deviation of the tempo (lower is steadier) and time_to_target_seconds is
+    the time until the tempo first came within TARGET_TOLERANCE_BPM of
+    target_bpm (None if it never did).
+    """
+    n = len(seconds)
+    if n == 0:
+        return {'sample_count': 0, 'active_seconds': None, 'mean_sync_accuracy': None, 'time_in_sync_seconds': None,
+                'tempo_stddev': None, 'time_to_target_seconds': None}
+
+    gaps = np.diff(seconds)
+    hold = np.append(gaps, np.median(gaps) if n > 1 else 0.0)
+    # A lone sample (or identical timestamps) carries no duration: weigh samples equally
+    weights = hold if hold.sum() > 0 else np.ones(n)
+
+    scored = ~np.isnan(accuracy)
+    mean_accuracy = None
+    if scored.any() and weights[scored].sum() > 0:
+        mean_accuracy = np.average(accuracy[scored], weights=weights[scored])
+    time_in_sync = hold[scored & (np.nan_to_num(accuracy) >= IN_SYNC_ACCURACY)].sum()
+
+    mean_bpm = np.average(bpm, weights=weights)
+    tempo_stddev = np.sqrt(np.average((bpm - mean_bpm) ** 2, weights=weights))
+
+    reached = np.flatnonzero(np.abs(bpm - target_bpm) <= TARGET_TOLERANCE_BPM)
+
+    return {
+        'sample_count': n,
+        'active_seconds': _value(seconds[-1] - seconds[0]),
+        'mean_sync_accuracy': _value(mean_accuracy),
+        'time_in_sync_seconds': _value(time_in_sync),
+        'tempo_stddev': _value(tempo_stddev),
+        'time_to_target_seconds': _value(seconds[reached[0]] - seconds[0]) if len(reached) else None
+    }
+
+def summarize_rows(rows, target_bpm):
+    """All features from (timestamp, bpm, sync_accuracy, adjustment_made) sample rows in time order"""
+    if not rows:
+        return {**summarize(np.empty(0), np.empty(0), np.empty(0), target_bpm), 'adjustment_count': 0}
+
+    timestamps, bpm, accuracy, adjusted = zip(*rows)
+    timestamps = np.array(timestamps, dtype='datetime64[us]')
+    seconds = (timestamps - timestamps[0]) / np.timedelta64(1, 's')
+    bpm = np.array(bpm, dtype=np.float64)
+    accuracy = np.array([np.nan if a is None else a for a in accuracy], dtype=np.float64)
+    return {
+        **summarize(seconds, bpm, accuracy, target_bpm),
+        'adjustment_count': int(np.count_nonzero(np.array(adjusted, dtype=bool)))
+    }
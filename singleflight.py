@@ -0,0 +1,91 @@
+"""Single-flight coalescing of identical concurrent computations.
+
+When a clinician refreshes several tabs at once, or a ward of tablets
+starts the same protocol at the same tempo, a worker receives a burst of
+requests that compute exactly the same thing. The first caller for a key
+runs the computation; callers arriving while it is in flight wait for its
+result (or its exception) instead of repeating the work. Nothing is kept
+once the flight lands, so this is not a cache: a later caller computes
+afresh.
+
+Keys must cover everything the result depends on. The patient views key
+on PatientProfile.data_version, so a caller that has seen a newer write
+never joins a flight that started before it.
+
+Results are shared between threads, so computations return plain values
+(dicts, strings), never ORM objects bound to the leader's session. Only
+threaded servers (gunicorn.conf.py runs gthread workers) see concurrent
+callers within a process.
+
+Configured from the environment:
+  SINGLEFLIGHT            'off' runs every call independently (default on)
+  SINGLEFLIGHT_TIMEOUT    seconds a waiting caller gives the leader (default 25, below
+                          gunicorn's 30 s worker timeout so the caller can still answer)
+"""
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from observability.metrics import registry
+
+SINGLEFLIGHT = os.environ.get('SINGLEFLIGHT', 'on').lower() != 'off'
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_TIMEOUT', 25))
+
+flight_calls = registry.counter(
+    'singleflight_calls_total', 'Single-flight calls by group and role (leader, shared, timeout)', ('group', 'role')
+)
+
+
+class SingleFlightTimeout(TimeoutError):
+    """The in-flight computation a caller joined did not finish in time"""
+
+
+class SingleFlight:
+    """Group of keyed computations that concurrent callers share"""
+
+    def __init__(self, name, enabled=SINGLEFLIGHT, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.enabled = enabled
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing one execution among concurrent callers of key"""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+
+        if not leader:
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                flight_calls.inc((self.name, 'timeout'))
+                raise SingleFlightTimeout(f"{self.name} computation for {key!r} still running after {self.timeout}s") from None
+            flight_calls.inc((self.name, 'shared'))
+            return result
+
+        flight_calls.inc((self.name, 'leader'))
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key)
+            future.set_exception(e)
+            raise
+        self._land(key)
+        future.set_result(result)
+        return result
+
+    def _land(self, key):
+        # Callers arriving from here on start a new flight rather than share a finished one
+        with self._lock:
+            del self._flights[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,48 @@
+"""SQLite settings for running several workers against one database file.
+
+install() registers a pool listener that configures every new SQLite
+connection in the process: WAL so readers never block the writer,
+synchronous=NORMAL (durable at checkpoints, one fsync per checkpoint rather
+than per commit), a busy timeout so a writer waits for the lock instead of
+failing with "database is locked", and larger page cache and mmap windows.
+Connections to other databases are left alone.
+
+Configured from the environment:
+  SQLITE_PROFILE          'off' disables the listener (default on)
+  SQLITE_BUSY_TIMEOUT_MS  how long a writer waits for the lock (default 5000)
+  SQLITE_SYNCHRONOUS      synchronous pragma (default NORMAL)
+  SQLITE_MMAP_SIZE        bytes of the file memory-mapped (default 256 MiB)
+  SQLITE_CACHE_SIZE_KB    page cache per connection (default 64 MiB)
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'on').lower() != 'off'
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+    f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+    f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+    f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))}",
+]
+
+_installed = False
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+def install():
+    """Apply the pragmas to every SQLite connection opened from now on (idempotent)"""
+    global _installed
+    if SQLITE_PROFILE and not _installed:
+        event.listen(Pool, 'connect', _configure_connection)
+        _installed = True
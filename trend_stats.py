@@ -0,0 +1,98 @@
+"""Streaming progress statistics per patient and session type.
+
+A PatientTrendStats row (one per patient and session type, plus ALL for
+every session of the patient) holds running moments of each completed
+session's accuracy and final BPM against the day it was completed:
+Welford mean and variance, the co-moment that gives the least-squares
+slope, and a fast and a slow exponentially weighted average. Completing
+a session folds it in with observe() in constant time, so trend views
+read one row instead of the patient's whole history.
+
+Flags compare the fast average with the slow one once a row has
+MIN_SESSIONS sessions: recent sessions more than the regression drop
+below the longer-run level flag a regression, a gap within the plateau
+band flags a plateau. A steady gain of g per session holds the gap near
+6.7 g, so the accuracy band of 1 point means less than 0.15 points of
+improvement per session.
+
+A session is folded in once, when it is first completed. `flask
+trend-backfill` rebuilds the rows from the sessions as stored.
+"""
+import math
+
+ALL = 'all'
+SERIES = ('accuracy', 'bpm')
+MIN_SESSIONS = 5
+FAST_ALPHA = 0.3
+SLOW_ALPHA = 0.1
+# (plateau band, regression drop) in accuracy points and BPM
+THRESHOLDS = {'accuracy': (1.0, 5.0), 'bpm': (0.5, 3.0)}
+
+
+def initial_state():
+    """Column values of a row that has seen no sessions"""
+    state = {'count': 0, 'days_mean': 0.0, 'days_m2': 0.0}
+    for name in SERIES:
+        for moment in ('mean', 'm2', 'cov', 'fast', 'slow'):
+            state[f'{name}_{moment}'] = 0.0
+    return state
+
+def observe(stats, completed_at, accuracy, bpm):
+    """Fold one completed session into a row of running statistics"""
+    if stats.count == 0:
+        stats.first_session_at = completed_at
+    n = stats.count + 1
+    x = (completed_at - stats.first_session_at).total_seconds() / 86400
+
+    dx = x - stats.days_mean
+    stats.days_mean += dx / n
+    stats.days_m2 += dx * (x - stats.days_mean)
+
+    for name, y in (('accuracy', accuracy), ('bpm', bpm)):
+        mean = getattr(stats, f'{name}_mean')
+        dy = y - mean
+        mean += dy / n
+        setattr(stats, f'{name}_mean', mean)
+        setattr(stats, f'{name}_m2', getattr(stats, f'{name}_m2') + dy * (y - mean))
+        # dx is taken before the x mean moved, (y - mean) after: the Welford co-moment update
+        setattr(stats, f'{name}_cov', getattr(stats, f'{name}_cov') + dx * (y - mean))
+        for average, alpha in (('fast', FAST_ALPHA), ('slow', SLOW_ALPHA)):
+            previous = getattr(stats, f'{name}_{average}')
+            setattr(stats, f'{name}_{average}', y if n == 1 else previous + alpha * (y - previous))
+
+    stats.count = n
+    stats.last_session_at = completed_at
+
+def _series_summary(stats, name):
+    n = stats.count
+    mean = getattr(stats, f'{name}_mean')
+    m2 = getattr(stats, f'{name}_m2')
+    fast = getattr(stats, f'{name}_fast')
+    slow = getattr(stats, f'{name}_slow')
+    band, drop = THRESHOLDS[name]
+
+    slope = None
+    if n >= 2 and stats.days_m2 > 1e-9:
+        slope = getattr(stats, f'{name}_cov') / stats.days_m2 * 7
+
+    momentum = fast - slow
+    settled = n >= MIN_SESSIONS
+    return {
+        'mean': round(mean, 2),
+        'stddev': round(math.sqrt(m2 / (n - 1)), 2) if n >= 2 else None,
+        'slope_per_week': round(slope, 3) if slope is not None else None,
+        'recent': round(fast, 2),
+        'momentum': round(momentum, 2),
+        'plateau': settled and abs(momentum) < band,
+        'regression': settled and momentum < -drop
+    }
+
+def summary(stats):
+    """JSON-ready trend of one row"""
+    return {
+        'session_type': stats.session_type,
+        'sessions': stats.count,
+        'first_session_at': stats.first_session_at.isoformat() if stats.first_session_at else None,
+        'last_session_at': stats.last_session_at.isoformat() if stats.last_session_at else None,
+        **{name: _series_summary(stats, name) if stats.count else None for name in SERIES}
+    }